@@ -4,301 +4,6978 @@ import csv
 import argparse
 import sys
 import os
+import concurrent.futures
+import asyncio
+import http
+import resource
+import time
+import contextlib
+import array
+import collections
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import mmap
+import operator
+import re
+import struct
+import bz2
+import gzip
+import lzma
+import zlib
+import queue
+import threading
+import glob
+import cProfile
+import io
+import pstats
+import tracemalloc
+import tempfile
+import copy
+import random
+import shutil
 
 def main():
 
+    # OLAP.py serve ... runs the query server instead of a single query
+
+    if(len(sys.argv) > 1 and sys.argv[1] == 'serve'):
+
+        serve(sys.argv[2:])
+        return
+
+    args = command_line_parser().parse_args()
+    check_command_line(args)
+    stats = QueryStats() if args.stats != None else None
+
+    try:
+
+        with (profiled(args.profile, args.profile_output) if args.profile else contextlib.nullcontext()):
+
+            run_command_line(args, stats)
+
+    finally:
+
+        if(stats != None and args.stats == '-'):
+
+            print(stats.report(), file=sys.stderr)
+
+        elif(stats != None):
+
+            with open(args.stats, 'w') as stats_file:
+
+                json.dump(stats.to_json(), stats_file, indent=1)
+
+class AggregateAction(argparse.Action):
+
+    """
+    Appends the aggregate of an aggregate argument to args.aggregates, e.g. ('max', 'math score') for
+    --max 'math score' or 'count' for --count, so the aggregates keep the order they were given in, which is the
+    order of the output columns. Their values are checked by Dataset.query().
+    """
+
+    def __call__(self, parser, namespace, values, option_string=None):
+
+        # the default list is shared by every parse, so it is copied instead of appended to
+        aggregates = list(getattr(namespace, self.dest))
+        aggregates.append(self.const if self.nargs == 0 else (self.const,) + tuple(values))
+        setattr(namespace, self.dest, aggregates)
+
+def command_line_parser():
+
+    """
+    Returns the parser of the arguments of a command line query
+    """
+
     parser = argparse.ArgumentParser()
+    parser.set_defaults(aggregates=[])
     parser.add_argument("--input", help="Takes one argument which is the csv file you want to read data from.")
-    parser.add_argument("--top", nargs=2, help="Computes the top k most common values of the specified categorical field")
-    parser.add_argument("--groupby", nargs=1, help="Groups the output by the specified categorical field")
-    parser.add_argument("--count", action="store_true", help="Counts the number of records")
-    parser.add_argument("--min", nargs='*', action='append', help="Computes the minimum value of the specified numeric field")
-    parser.add_argument("--max", nargs='*', action='append', help="Computes the maximum value of the specified numeric field")
-    parser.add_argument("--mean", nargs='*', action='append', help="Computes the mean value of the specified numeric field")
-    parser.add_argument("--sum", nargs="*", action='append', help="Computes the sum value of the specified numeric field")
-    args = parser.parse_args()
+    parser.add_argument("--top", nargs=2, action=AggregateAction, const='top', dest='aggregates', metavar=("K", "FIELD"), help="Computes the top k most common values of the specified categorical field")
+    parser.add_argument("--top-approx", nargs='?', type=int, const=TOP_APPROX_CAPACITY, metavar="CAPACITY", help="Computes --top with a heavy hitters sketch that keeps at most CAPACITY values (default {}), for fields with too many distinct values to count exactly. Counts may be overestimated and are printed with their lower bound".format(TOP_APPROX_CAPACITY))
+    parser.add_argument("--groupby", nargs='+', help="Groups the output by the specified categorical fields, one group for every combination of their values")
+    parser.add_argument("--no-cap", action="store_true", help="Outputs every group of --groupby, sorted by value, instead of the first 20 and a row _OTHER of the remaining records")
+    parser.add_argument("--order-by", nargs='+', metavar=("AGGREGATE", "asc|desc"), help="Orders the groups of --groupby by the specified aggregate column of the output, e.g. --order-by 'mean_math score' desc, instead of by value. The default direction is asc")
+    parser.add_argument("--limit", type=int, help="Outputs this many groups of --groupby before the row _OTHER of the remaining records, instead of 20")
+    parser.add_argument("--memory-limit", type=memory_size, metavar="SIZE", help="Spills the groups of --groupby --no-cap to temporary files whenever they take about SIZE bytes of memory, e.g. 512M, and merges them while the output is written")
+    parser.add_argument("--count", nargs=0, action=AggregateAction, const='count', dest='aggregates', help="Counts the number of records")
+    parser.add_argument("--min", nargs='*', action=AggregateAction, const='min', dest='aggregates', metavar="FIELD", help="Computes the minimum value of the specified numeric field")
+    parser.add_argument("--max", nargs='*', action=AggregateAction, const='max', dest='aggregates', metavar="FIELD", help="Computes the maximum value of the specified numeric field")
+    parser.add_argument("--mean", nargs='*', action=AggregateAction, const='mean', dest='aggregates', metavar="FIELD", help="Computes the mean value of the specified numeric field")
+    parser.add_argument("--sum", nargs='*', action=AggregateAction, const='sum', dest='aggregates', metavar="FIELD", help="Computes the sum value of the specified numeric field")
+    parser.add_argument("--count-distinct", nargs='*', action=AggregateAction, const='count_distinct', dest='aggregates', metavar="FIELD", help="Counts the distinct values of the specified field")
+    parser.add_argument("--median", nargs='*', action=AggregateAction, const='median', dest='aggregates', metavar="FIELD", help="Computes the median value of the specified numeric field")
+    parser.add_argument("--quantile", nargs=2, action=AggregateAction, const='quantile', dest='aggregates', metavar=("P", "FIELD"), help="Computes the P quantile (0 <= P <= 1) of the specified numeric field, e.g. --quantile 0.99 latency")
+    parser.add_argument("--quantile-sketch", type=int, metavar="COMPRESSION", help="Estimates --median and --quantile with a t-digest of about COMPRESSION centroids per group (at least {}, 100 is a good start) instead of keeping every value".format(MIN_QUANTILE_COMPRESSION))
+    parser.add_argument("--distinct-precision", type=int, metavar="P", help="Estimates --count-distinct with a HyperLogLog sketch of 2^P registers (P from {} to {}) instead of keeping every distinct value".format(MIN_DISTINCT_PRECISION, MAX_DISTINCT_PRECISION))
+    parser.add_argument("--where", help="Only reads the records that match the specified filter, e.g. \"lunch = standard AND 'math score' >= 90\". Fields are compared with =, !=, IN (...), <, <=, > and >=, combined with AND, OR, NOT and parentheses")
+    parser.add_argument("--queries", help="Answers every query in the specified JSON lines file with one read of the input file")
+    parser.add_argument("--cache", action="store_true", help="Builds a columnar cache of the input file next to it if there is no up to date cache, so later queries can skip reading the csv file")
+    parser.add_argument("--no-cache", action="store_true", help="Reads the csv file even if an up to date columnar cache exists")
+    parser.add_argument("--index", nargs='+', default=[], metavar="FIELD", help="Adds a bitmap index of the specified categorical fields to the columnar cache, so --where filters on them skip the rows that don't match")
+    parser.add_argument("--state", metavar="FILE", help="Saves the running state of the query to the specified file, so the next run of the same query only reads the records appended to the input file since")
+    parser.add_argument("--stats", nargs='?', const='-', metavar="FILE", help="Reports the wall and CPU time of every phase of the query, the rows and bytes read, the number of groups and non-numeric values and the peak memory to stderr, or as JSON to the specified file")
+    parser.add_argument("--profile", choices=['cpu', 'memory'], help="Runs the query under cProfile (cpu) or tracemalloc (memory) and prints the functions or lines that take the most time or memory to stderr")
+    parser.add_argument("--profile-output", metavar="FILE", help="Writes the --profile report to the specified file instead, for cpu as a profile that pstats can read")
+    parser.add_argument("--progress-every", metavar="N", help="Prints running estimates of the result to stderr every N rows, or every N seconds with an s suffix such as 10s, while the csv file is read. For a plain file the count and sums are estimated for the whole file, and means and sums get 95%% confidence intervals")
+    parser.add_argument("--sample", type=float, metavar="FRACTION", help="Estimates the result from a random sample of about FRACTION (0 < FRACTION <= 1) of the records instead of reading all of them. Blocks of a plain file are picked at random and read with seeks. The count, sums and top counts are scaled to the whole file, and means and sums get 95%% confidence intervals")
+    parser.add_argument("--sample-rows", type=int, metavar="N", help="Estimates the result like --sample from N records drawn at random from every record of the input")
+    parser.add_argument("--keep-sample", action="store_true", help="Keeps the sample of --sample or --sample-rows next to the input file, so later queries with the same sample argument read it instead of the input file while the input file doesn't change")
+    parser.add_argument("--workers", type=int, help="Splits the input file into chunks and reads them in the specified number of processes")
+    parser.add_argument("--build-cube", nargs='+', metavar="DIM", help="Precomputes every aggregate of the --measures fields for every combination of the specified categorical fields and stores them next to the input file")
+    parser.add_argument("--measures", nargs='+', default=[], metavar="FIELD", help="The numeric fields aggregated by --build-cube")
+    return parser
+
+def check_command_line(args):
 
-    # Initial command line input error checks
+    """
+    Prints an error and exits with code 6 if the arguments that only the command line has don't fit together.
+    The query itself is checked by Dataset.open() and Dataset.query().
+    """
 
-    if(args.min and (len(args.min) < 1 or [] in args.min)):
+    query_arguments = (args.aggregates or args.groupby or args.where or args.no_cap or args.memory_limit or args.order_by or args.limit or args.progress_every
+                       or args.sample != None or args.sample_rows != None)
 
-        print("Error: You must provide the aggregate min with one argument everytime it is called", end="", file=sys.stderr)
-        exit(6)
-    
-    if(args.max and (len(args.max) < 1 or [] in args.max)):
+    errors = [(args.input == None, "You must specify a file using the command --input <filename>"),
+              (args.measures and not args.build_cube, "--measures can only be used with --build-cube"),
+              (args.profile_output and not args.profile, "--profile-output can only be used with --profile"),
+              (args.index and not args.cache, "--index can only be used with --cache"),
+              (args.queries and query_arguments, "--queries can't be combined with aggregate, top, group-by, order-by, limit, no-cap, memory-limit, progress-every or sample arguments")]
 
-        print("Error: You must provide the aggregate max with one argument everytime it is called", end="", file=sys.stderr)
-        exit(6)
-    
-    if(args.mean and (len(args.mean) < 1 or [] in args.mean)):
+    for (failed, message) in errors:
+
+        if(failed):
+
+            print("Error: " + message, end="", file=sys.stderr)
+            exit(6)
+
+def command_line_query(args):
+
+    """
+    Returns the keyword arguments of Dataset.query() for the query of the command line. --distinct-precision and
+    --quantile-sketch are added to the aggregates they apply to.
+    """
+
+    aggs = []
+
+    for aggregate in args.aggregates:
+
+        if(aggregate != 'count' and aggregate[0] in ('count_distinct', 'median') and len(aggregate) == 2):
+
+            aggregate += (args.distinct_precision if aggregate[0] == 'count_distinct' else args.quantile_sketch,)
+
+        elif(aggregate != 'count' and aggregate[0] == 'quantile'):
+
+            aggregate += (args.quantile_sketch,)
+
+        aggs.append(aggregate)
+
+    return {'aggs': aggs, 'groupby': args.groupby, 'top_approx': args.top_approx, 'where': args.where, 'no_cap': args.no_cap, 'memory_limit': args.memory_limit,
+            'order_by': args.order_by, 'limit': args.limit, 'progress_every': args.progress_every, 'sample': args.sample, 'sample_rows': args.sample_rows,
+            'keep_sample': args.keep_sample}
+
+def run_command_line(args, stats):
+
+    """
+    Answers the query or queries of the command line and prints the results.
+    Phases are timed in stats if it is not None.
+    """
+
+    # the command line is a thin wrapper around Dataset: the file is opened without loading its columns,
+    # since it is only queried once, and errors are printed to stderr
+
+    try:
+
+        with (stats.phase('open') if stats != None else contextlib.nullcontext()):
+
+            dataset = Dataset.open(args.input, load=False, cache=args.cache, use_cache=not args.no_cache, workers=args.workers, index=args.index, state_file=args.state)
+
+        dataset.stats = stats
+
+        if(args.build_cube):
+
+            dataset.build_cube(args.build_cube, args.measures)
+
+            if(not args.queries and not args.aggregates):
+
+                print("Built the cube of {} over {} rows".format(args.input, dataset.cube['rows']), file=sys.stderr)
+                return
+
+        if(args.queries):
+
+            queries = read_queries(args)
+            results = dataset.query_many(queries)
+
+            with dataset.phase('print'):
+
+                exit_code = print_queries(results, queries)
+
+            exit(exit_code)
+
+        result = dataset.query(**command_line_query(args))
+
+    except OLAPError as error:
+
+        print_error(error)
+        exit(error.exit_code)
+
+    with dataset.phase('print'):
+
+        print_result(result)
+
+def memory_size(text):
+
+    """
+    Takes in a number of bytes with an optional K, M or G suffix, e.g. 512M, and returns it as an integer
+    """
+
+    multipliers = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    suffix = text[-1:].upper()
+
+    try:
+
+        if(suffix in multipliers):
+
+            size = int(float(text[:-1]) * multipliers[suffix])
+
+        else:
+
+            size = int(text)
+
+    except ValueError:
+
+        raise argparse.ArgumentTypeError("invalid size: '{}'".format(text))
+
+    if(size < 1):
+
+        raise argparse.ArgumentTypeError("the size must be greater than 0")
+
+    return size
+
+class OLAPError(Exception):
+
+    """
+    Raised when the input file can't be read or a query can't be answered.
+
+    message is the error printed by the command line and exit_code the code it exits with.
+    warnings holds the warnings found by the query before it failed.
+    """
+
+    def __init__(self, message, exit_code):
+
+        Exception.__init__(self, message)
+        self.message = message
+        self.exit_code = exit_code
+        self.warnings = []
+
+class QueryResult:
+
+    """
+    The result of one query.
+
+    header holds the names of the output columns and rows holds the rows of the result as lists of values, or an
+    iterator over them that can only be read once for a query with a memory limit.
+    header is None if more than 100 non-numeric values were found across all groups, in which case the rows of
+    the groups are left out.
+    warnings holds the messages about non-numeric values and capped output found while computing the result.
+    """
+
+    def __init__(self, header, rows, warnings):
+
+        self.header = header
+        self.rows = rows
+        self.warnings = warnings
+
+    def to_csv(self):
+
+        """
+        Returns the result in .csv format, the way the command line prints it
+        """
+
+        output = io.StringIO()
+        self.write_csv(output)
+
+        return output.getvalue()
+
+    def write_csv(self, output):
+
+        """
+        Writes the result in .csv format to the text file output one row at a time
+        """
+
+        if(self.header != None):
+
+            output.write(",".join(self.header) + "\n")
+
+        for row in self.rows:
+
+            output.write(",".join([str(value) for value in row]) + "\n")
+
+class QueryOptions:
+
+    """
+    The options of one query, made by Dataset.make_query(), and the warnings found while it is answered. The
+    functions that answer a query take it as args and read the options as attributes:
+
+    input:   the name of the input file, used in messages
+    top:     [k, field] of the top aggregate, or None
+    groupby: the list of group-by fields, or None
+    warnings: the messages about non-numeric values and capped output found while computing the result
+
+    and the arguments of Dataset.query() of the same name, checked and normalized by check_query().
+    """
+
+    def __init__(self, input, top=None, groupby=None, top_approx=None, where=None, no_cap=False, memory_limit=None, order_by=None, limit=None,
+                 progress_every=None, sample=None, sample_rows=None, keep_sample=False):
+
+        self.input = input
+        self.top = top
+        self.groupby = groupby
+        self.top_approx = top_approx
+        self.where = where
+        self.no_cap = no_cap
+        self.memory_limit = memory_limit
+        self.order_by = order_by
+        self.limit = limit
+        self.progress_every = progress_every
+        self.sample = sample
+        self.sample_rows = sample_rows
+        self.keep_sample = keep_sample
+        self.warnings = []
+
+    def copy(self):
+
+        """
+        Returns a copy of the options with an empty list of warnings of its own
+        """
+
+        options = copy.copy(self)
+        options.warnings = []
+
+        return options
+
+class Dataset:
+
+    """
+    A csv file opened for queries.
+
+    Example: dataset = Dataset.open("StudentsPerformance.csv")
+             result = dataset.query(groupby="lunch", aggs=["count", ("mean", "math score")])
+             result.rows
+             [['free/reduced', 355, 58.92112676056338], ['standard', 645, 70.03410852713178]]
+
+    The columns of the file are read once when it is opened, so every query only folds the columns it uses
+    instead of reading the csv file again.
+    """
+
+    def __init__(self, file_name, header_line, columns=None, use_cache=True, workers=None, cube=None, state_file=None):
+
+        self.file_name = file_name
+        self.header_line = header_line
+        self.columns = columns
+        self.use_cache = use_cache
+        self.workers = workers
+        self.cube = cube
+        self.state_file = state_file
+        self.stats = None
+        self.input_file = None
+        self.partitions = None
+        self.partition_fields = []
+
+    @classmethod
+    def open(cls, file_name, load=True, cache=False, use_cache=True, workers=None, index=(), state_file=None):
+
+        """
+        Opens file_name for queries.
+
+        load:      reads every column into memory, or memory maps an up to date columnar cache. With load=False
+                   every query reads the file again, from an up to date columnar cache if there is one
+        cache:     builds the columnar cache of the file if there is no up to date cache
+        use_cache: set to False to ignore the columnar cache and the data cube
+        workers:   the number of processes that read the csv file
+        index:     the fields that get a bitmap index, so filters on them find their rows without reading the
+                   column. The cache is built again if it lacks one of them
+        state_file: saves the running state of every query to this file, so the next query only reads the lines
+                   appended to the file since, see incremental_scan()
+
+        file_name may be a csv file compressed with gzip, bzip2 or xz, or "-" for standard input. Standard input is
+        only read by the first query and has no cache or cube. The lines of compressed files and standard input
+        can't be found by their byte offset, so they can't be split across workers or used with a state file.
+
+        file_name may also be a directory or a glob pattern such as "data/2026-10-*.csv", whose files are read as one
+        table, see scan_partitions(). Directories named field=value in their paths add field to the table.
+        The files are read by workers processes, or one per processor by default, and have no cache or cube.
+
+        Raises an OLAPError if the file does not exist, is not a csv file, is empty, a field in index does not exist
+        or one of the options can't be used with the kind of input
+        """
+
+        if(workers != None and (not isinstance(workers, int) or workers < 1)):
+
+            raise OLAPError("Error: The argument for workers must be an integer greater than 0.", 6)
+
+        if(file_name == STDIN_NAME):
+
+            if(cache or index or state_file or (workers and workers > 1)):
+
+                raise OLAPError("Error: Standard input can't be used with --cache, --index, --state or --workers", 6)
+
+            try:
+
+                input_file = open_input(file_name)
+
+            except INPUT_ERRORS as error:
+
+                raise input_error(file_name, error)
+
+            dataset = cls(file_name, read_header(file_name, input_file), None, False)
+            dataset.input_file = input_file
+
+            return dataset
+
+        files = input_files(file_name)
+
+        if(files != None):
+
+            if(cache or index or state_file):
+
+                raise OLAPError("Error: Several input files can't be used with --cache, --index or --state", 6)
+
+            (fields, values) = partition_values(files)
+            header_line = read_header(files[0])
+
+            for field in fields:
+
+                if(field in header_line):
+
+                    raise OLAPError("Error: {}: the partition field \'{}\' is also a field of the files".format(file_name, field), 6)
+
+            dataset = cls(file_name, header_line + fields, None, False, workers or os.cpu_count())
+            dataset.partitions = list(zip(files, values))
+            dataset.partition_fields = fields
+
+            return dataset
+
+        header_line = read_header(file_name)
+
+        if(input_compression(file_name) != None and (state_file or (workers and workers > 1))):
+
+            raise OLAPError("Error: Compressed files can't be used with --state or --workers", 6)
+
+        index = [field.lower() for field in index]
+
+        for field in index:
+
+            if(field not in header_line):
+
+                raise OLAPError("Error: {}:no field with name \'{}\' found".format(file_name, field), 8)
+
+        # building the cache reads the whole file, which may turn out to be corrupt
+
+        try:
+
+            (columns, cube) = cls.open_sidecars(file_name, header_line, load, cache, use_cache, index)
+
+        except INPUT_ERRORS as error:
+
+            raise input_error(file_name, error)
+
+        return cls(file_name, header_line, columns, use_cache, workers, cube, state_file)
+
+    @staticmethod
+    def open_sidecars(file_name, header_line, load, cache, use_cache, index):
+
+        """
+        Returns the columns and the cube of a csv file for open(): the columnar cache, built first if cache is True,
+        or the columns read into memory if load is True, and the cube, either of which may be None
+        """
+
+        columns = None
+        cube = None
+
+        if(use_cache):
+
+            cube = open_cube(file_name, header_line)
+            columns = open_cache(file_name, header_line)
+
+            if(columns != None and cache):
+
+                # columns with too many values for a bitmap index are left without one
+                indexed = [field for field in header_line if columns.columns[field].kind == 'categorical' and columns.columns[field].index != None]
+                missing = [field for field in index if columns.columns[field].kind == 'categorical' and columns.columns[field].index == None and len(columns.columns[field].dictionary) <= INDEX_LIMIT]
+
+                if(missing):
+
+                    columns = build_cache(file_name, indexed + missing)
+
+            if(columns == None and cache):
+
+                columns = build_cache(file_name, index)
+
+        if(columns == None and load):
+
+            columns = load_columns(file_name, index)
+
+        return (columns, cube)
+
+    def build_cube(self, dims, measures):
+
+        """
+        Precomputes the count and the max, min, mean and sum of every measure for every group of every subset of
+        dims and writes them next to the file, so later queries on those fields are answered without reading it.
+
+        Raises an OLAPError if a field does not exist, there are too many dims or the cube could not be written
+        """
+
+        dims = [dim.lower() for dim in dims]
+        measures = [measure.lower() for measure in measures]
+
+        for field in dims + measures:
+
+            if(field not in self.header_line):
+
+                raise OLAPError("Error: {}:no field with name \'{}\' found".format(self.file_name, field), 8)
+
+        if(self.file_name == STDIN_NAME or self.partitions != None):
+
+            raise OLAPError("Error: Standard input and several input files can't be used with --build-cube", 6)
+
+        if(len(dims) > MAX_CUBE_DIMS or len(set(dims)) < len(dims) or len(set(measures)) < len(measures)):
+
+            raise OLAPError("Error: A cube takes at most {} different dims and different measures".format(MAX_CUBE_DIMS), 6)
+
+        try:
+
+            cube = build_cube(self.file_name, self.header_line, dims, measures)
+
+        except INPUT_ERRORS as error:
+
+            raise input_error(self.file_name, error)
+
+        if(cube == None):
+
+            raise OLAPError("Error: The cube of {} could not be written".format(self.file_name), 6)
+
+        self.cube = cube
+
+    def make_query(self, aggs=(), groupby=None, top=None, top_approx=None, where=None, no_cap=False, memory_limit=None, order_by=None, limit=None, progress_every=None, sample=None, sample_rows=None, keep_sample=False):
+
+        """
+        Returns the command_order and args of a query, see query()
+        """
+
+        aggregate_names = ['max', 'min', 'mean', 'sum']
+        command_order = []
+        args = QueryOptions(self.file_name, None, None, top_approx, where, no_cap, memory_limit, order_by, limit, progress_every, sample, sample_rows, keep_sample)
+
+        # the values of the other arguments are checked by check_query(), these are used before it
+
+        if(where != None and not isinstance(where, str)):
+
+            raise OLAPError("Error: {}:{} is not a valid filter".format(self.file_name, where), 6)
+
+        if(order_by != None and not isinstance(order_by, (str, list, tuple))):
+
+            raise OLAPError("Error: {}:{} is not a valid order-by argument".format(self.file_name, order_by), 6)
+
+        if(not isinstance(no_cap, bool) or not isinstance(keep_sample, bool)):
+
+            raise OLAPError("Error: {}: no-cap and keep-sample must be True or False".format(self.file_name), 6)
+
+        try:
+
+            if(isinstance(aggs, str)):
+
+                raise TypeError
+
+            aggs = list(aggs)
+
+            if(top != None):
+
+                if(isinstance(top, str) or len(top) != 2):
+
+                    raise TypeError
+
+                aggs.append(('top',) + tuple(top))
+
+        except TypeError:
+
+            raise OLAPError("Error: {}:{} is not a valid list of aggregates and top".format(self.file_name, (aggs, top)), 6)
+
+        for aggregate in aggs:
+
+            try:
+
+                if(aggregate == 'count'):
+
+                    command_order.append('count')
+
+                elif(len(aggregate) == 2 and aggregate[0] in aggregate_names):
+
+                    command_order.append((aggregate[0], aggregate[1].lower()))
+
+                elif(len(aggregate) in (2, 3) and aggregate[0] == 'count_distinct'):
+
+                    precision = aggregate[2] if len(aggregate) == 3 else None
+
+                    if(precision != None and (not isinstance(precision, int) or precision < MIN_DISTINCT_PRECISION or precision > MAX_DISTINCT_PRECISION)):
+
+                        raise OLAPError("Error: {}: The precision of count-distinct must be an integer from {} to {}".format(self.file_name, MIN_DISTINCT_PRECISION, MAX_DISTINCT_PRECISION), 6)
+
+                    command_order.append(('count_distinct', aggregate[1].lower(), precision))
+
+                elif(len(aggregate) in (2, 3) and aggregate[0] == 'median'):
+
+                    command_order.append(('median', aggregate[1].lower(), 0.5, self.quantile_sketch(aggregate[2:])))
+
+                elif(len(aggregate) in (3, 4) and aggregate[0] == 'quantile'):
+
+                    try:
+
+                        p = float(aggregate[1])
+
+                    except ValueError:
+
+                        p = None
+
+                    if(p == None or not 0 <= p <= 1):
+
+                        raise OLAPError("Error: {}: The first argument for quantile must be a number from 0 to 1".format(self.file_name), 6)
+
+                    command_order.append(('quantile', aggregate[2].lower(), p, self.quantile_sketch(aggregate[3:])))
+
+                elif(len(aggregate) == 3 and aggregate[0] == 'top'):
+
+                    args.top = [str(aggregate[1]), aggregate[2].lower()]
+                    command_order.append(('top', aggregate[2].lower()))
+
+                elif(isinstance(aggregate, (list, tuple)) and len(aggregate) > 0 and aggregate[0] in aggregate_names + ['count_distinct', 'median']):
+
+                    raise OLAPError("Error: You must provide the aggregate {} with one argument everytime it is called".format(aggregate[0].replace('_', '-')), 6)
+
+                else:
+
+                    raise TypeError
+
+            except (TypeError, AttributeError):
+
+                raise OLAPError("Error: {}:{} is not a valid aggregate".format(self.file_name, aggregate), 6)
+
+        if(groupby != None):
+
+            try:
+
+                if(isinstance(groupby, str)):
+
+                    groupby = [groupby]
+
+                args.groupby = [field.lower() for field in groupby]
+
+                if(not args.groupby):
+
+                    raise TypeError
+
+            except (TypeError, AttributeError):
+
+                raise OLAPError("Error: {}:{} is not a valid group-by field".format(self.file_name, groupby), 6)
+
+        return (command_order, args)
+
+    def quantile_sketch(self, options):
+
+        """
+        Returns the compression of the t-digest of a median or quantile aggregate, or None to keep every value.
+        options holds the compression if it was given.
+        """
+
+        compression = options[0] if options else None
+
+        if(compression != None and (not isinstance(compression, int) or compression < MIN_QUANTILE_COMPRESSION)):
+
+            raise OLAPError("Error: {}: The compression of median and quantile must be an integer of at least {}".format(self.file_name, MIN_QUANTILE_COMPRESSION), 6)
+
+        return compression
+
+    def query(self, aggs=(), groupby=None, top=None, top_approx=None, where=None, no_cap=False, memory_limit=None, order_by=None, limit=None, progress_every=None, sample=None, sample_rows=None, keep_sample=False):
+
+        """
+        Answers one query and returns its QueryResult.
+
+        aggs:    the aggregates in the order of the output columns. Each is 'count', (name, field) where name is
+                 one of 'max', 'min', 'mean' or 'sum', ('count_distinct', field), ('count_distinct', field, precision)
+                 to estimate it with a HyperLogLog sketch of 2 ** precision registers, ('median', field),
+                 ('quantile', p, field), either followed by a compression to estimate it with a t-digest,
+                 or ('top', k, field)
+        groupby: the field to group by, or a list of fields to group by every combination of their values
+        top:     (k, field), the same as adding ('top', k, field) at the end of aggs
+        top_approx: computes top with a heavy hitters sketch that keeps at most top_approx values instead of
+                 counting every value, see SpaceSaving. Can't be combined with groupby
+        where:   a filter such as "lunch = standard AND 'math score' >= 90", see compile_where(). Only the records
+                 that match it are read
+        no_cap:  returns every group instead of the first 20 and a row of the remaining records
+        memory_limit: spills the groups to temporary files whenever they take about this many bytes of memory, see
+                 spill_scan(). Needs groupby and no_cap, can't be combined with top or exact median, quantile and
+                 count_distinct, and is read from the csv file by one process. The rows of the result are then an
+                 iterator that can only be read once
+        order_by: the name of an aggregate column of the result, such as 'count' or 'mean_math score', to order the
+                 groups by, or (name, 'asc') or (name, 'desc'). Needs groupby
+        limit:   the number of groups returned before the row of the remaining records, 20 by default
+        progress_every: prints running estimates of the result to stderr every progress_every rows, or every
+                 N seconds if it is a string such as "10s", while the csv file is read, see ProgressReport
+        sample:  estimates the result from a random sample of about this share (0 < sample <= 1) of the records of
+                 the csv file, see Sample. The count, sums and top counts are scaled to the whole file and every
+                 count, mean, sum and top is followed by a column such as 'mean_math score_ci95' holding the half
+                 width of the 95% confidence interval of its estimate, see estimated_result()
+        sample_rows: estimates the result like sample from this many records drawn at random
+        keep_sample: keeps the sample next to the csv file, so later queries with the same sample or sample_rows
+                 read it instead of the file while the file doesn't change, see write_sample()
+
+        Raises an OLAPError if the query is not valid or an aggregate found more than 100 non-numeric values
+        """
+
+        result = self.run([self.make_query(aggs, groupby, top, top_approx, where, no_cap, memory_limit, order_by, limit, progress_every, sample, sample_rows,
+                                          keep_sample)])[0]
+
+        if(isinstance(result, OLAPError)):
+
+            raise result
+
+        return result
+
+    def query_many(self, queries):
+
+        """
+        Answers every query in queries with one read of the input. Each query is a dictionary holding the
+        keyword arguments of query().
+
+        Returns: a list holding the QueryResult of every query, or the OLAPError of a query that was not valid or
+                 failed, which does not stop the other queries
+        """
+
+        made_queries = []
+        errors = {}
+
+        for i in range(len(queries)):
+
+            query = queries[i]
+
+            try:
+
+                made_queries.append(self.make_query(query.get('aggs', ()), query.get('groupby'), query.get('top'), query.get('top_approx'), query.get('where'),
+                                                    query.get('no_cap', False), query.get('memory_limit'), query.get('order_by'), query.get('limit'),
+                                                    query.get('progress_every'), query.get('sample'), query.get('sample_rows'), query.get('keep_sample', False)))
+
+            except OLAPError as error:
+
+                error.warnings = []
+                errors[i] = error
+
+        results = iter(self.run(made_queries))
+
+        return [errors[i] if i in errors else next(results) for i in range(len(queries))]
+
+    def run(self, queries):
+
+        """
+        Checks every (command_order, args) query, reads the input once for the union of the plans of the queries
+        with the same filter, memory limit and sample, see scan_key(), and computes their results. A query that
+        fails, when it is checked, read or computed, does not stop the other queries: its OLAPError is returned in
+        place of its result.
+        """
+
+        # the plan of a query that failed its check is its OLAPError
+
+        plans = []
+
+        with self.phase('check'):
+
+            for (command_order, args) in queries:
+
+                try:
+
+                    check_query(self.header_line, command_order, args)
+                    plans.append(make_plan(command_order, args))
+
+                except OLAPError as error:
+
+                    error.warnings = args.warnings
+                    plans.append(error)
+
+        checked = [i for i in range(len(queries)) if not isinstance(plans[i], OLAPError)]
+
+        # queries with the same scan key share one read of the input. Every scan state is kept with the SampleDesign
+        # of the sample it was read from, or None if it was read from the whole input. A read that failed is kept
+        # as its OLAPError, which is the result of each of its queries
+
+        scan_states = {}
+
+        for i in checked:
+
+            key = scan_key(plans[i])
+
+            if(key not in scan_states):
+
+                # the queries of the scan that asked for progress reports get them every time the first one asked for
+                progress_queries = [queries[j] for j in checked if scan_key(plans[j]) == key and queries[j][1].progress_every != None]
+                progress = ProgressReport(progress_queries, progress_queries[0][1].progress_every) if progress_queries else None
+
+                try:
+
+                    with self.phase('scan'):
+
+                        merged_plan = merge_plans([plans[j] for j in checked if scan_key(plans[j]) == key])
+                        scan_states[key] = self.sample(merged_plan) if merged_plan['sample'] != None else (self.scan(merged_plan, progress), None)
+
+                except OLAPError as error:
+
+                    scan_states[key] = error
+
+        results = []
+
+        with self.phase('aggregate'):
+
+            for i in range(len(queries)):
+
+                (command_order, args) = queries[i]
+
+                if(isinstance(plans[i], OLAPError)):
+
+                    results.append(plans[i])
+                    continue
+
+                try:
+
+                    if(isinstance(scan_states[scan_key(plans[i])], OLAPError)):
+
+                        raise scan_states[scan_key(plans[i])]
+
+                    (scan_state, design) = scan_states[scan_key(plans[i])]
+
+                    if(design == None):
+
+                        results.append(query_result(scan_state, command_order, args))
+
+                    else:
+
+                        results.append(sample_result(scan_state, design, command_order, args))
+
+                except OLAPError as error:
+
+                    error.warnings = args.warnings
+                    results.append(error)
+
+        return results
+
+    def scan(self, plan, progress=None):
+
+        """
+        Reads the running state of plan from the data cube, from the loaded columns, or from the csv file if
+        neither can answer the plan, either in this process or split across workers processes. With a state file
+        only the lines appended to the csv file since the last query are read. A plan with a memory limit is always
+        read from the csv file, since the cube and the columns hold every group in memory, and so is a scan with
+        a ProgressReport, which reports on the lines read.
+        """
+
+        if(plan['memory_limit'] != None or progress != None):
+
+            (source, scan_state) = self.scan_file(plan, progress)
+
+        elif(self.cube != None and cube_can_answer(self.cube, plan)):
+
+            (source, scan_state) = ('cube', scan_cube(self.cube, self.header_line, plan))
+
+        elif(self.columns != None and self.columns.can_answer(plan)):
+
+            source = 'columns' if self.columns.cache_map == None else 'cache'
+            scan_state = scan_columns(self.columns, self.header_line, plan)
+
+        else:
+
+            (source, scan_state) = self.scan_file(plan)
+
+        if(self.stats != None):
+
+            # the bytes of the csv file are only read by the scans of the file, and a state scan covers all of them
+            bytes_read = os.path.getsize(self.file_name) if source in ('csv', 'workers', 'state') else None
+            self.stats.add_scan(scan_state, source, bytes_read)
+
+        return scan_state
+
+    def scan_file(self, plan, progress=None):
+
+        """
+        Reads the running state of plan from the csv file, reporting on it to progress if it is not None.
+        Returns: the name of the way the file was read and the state
+        """
+
+        if((plan['memory_limit'] != None or progress != None) and (self.partitions != None or self.state_file != None or (self.workers and self.workers > 1))):
+
+            raise OLAPError("Error: --memory-limit and --progress-every can't be used with several input files, --state or --workers", 6)
+
+        try:
+
+            if(self.partitions != None):
+
+                return ('files', scan_partitions(self.partitions, self.partition_fields, self.header_line, plan, self.workers))
+
+            if(self.state_file != None):
+
+                return ('state', incremental_scan(self.file_name, self.header_line, plan, self.state_file))
+
+            if(self.workers and self.workers > 1):
+
+                scan_state = parallel_scan(self.file_name, self.header_line, plan, self.workers)
+
+                # a file whose chunks would split a quoted value with line breaks is read in this process instead
+
+                if(scan_state != None):
+
+                    return ('workers', scan_state)
+
+            # standard input is opened by open(), which already read its header line, and can only be read once
+
+            if(self.file_name == STDIN_NAME):
+
+                if(self.input_file.closed):
+
+                    raise OLAPError("Error: Standard input can only be read once, so all queries on it must have the same filter", 6)
+
+                with self.input_file:
+
+                    return ('stdin', self.scan_reader(csv.reader(self.input_file), plan, progress))
+
+            with open_input(self.file_name) as input_file:
+
+                # the share of a plain file read is known from the position of its raw file
+                if(progress != None and input_compression(self.file_name) == None):
+
+                    progress.track(input_file.buffer.raw, os.path.getsize(self.file_name))
+
+                csv_reader = csv.reader(input_file)
+                next(csv_reader, None)
+
+                return ('csv', self.scan_reader(csv_reader, plan, progress))
+
+        except INPUT_ERRORS as error:
+
+            raise input_error(self.file_name, error)
+
+    def sample(self, plan):
+
+        """
+        Reads the running state of plan from a random sample of the records of the csv file, see Sample, or from
+        the sample kept next to it by an earlier query with the same sample argument. Every part of the sample is
+        read by its own scan, so the state of every block of a clustered sample can be added to its design.
+        Returns: the state and the SampleDesign of the sample
+        """
+
+        (kind, size, keep) = plan['sample']
+
+        if(self.partitions != None or self.state_file != None or (self.workers and self.workers > 1) or (keep and self.file_name == STDIN_NAME)):
+
+            raise OLAPError("Error: --sample and --sample-rows can't be used with several input files, --state or --workers, and a sample of standard input can't be kept", 6)
+
+        if(self.file_name == STDIN_NAME and self.input_file.closed):
+
+            raise OLAPError("Error: Standard input can only be read once, so all queries on it must have the same filter and sample", 6)
+
+        try:
+
+            kept = open_sample(self.file_name, kind, size) if keep else None
+
+            # the sampled records are copied to a temporary file while they are read, and kept once the design of
+            # the sample is complete
+
+            with (kept[0] if kept != None else tempfile.TemporaryFile('w+', encoding="utf-8", newline='') if keep else contextlib.nullcontext()) as sample_file:
+
+                if(kept != None):
+
+                    (source, design, parts) = ('kept sample', kept[1], kept_parts(sample_file))
+
+                else:
+
+                    sample = Sample(self.file_name, kind, size, self.input_file if self.file_name == STDIN_NAME else None)
+                    (source, design, parts) = ('sample', sample.design, sample.parts())
+
+                    if(keep):
+
+                        parts = written_parts(parts, csv.writer(sample_file))
+
+                scan_state = scan([], self.header_line, plan)
+
+                for (unit, records) in parts:
+
+                    part_state = scan(records, self.header_line, plan, scan_state[2] + 2)
+
+                    if(design.clustered):
+
+                        design.add_unit(part_state)
+
+                    scan_state = merge_scan(scan_state, part_state, 0, plan)
+
+                # every line read is a unit of a sample that isn't clustered
+                if(not design.clustered):
+
+                    design.units = scan_state[2]
+
+                if(kept == None and keep):
+
+                    write_sample(self.file_name, kind, size, design, sample_file)
+
+        except INPUT_ERRORS as error:
+
+            raise input_error(self.file_name, error)
+
+        if(self.stats != None):
+
+            self.stats.add_scan(scan_state, source, None)
+
+        return (scan_state, design)
+
+    def scan_reader(self, csv_reader, plan, progress=None):
+
+        """
+        Reads the running state of plan from the lines of csv_reader, spilling its groups to disk if it has a
+        memory limit and reporting on it to progress if it is not None
+        """
+
+        if(plan['memory_limit'] != None):
+
+            return spill_scan(csv_reader, self.header_line, plan, plan['memory_limit'])
+
+        if(progress != None):
+
+            return progress_scan(csv_reader, self.header_line, plan, progress)
+
+        return scan(csv_reader, self.header_line, plan)
+
+    def phase(self, name):
+
+        """
+        Returns a context that times phase name in self.stats, or does nothing without stats
+        """
+
+        return self.stats.phase(name) if self.stats != None else contextlib.nullcontext()
+
+def read_header(file_name, input_file=None):
+
+    """
+    Returns the lowercase field names of the header line of file_name. If input_file is given, the header line
+    is read from it instead and it is left open after the header line.
+
+    Raises an OLAPError if the file does not exist, is not a csv file, is empty or can't be decompressed or decoded
+    """
+
+    # Tries opening the input file, throws an error if file does not exist or is not readable
+
+    try:
+
+        if(input_file != None):
+
+            header_line = next(csv.reader(input_file), None)
+
+        else:
+
+            # compressed files are recognized by their contents, whatever their name
+
+            with open_input(file_name, read_ahead=False) as input_file:
+
+                if(not file_name.endswith(".csv") and input_compression(file_name) == None):
+
+                    raise OLAPError("Error: The file you entered in not a csv file. This program only works for csv files.", 6)
+
+                header_line = next(csv.reader(input_file), None)
+
+    except INPUT_ERRORS as error:
+
+        raise input_error(file_name, error)
+
+    if(header_line == None):
+
+        raise OLAPError("Error:{} is empty".format(file_name), 6)
+
+    return [i.lower() for i in header_line]
+
+# --input - reads standard input. Compressed input files are recognized by the magic bytes they start with
+
+STDIN_NAME = "-"
+COMPRESSIONS = [(b"\x1f\x8b", gzip.GzipFile), (b"BZh", bz2.BZ2File), (b"\xfd7zXZ\x00", lzma.LZMAFile)]
+
+# Input is read in chunks of INPUT_CHUNK bytes. Compressed files and standard input are read by a thread that stays
+# up to READ_AHEAD chunks ahead of the csv parsing
+
+INPUT_CHUNK = 1 << 20
+READ_AHEAD = 4
+
+def input_compression(file_name):
+
+    """
+    Returns the class that decompresses file_name, or None if it is not compressed
+    """
+
+    with open(file_name, 'rb') as input_file:
+
+        return magic_compression(input_file.read(6))
+
+def magic_compression(magic):
+
+    """
+    Returns the class that decompresses data starting with the bytes magic, or None if it is not compressed
+    """
+
+    for (prefix, decompressor) in COMPRESSIONS:
+
+        if(magic.startswith(prefix)):
+
+            return decompressor
+
+    return None
+
+# the errors of reading an input file: OSError if it can't be opened or read, and the others if it is corrupt or
+# truncated compressed data or is not utf-8 text
+
+INPUT_ERRORS = (OSError, EOFError, zlib.error, lzma.LZMAError, UnicodeDecodeError)
+
+def input_error(file_name, error):
+
+    """
+    Returns the OLAPError of one of the INPUT_ERRORS raised while file_name was opened or read. An OSError without
+    an error number comes from a decompressor, or from ReadAhead, and means the contents could not be read.
+    """
+
+    if(isinstance(error, OSError) and error.errno != None):
+
+        return OLAPError("Error: File not found or cannot be read!", 6)
+
+    return OLAPError("Error: {}: The input is corrupt or truncated compressed data, or is not utf-8 text ({})".format(file_name, error), 6)
+
+def open_input(file_name, read_ahead=True):
+
+    """
+    Opens file_name, or standard input if it is "-", as text for csv.reader, decompressing it if it is compressed,
+    whether it is a file or standard input. Compressed files and standard input are read ahead in a thread unless
+    read_ahead is False.
+
+    Raises an OSError if the file can't be opened
+    """
+
+    if(file_name == STDIN_NAME):
+
+        # compressed standard input is recognized by the first bytes in the buffer, which are not consumed
+        stream = sys.stdin.buffer
+        decompressor = magic_compression(stream.peek(6)[:6])
+
+        if(decompressor != None):
+
+            stream = decompressor(fileobj=stream) if decompressor == gzip.GzipFile else decompressor(stream)
+
+    else:
+
+        decompressor = input_compression(file_name)
+
+        if(decompressor == None):
+
+            return open(file_name, 'r', encoding="utf-8-sig", buffering=INPUT_CHUNK)
+
+        stream = decompressor(file_name, 'rb')
+
+    if(read_ahead):
+
+        stream = ReadAhead(stream)
+
+    return io.TextIOWrapper(io.BufferedReader(stream, INPUT_CHUNK), encoding="utf-8-sig")
+
+class ReadAhead(io.RawIOBase):
+
+    """
+    Reads a binary stream in chunks in a thread, up to READ_AHEAD chunks ahead of the reader.
+
+    gzip, bzip2 and xz decompression and reading a pipe release the GIL, so the next chunks are decompressed or
+    read while the lines of the current one are parsed. An error of the thread is raised by the next read.
+    """
+
+    def __init__(self, stream):
+
+        io.RawIOBase.__init__(self)
+        self.stream = stream
+        self.chunks = queue.Queue(READ_AHEAD)
+        self.chunk = memoryview(b"")
+        self.finished = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self.read_chunks, daemon=True)
+        self.thread.start()
+
+    def read_chunks(self):
+
+        try:
+
+            while(not self.stopped):
+
+                chunk = self.stream.read(INPUT_CHUNK)
+                self.chunks.put(chunk)
+
+                if(not chunk):
+
+                    break
+
+        # corrupt or truncated compressed files raise EOFError or lzma.LZMAError, which are not OSErrors
+        except Exception as error:
+
+            self.chunks.put(error)
+
+        finally:
+
+            self.stream.close()
+
+    def readable(self):
+
+        return True
+
+    def readinto(self, buffer):
+
+        while(len(self.chunk) == 0):
+
+            if(self.finished):
+
+                return 0
+
+            chunk = self.chunks.get()
+
+            if(isinstance(chunk, Exception)):
+
+                self.finished = True
+                raise OSError(str(chunk))
+
+            if(not chunk):
+
+                self.finished = True
+                return 0
+
+            self.chunk = memoryview(chunk)
+
+        length = min(len(buffer), len(self.chunk))
+        buffer[:length] = self.chunk[:length]
+        self.chunk = self.chunk[length:]
+
+        return length
+
+    def close(self):
+
+        # the thread may be waiting for room in the queue, so it is emptied once the thread is told to stop
+
+        self.stopped = True
+
+        while(True):
+
+            try:
+
+                self.chunks.get_nowait()
+
+            except queue.Empty:
+
+                break
+
+        io.RawIOBase.close(self)
+
+def print_error(error):
+
+    """
+    Prints the warnings of a failed query followed by its error to stderr
+    """
+
+    for warning in error.warnings:
+
+        print(warning, file=sys.stderr)
+
+    print(error.message, file=sys.stderr)
+
+def print_result(result):
+
+    """
+    Prints the warnings of a query result to stderr and the result in .csv format to standard output.
+    The rows are written as they are computed, so the warnings found while computing them are printed after them.
+    """
+
+    warnings_printed = len(result.warnings)
+
+    for warning in result.warnings:
+
+        print(warning, file=sys.stderr)
+
+    result.write_csv(sys.stdout)
+
+    for warning in result.warnings[warnings_printed:]:
+
+        print(warning, file=sys.stderr)
+
+def resident_memory():
+
+    """
+    Returns the current and the peak resident memory of this process in bytes.
+    The current resident memory is None where /proc is not available.
+    """
+
+    current = None
+
+    try:
+
+        with open("/proc/self/statm", 'r') as statm_file:
+
+            current = int(statm_file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    except (OSError, ValueError):
+
+        pass
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if(sys.platform != "darwin"):
+
+        peak *= 1024
+
+    return (current, peak)
+
+def cpu_time():
+
+    """
+    Returns the user and system CPU time of this process and of its finished child processes, such as the worker
+    processes of --workers, in seconds. os.times() only counts whole clock ticks of 10 ms, too coarse to tell
+    short phases apart, so the time of this process comes from process_time() and that of the children from
+    getrusage().
+    """
+
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+# --profile shows the PROFILE_LINES functions with the highest cumulative time, or lines with the most memory allocated
+PROFILE_LINES = 25
+
+class QueryStats:
+
+    """
+    Collects the wall and CPU time of every phase of a command line query and what its scans read, for --stats.
+
+    phases holds a dictionary for every phase in the order they ran. Every scan adds the source it was answered
+    from (csv, workers, state, cache, columns or cube), the rows and bytes it covered, the number of groups of
+    every group-by field and the number of non-numeric values found in every field.
+    """
+
+    def __init__(self):
+
+        self.phases = []
+        self.scans = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+
+        """
+        Times the statements of a with block as phase name
+        """
+
+        (start, start_cpu) = (time.perf_counter(), cpu_time())
+
+        try:
+
+            yield
+
+        finally:
+
+            self.phases.append({'phase': name, 'wall_time': time.perf_counter() - start, 'cpu_time': cpu_time() - start_cpu})
+
+    def add_scan(self, scan_state, source, bytes_read):
+
+        """
+        Records a scan: the wall time of the scan is the phase that ends next
+        """
+
+        (grand_total, categories, total_lines) = scan_state
+        groups = {}
+        non_numeric = {}
+
+        spilled = {}
+
+        for field in categories:
+
+            # the groups spilled by a memory limit are only merged when the result is output
+            if(isinstance(categories[field], SpilledGroups)):
+
+                spilled[", ".join(group_fields(field))] = len(categories[field].runs)
+                non_numeric_counts = categories[field].non_numeric_counts()
+                field_counts = {}
+
+                for command in non_numeric_counts:
+
+                    field_counts[command[1]] = max(field_counts.get(command[1], 0), non_numeric_counts[command])
+
+                for name in field_counts:
+
+                    non_numeric[name] = non_numeric.get(name, 0) + field_counts[name]
+
+            else:
+
+                groups[", ".join(group_fields(field))] = len(categories[field])
+
+        # every aggregate of a field sees the same non-numeric values of a group, so they are only counted once
+        containers = [grand_total] + [group for field in categories if not isinstance(categories[field], SpilledGroups) for group in categories[field].values()]
+
+        for container in containers:
+
+            container_counts = {}
+
+            for command in container:
+
+                if(command != 'count' and hasattr(container[command], 'non_numeric_count')):
+
+                    container_counts[command[1]] = max(container_counts.get(command[1], 0), container[command].non_numeric_count)
+
+            for field in container_counts:
+
+                non_numeric[field] = non_numeric.get(field, 0) + container_counts[field]
+
+        self.scans.append({'source': source, 'rows': total_lines, 'bytes': bytes_read, 'groups': groups, 'spilled_runs': spilled, 'non_numeric': non_numeric})
+
+    def to_json(self):
+
+        """
+        Returns the stats as a dictionary that can be written as JSON, with the throughput of every scan phase and
+        the peak resident memory of the process
+        """
+
+        scan_phases = [phase for phase in self.phases if phase['phase'] == 'scan']
+        scans = []
+
+        for i in range(len(self.scans)):
+
+            scan_stats = dict(self.scans[i])
+
+            if(i < len(scan_phases) and scan_phases[i]['wall_time'] > 0):
+
+                scan_stats['rows_per_sec'] = scan_stats['rows'] / scan_phases[i]['wall_time']
+                scan_stats['bytes_per_sec'] = scan_stats['bytes'] / scan_phases[i]['wall_time'] if scan_stats['bytes'] != None else None
+
+            scans.append(scan_stats)
+
+        total = {'wall_time': sum([phase['wall_time'] for phase in self.phases]), 'cpu_time': sum([phase['cpu_time'] for phase in self.phases])}
+
+        return {'phases': self.phases, 'total': total, 'scans': scans, 'peak_memory': resident_memory()[1]}
+
+    def report(self):
+
+        """
+        Returns the stats as lines of text
+        """
+
+        stats = self.to_json()
+        lines = ["phase           wall s     cpu s"]
+
+        for phase in stats['phases'] + [dict(stats['total'], phase='total')]:
+
+            lines.append("{:<12}{:>10.4f}{:>10.4f}".format(phase['phase'], phase['wall_time'], phase['cpu_time']))
+
+        for scan_stats in stats['scans']:
+
+            line = "scan from {}: {} rows".format(scan_stats['source'], scan_stats['rows'])
+
+            if(scan_stats['bytes'] != None):
+
+                line += ", {} bytes".format(scan_stats['bytes'])
+
+            if('rows_per_sec' in scan_stats):
+
+                line += ", {:.0f} rows/sec".format(scan_stats['rows_per_sec'])
+
+            if(scan_stats.get('bytes_per_sec') != None):
+
+                line += ", {:.1f} MB/sec".format(scan_stats['bytes_per_sec'] / 1e6)
+
+            lines.append(line)
+
+            for field in scan_stats['groups']:
+
+                lines.append("  groups of {}: {}".format(field, scan_stats['groups'][field]))
+
+            for field in scan_stats['spilled_runs']:
+
+                lines.append("  groups of {} spilled to disk: {} sorted runs".format(field, scan_stats['spilled_runs'][field]))
+
+            for field in scan_stats['non_numeric']:
+
+                lines.append("  non-numeric values of {}: {}".format(field, scan_stats['non_numeric'][field]))
+
+        lines.append("peak memory: {:.1f} MB".format(stats['peak_memory'] / 1e6))
+
+        return "\n".join(lines)
+
+# --progress-every reports in seconds check the time every PROGRESS_CHECK_ROWS lines. Confidence intervals are
+# PROGRESS_Z standard errors wide on each side, about 95%
+
+PROGRESS_CHECK_ROWS = 10000
+PROGRESS_Z = 1.96
+
+def progress_interval(every):
+
+    """
+    Takes in the argument of --progress-every, a number of rows such as 100000 or a number of seconds such as 10s
+
+    Returns: ('rows', rows) or ('seconds', seconds), or None if it is not valid
+    """
+
+    try:
+
+        if(isinstance(every, str) and every.lower().endswith('s')):
+
+            seconds = float(every[:-1])
+            return ('seconds', seconds) if seconds > 0 else None
+
+        rows = int(every)
+
+    except (TypeError, ValueError):
+
+        return None
+
+    return ('rows', rows) if rows > 0 else None
+
+class ProgressReport:
+
+    """
+    Prints running estimates of the results of queries to stderr while their scan goes on, for --progress-every.
+
+    queries holds the (command_order, args) of the queries and every is returned by progress_interval().
+    When the scan reads a plain file, input_file is its raw file and file_size its size, so the share of the
+    file read is known. The count, sums, row counts of groups and top counts are then estimated for the whole
+    file, and every count, mean, sum and top is followed by a _ci95 column holding the half width of the
+    confidence interval of its estimate, see estimated_result(). The lines read so far are a prefix of the file, not a random sample, so the estimates
+    and intervals are only valid if the rows are in random order; a file sorted or grouped by a field, such as
+    a log appended to over time, can be far outside them. Every report says so in its first line.
+    """
+
+    def __init__(self, queries, every):
+
+        self.queries = queries
+        self.every = every
+        self.start = time.perf_counter()
+        self.last_report = self.start
+        self.input_file = None
+        self.file_size = None
+
+    def segment_rows(self):
+
+        return self.every[1] if self.every[0] == 'rows' else PROGRESS_CHECK_ROWS
+
+    def track(self, input_file, file_size):
+
+        self.input_file = input_file
+        self.file_size = file_size
+
+    def update(self, scan_state):
+
+        """
+        Reports scan_state, the state of the lines read so far, if it is time to
+        """
+
+        now = time.perf_counter()
+
+        if(self.every[0] == 'seconds' and now - self.last_report < self.every[1]):
+
+            return
+
+        self.last_report = now
+        print(self.report(scan_state, now - self.start), file=sys.stderr, flush=True)
+
+    def report(self, scan_state, elapsed):
+
+        """
+        Returns the report of scan_state as lines of text
+        """
+
+        total_lines = scan_state[2]
+        fraction = None
+
+        if(self.input_file != None and self.file_size):
+
+            fraction = min(self.input_file.tell() / self.file_size, 1.0)
+
+        if(fraction != None):
+
+            lines = ["# progress: {} rows read, {:.1%} of the file, {:.1f} s, estimates for the whole file if its rows are in random order".format(total_lines, fraction, elapsed)]
+
+        else:
+
+            lines = ["# progress: {} rows read, {:.1f} s, intervals valid if the rows are in random order".format(total_lines, elapsed)]
+
+        for (command_order, args) in self.queries:
+
+            # the warnings of the partial result are left out, they are printed with the final result
+            partial_args = args.copy()
+
+            try:
+
+                result = query_result(scaled_state(scan_state, fraction), command_order, partial_args)
+
+            except OLAPError as error:
+
+                lines.append(error.message)
+                continue
+
+            # the lines read so far are taken as a random sample of the lines of the file
+            result = estimated_result(result, scan_state, command_order, args, SampleDesign('units', fraction, total_lines))
+
+            if(result.header != None):
+
+                lines.append(",".join(result.header))
+
+            for row in result.rows:
+
+                lines.append(",".join([str(value) for value in row]))
+
+        return "\n".join(lines)
+
+def scaled_state(scan_state, fraction):
+
+    """
+    Returns a copy of scan_state, read from fraction of the records of the input, whose count of lines, counts
+    of the records of every group, which are also the counts of top, and counts of the heavy hitters sketch of
+    --top-approx are scaled to the whole input. The other running aggregates are shared with scan_state.
+    scan_state itself is returned if fraction is None or 0.
+    """
+
+    if(not fraction):
+
+        return scan_state
+
+    (grand_total, categories, total_lines) = scan_state
+    scaled_total = dict(grand_total)
+    scaled_total['count'] = round(grand_total['count'] / fraction)
+
+    for command in grand_total:
+
+        if(command != 'count' and command[0] == 'top_approx'):
+
+            scaled_total[command] = grand_total[command].scaled(fraction)
+
+    scaled_categories = {}
+
+    for field in categories:
+
+        scaled_categories[field] = {}
+
+        for value in categories[field]:
+
+            group = dict(categories[field][value])
+            group['count'] = round(group['count'] / fraction)
+            scaled_categories[field][value] = group
+
+    return (scaled_total, scaled_categories, round(total_lines / fraction))
+
+def estimated_result(result, scan_state, command_order, args, design):
+
+    """
+    Returns result, computed from scaled_state(scan_state, design.fraction), with a column after every count,
+    sum, mean and top holding the half width of the 95% confidence interval of its estimate, named after the
+    column with _ci95 added, see estimated_row()
+    """
+
+    (grand_total, categories, total_lines) = scan_state
+    rows = []
+
+    # the counts of --top-approx are estimated by their sketch, which has bounds of its own
+
+    if(args.top and args.top_approx != None and not args.groupby):
+
+        return result
+
+    if(args.top and not args.groupby):
+
+        command_order = [('top', args.top[1])]
+
+    elif(not command_order and not args.groupby):
+
+        command_order = ['count']
+
+    top_data = None
+
+    if(args.top):
+
+        top_data = scaled_state(scan_state, design.fraction)[1]
+
+    offset = len(args.groupby) if args.groupby else 0
+
+    for row in result.rows:
+
+        if(not args.groupby):
+
+            (state, key) = (grand_total, None)
+
+        else:
+
+            # the row of the remaining groups has no state of its own
+            flag = group_key(args.groupby)
+            value = tuple(row[:offset]) if isinstance(flag, tuple) else row[0]
+            overflow = row is result.rows[-1] and len(categories[flag]) > group_cap(args, len(categories[flag]))
+            (state, key) = (None if overflow else categories[flag][value], (flag, value))
+
+        rows.append(estimated_row(row, state, key, offset, command_order, args, design, (categories, top_data)))
+
+    header = None
+
+    if(result.header != None):
+
+        header = result.header[:offset]
+
+        for i in range(len(command_order)):
+
+            header.append(result.header[offset + i])
+
+            if(command_order[i] == 'count' or command_order[i][0] in ('mean', 'sum', 'top')):
+
+                header.append(result.header[offset + i] + "_ci95")
+
+    return QueryResult(header, rows, result.warnings)
+
+def estimated_row(row, state, key, offset, command_order, args, design, top_data):
+
+    """
+    Returns a row of a result read from a sample of the records of the input, drawn as described by design, with
+    its sums estimated for the whole input if the share of the input read is known, and the half width of the
+    confidence interval of every count, mean, sum and top after it, or "" if it can't be estimated. Its counts are
+    already scaled, see scaled_state(). state is the running state of the row, or None for the row of the
+    remaining groups, and key is the key of its group in design, see SampleDesign.add_unit(). The values of the
+    aggregates of command_order start at offset in row. top_data holds the categories of the sample and their
+    scaled copy, whose top values are the ones of the row.
+    """
+
+    values = list(row[:offset])
+    fraction = design.fraction
+
+    for i in range(len(command_order)):
+
+        command = command_order[i]
+        value = row[offset + i]
+        error = None
+
+        if(command != 'count' and command[0] == 'top'):
+
+            values.extend([value, top_intervals(state, command[1], int(args.top[0]), design, top_data)])
+            continue
+
+        if(command != 'count' and command[0] not in ('mean', 'sum')):
+
+            values.append(value)
+            continue
+
+        if(not isinstance(value, (int, float)) or fraction == 0):
+
+            values.extend([value, ""])
+            continue
+
+        if(command != 'count' and command[0] == 'sum' and fraction != None):
+
+            value = value / fraction
+
+        if(state != None and command == 'count'):
+
+            error = design.count_interval(key, state['count'])
+
+        elif(state != None):
+
+            error = design.interval(command, key, state[('variance', command[1])])
+
+        values.extend([value, rounded_interval(error)])
+
+    return values
+
+def top_intervals(state, field, k, design, top_data):
+
+    """
+    Returns the half widths of the confidence intervals of the top counts of a row, see estimated_row(), as a
+    string like the one of top(), or "" if they can't be estimated. state is the running state of the group of
+    the row, or the grand total when there is no group-by.
+
+    Example: --top 2 ticker --sample 0.1
+             "ibm: 236.1,dis: 219.4"
+    """
+
+    (categories, scaled_categories) = top_data
+
+    if(state == None):
+
+        return ""
+
+    # the value counts of a group are only used to tell which values are in it, as in top()
+    key_list = state.get(('top', field))
+    errors = []
+
+    for (value, count) in top_counts(scaled_categories, min(k, 20), field, key_list):
+
+        error = design.count_interval((field, value), categories[field][value]['count'])
+
+        if(error == None):
+
+            return ""
+
+        errors.append(str(value).strip() + ": " + str(rounded_interval(error)))
+
+    return '"' + ",".join(errors) + '"'
+
+def rounded_interval(error):
+
+    """
+    Returns the half width of a confidence interval rounded to 4 significant digits, or "" if it is None
+    """
+
+    return "" if error == None else float("{:.4g}".format(error))
+
+class SampleDesign:
+
+    """
+    Describes how the lines a result is estimated from were drawn from the whole input, so the confidence
+    intervals of its counts, means and sums can be estimated, see interval() and count_interval().
+
+    kind is 'units' when units, lines or blocks of lines, were drawn at random without replacement, units of
+    them, a fraction of all the units of the input, and 'bernoulli' when every line was kept with a chance of
+    fraction. fraction is None when the share of the input read is not known; the units are then taken to be
+    drawn from an input of unknown size, and sums are not estimated. When clustered is True the units are blocks
+    of lines and add_unit() is called with the state of every block read, otherwise every line is a unit.
+    """
+
+    def __init__(self, kind, fraction, units=0, clustered=False):
+
+        self.kind = kind
+        self.fraction = fraction
+        self.units = units
+        self.clustered = clustered
+        self.moments = {}
+        self.counts = {}
+
+    def add_unit(self, scan_state):
+
+        """
+        Adds the totals of one block, whose state is scan_state, to the moments of every group. The moments of the
+        values of a field in a group are kept under (key, field), where key is None for grand_total and
+        (group field, value) for a group, as the sums over the blocks of the sum y and numeric count m of the
+        values in the block: [sum of y, sum of y², sum of m, sum of m², sum of y * m]. The moments of the number
+        of lines c of a group in the block are kept under key in counts: [sum of c, sum of c²]
+        """
+
+        (grand_total, categories, total_lines) = scan_state
+        containers = [(None, grand_total)] + [((field, value), categories[field][value]) for field in categories for value in categories[field]]
+
+        for (key, container) in containers:
+
+            counts = self.counts.setdefault(key, [0, 0])
+            counts[0] += container['count']
+            counts[1] += container['count'] * container['count']
+
+            for command in container:
+
+                if(command != 'count' and command[0] == 'variance'):
+
+                    count = container[command].numeric_count
+                    total = container[command].mean * count
+                    moments = self.moments.setdefault((key, command[1]), [0.0, 0.0, 0, 0, 0.0])
+                    moments[0] += total
+                    moments[1] += total * total
+                    moments[2] += count
+                    moments[3] += count * count
+                    moments[4] += total * count
+
+    def unit_moments(self, key, field, variance):
+
+        """
+        Returns the moments of the values of field in the group key over the units, see add_unit(). When every
+        line is a unit they follow from variance, the running variance of the values.
+        """
+
+        if(self.clustered):
+
+            return self.moments.get((key, field), (0.0, 0.0, 0, 0, 0.0))
+
+        count = variance.numeric_count
+        total = variance.mean * count
+
+        return (total, variance.squares + total * variance.mean, count, count, total)
+
+    def interval(self, command, key, variance):
+
+        """
+        Returns the half width of the 95% confidence interval of the estimate of a mean or sum command of the
+        group key, whose running variance of the values is variance, or None if it can't be estimated.
+
+        The sum is the Horvitz-Thompson estimate, the sum of the sample divided by fraction, and the mean the ratio
+        of the estimates of the sum and the numeric count, whose variance is estimated from the residuals
+        y - mean * m of the units. A sum only has an interval when fraction is known, since it is exact otherwise.
+        """
+
+        (total, squares, count, count_squares, products) = self.unit_moments(key, command[1], variance)
+        fraction = self.fraction or 0.0
+
+        if(count == 0 or (command[0] == 'sum' and self.fraction == None)):
+
+            return None
+
+        ratio = total / count
+        residuals = squares - 2 * ratio * products + ratio * ratio * count_squares
+
+        if(self.kind == 'bernoulli'):
+
+            if(command[0] == 'sum'):
+
+                estimate_variance = (1 - fraction) / (fraction * fraction) * squares
+
+            else:
+
+                estimate_variance = (1 - fraction) * residuals / (count * count)
+
+        else:
+
+            units = self.units
+
+            if(units < 2):
+
+                return None
+
+            if(command[0] == 'sum'):
+
+                spread = (squares - total * total / units) / (units - 1)
+                estimate_variance = (1 - fraction) * units * spread / (fraction * fraction)
+
+            else:
+
+                mean_count = count / units
+                estimate_variance = (1 - fraction) * residuals / (units - 1) / (units * mean_count * mean_count)
+
+        return PROGRESS_Z * math.sqrt(max(estimate_variance, 0.0))
+
+    def count_interval(self, key, count):
+
+        """
+        Returns the half width of the 95% confidence interval of the count of lines of the group key, or of every
+        line if key is None, count of which are in the sample, or None if it can't be estimated.
+
+        The count is the Horvitz-Thompson estimate count / fraction, a sum whose values are 1 for the lines of
+        the group and 0 for the others, so it only has an interval when fraction is known.
+        """
+
+        fraction = self.fraction
+
+        if(not fraction):
+
+            return None
+
+        if(self.kind == 'bernoulli'):
+
+            estimate_variance = (1 - fraction) / (fraction * fraction) * count
+
+        else:
+
+            units = self.units
+
+            if(units < 2):
+
+                return None
+
+            (total, squares) = self.counts.get(key, (0, 0)) if self.clustered else (count, count)
+            spread = (squares - total * total / units) / (units - 1)
+            estimate_variance = (1 - fraction) * units * spread / (fraction * fraction)
+
+        return PROGRESS_Z * math.sqrt(max(estimate_variance, 0.0))
+
+    def to_json(self):
+
+        return {'kind': self.kind, 'fraction': self.fraction, 'units': self.units, 'clustered': self.clustered}
+
+def sample_result(scan_state, design, command_order, args):
+
+    """
+    Computes the QueryResult of a query from the state of a sample of the records of the input drawn as
+    described by design, with its estimates for the whole input, see estimated_result()
+    """
+
+    result = query_result(scaled_state(scan_state, design.fraction), command_order, args)
+    args.warnings.append("Warning: {}: Estimated from a sample of {} rows, {:.2%} of the file. The _ci95 columns hold the half width of the 95% confidence interval of the column before them".format(args.input, scan_state[2], design.fraction))
+
+    # a file split into few blocks can only be sampled in shares of whole blocks
+    if(args.sample != None and abs(design.fraction - args.sample) > args.sample * SAMPLE_FRACTION_TOLERANCE):
+
+        args.warnings.append("Warning: {}: The sample holds {:.2%} of the file instead of the {:.2%} asked for, since the file is too small to be split into smaller blocks".format(args.input, design.fraction, args.sample))
+
+    return estimated_result(result, scan_state, command_order, args, design)
+
+# a fraction of a plain file is sampled in blocks of at most SAMPLE_BLOCK bytes, which are made smaller, down to
+# MIN_SAMPLE_BLOCK bytes, so that about MIN_SAMPLE_BLOCKS blocks are picked
+
+SAMPLE_BLOCK = 65536
+MIN_SAMPLE_BLOCK = 1024
+MIN_SAMPLE_BLOCKS = 30
+SAMPLE_FRACTION_TOLERANCE = 0.25
+SAMPLE_SEED = 0
+SAMPLE_SUFFIX = ".olapsample"
+SAMPLE_VERSION = 2
+
+class Sample:
+
+    """
+    Reads a random sample of the records of the csv file file_name for --sample and --sample-rows. kind is
+    'fraction' to sample about size of the records, or 'rows' to sample size records.
+
+    A fraction of a plain file is read as blocks of lines picked at random, seeking over the others, and every
+    block is a unit of the sample. Every line belongs to the block it starts in, so quoted values must not contain
+    line breaks. Every record of a compressed file or standard input is read instead and picked with a chance of
+    size. Rows are drawn with a reservoir sample over every record, since the number of records is only known
+    once all of them were read. The same file and arguments always give the same sample.
+
+    input_file is the open standard input, whose header line was read, when file_name is "-". design describes
+    how the sample was drawn, see SampleDesign, and is complete once every part was read.
+    """
+
+    def __init__(self, file_name, kind, size, input_file=None):
+
+        self.file_name = file_name
+        self.kind = kind
+        self.size = size
+        self.input_file = input_file
+        self.generator = random.Random(SAMPLE_SEED)
+
+        if(kind == 'rows'):
+
+            self.design = SampleDesign('units', None)
+
+        elif(input_file == None and input_compression(file_name) == None):
+
+            self.design = SampleDesign('units', None, clustered=True)
+
+        else:
+
+            self.design = SampleDesign('bernoulli', size)
+
+    def parts(self):
+
+        """
+        Yields (unit, records) for every part of the sample, where records iterates the records of the part as
+        lists of values. The parts are the blocks of a clustered sample, which are numbered by unit, otherwise the
+        whole sample is one part numbered 0.
+        """
+
+        if(self.kind == 'rows'):
+
+            yield (0, self.reservoir())
+
+        elif(self.design.clustered):
+
+            yield from self.blocks()
+
+        else:
+
+            yield (0, self.picked())
+
+    def records(self):
+
+        """
+        Yields every record of the file after its header line
+        """
+
+        if(self.input_file != None):
+
+            with self.input_file:
+
+                yield from csv.reader(self.input_file)
+
+            return
+
+        with open_input(self.file_name) as input_file:
+
+            csv_reader = csv.reader(input_file)
+            next(csv_reader, None)
+
+            yield from csv_reader
+
+    def blocks(self):
+
+        """
+        Yields the block number and the records of every block picked from a plain file, in the order of the file
+        """
+
+        with open(self.file_name, 'rb') as input_file:
+
+            input_file.readline()
+            data_start = input_file.tell()
+            file_size = os.fstat(input_file.fileno()).st_size
+            data_size = file_size - data_start
+            block_size = max(min(SAMPLE_BLOCK, int(data_size * self.size) // MIN_SAMPLE_BLOCKS), MIN_SAMPLE_BLOCK)
+            block_count = max((data_size + block_size - 1) // block_size, 1)
+            picked = sorted(self.generator.sample(range(block_count), max(round(block_count * self.size), 1)))
+
+            # every block is picked with the same chance, the share of the blocks picked
+            self.design.fraction = len(picked) / block_count
+            self.design.units = len(picked)
+
+            for block in picked:
+
+                start = self.line_start(input_file, data_start + block * block_size, data_start, file_size)
+                end = self.line_start(input_file, data_start + (block + 1) * block_size, data_start, file_size)
+                input_file.seek(start)
+
+                yield (block, csv.reader(io.StringIO(input_file.read(max(end - start, 0)).decode("utf-8"), newline='')))
+
+    def line_start(self, input_file, offset, data_start, file_size):
+
+        """
+        Returns the offset of the first line of input_file that starts at or after offset
+        """
+
+        if(offset <= data_start or offset >= file_size):
+
+            return min(max(offset, data_start), file_size)
+
+        input_file.seek(offset - 1)
+        input_file.readline()
+
+        return input_file.tell()
+
+    def picked(self):
+
+        """
+        Yields every record picked from a file that can't be read with seeks
+        """
+
+        for line in self.records():
+
+            if(line and self.generator.random() < self.size):
+
+                yield line
+
+    def reservoir(self):
+
+        """
+        Yields self.size records drawn from every record of the file, in the order of the file
+        """
+
+        reservoir = []
+        total = 0
+
+        for line in self.records():
+
+            if(not line):
+
+                continue
+
+            total += 1
+
+            if(total <= self.size):
+
+                reservoir.append((total, line))
+                continue
+
+            slot = self.generator.randrange(total)
+
+            if(slot < self.size):
+
+                reservoir[slot] = (total, line)
+
+        reservoir.sort(key=operator.itemgetter(0))
+        self.design.fraction = len(reservoir) / total if total else 1.0
+
+        for (number, line) in reservoir:
+
+            yield line
+
+def kept_parts(sample_file):
+
+    """
+    Yields (unit, records) for every part of a sample kept by write_sample(), like Sample.parts()
+    """
+
+    for (unit, lines) in itertools.groupby(csv.reader(sample_file), key=operator.itemgetter(0)):
+
+        yield (unit, (line[1:] for line in lines))
+
+def written_parts(parts, csv_writer):
+
+    """
+    Yields the parts of a sample like Sample.parts(), writing every record to csv_writer after its unit
+    """
+
+    for (unit, records) in parts:
+
+        yield (unit, written_records(unit, records, csv_writer))
+
+def written_records(unit, records, csv_writer):
+
+    for line in records:
+
+        csv_writer.writerow([unit] + line)
+        yield line
+
+def open_sample(file_name, kind, size):
+
+    """
+    Opens the sample of file_name kept by --keep-sample.
+    Returns: the sample file, positioned at its first record, and the SampleDesign of the sample, or None if
+             there is no up to date sample of the same kind and size
+    """
+
+    try:
+
+        sample_file = open(file_name + SAMPLE_SUFFIX, 'r', encoding="utf-8", newline='')
+
+    except OSError:
+
+        return None
+
+    try:
+
+        metadata = json.loads(sample_file.readline())
+
+        if(metadata.get('version') == SAMPLE_VERSION and metadata.get('sample') == [kind, size] and metadata.get('fingerprint') == file_fingerprint(file_name)):
+
+            return (sample_file, SampleDesign(**metadata['design']))
+
+    except (ValueError, AttributeError, KeyError, TypeError):
+
+        pass
+
+    sample_file.close()
+
+    return None
+
+def write_sample(file_name, kind, size, design, records_file):
+
+    """
+    Keeps the sample of file_name next to it as a line of JSON metadata followed by its records, each after the
+    number of the part of the sample it belongs to, which were written as csv to the open file records_file. The
+    sample is written under a temporary name and renamed once it is complete, and is not kept if it can't be
+    written.
+    """
+
+    sample_name = file_name + SAMPLE_SUFFIX
+    temporary_name = sample_name + ".tmp{}".format(os.getpid())
+
+    try:
+
+        with open(temporary_name, 'w', encoding="utf-8", newline='') as sample_file:
+
+            sample_file.write(json.dumps({'version': SAMPLE_VERSION, 'sample': [kind, size], 'design': design.to_json(), 'fingerprint': file_fingerprint(file_name)}) + "\n")
+            records_file.seek(0)
+            shutil.copyfileobj(records_file, sample_file)
+
+        os.replace(temporary_name, sample_name)
+
+    except OSError:
+
+        if(os.path.exists(temporary_name)):
+
+            os.remove(temporary_name)
+
+@contextlib.contextmanager
+def profiled(kind, output_file=None):
+
+    """
+    Runs the statements of a with block under cProfile (kind 'cpu') or tracemalloc (kind 'memory') and prints the
+    report to stderr, or writes it to output_file. For cpu, output_file gets the raw profile that pstats and
+    other profile viewers read. Worker processes are not profiled.
+    """
+
+    if(kind == 'cpu'):
+
+        profile = cProfile.Profile()
+        profile.enable()
+
+    else:
+
+        tracemalloc.start()
+
+    try:
+
+        yield
+
+    finally:
+
+        if(kind == 'cpu'):
+
+            profile.disable()
+
+            if(output_file != None):
+
+                profile.dump_stats(output_file)
+
+            else:
+
+                report = io.StringIO()
+                pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(PROFILE_LINES)
+                print(report.getvalue(), file=sys.stderr)
+
+        else:
+
+            snapshot = tracemalloc.take_snapshot()
+            (current, peak) = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            lines = ["traced memory: {} bytes, peak {} bytes".format(current, peak)]
+
+            for statistic in snapshot.statistics("lineno")[:PROFILE_LINES]:
+
+                lines.append(str(statistic))
+
+            if(output_file != None):
+
+                with open(output_file, 'w') as report_file:
+
+                    report_file.write("\n".join(lines) + "\n")
+
+            else:
+
+                print("\n".join(lines), file=sys.stderr)
+
+class ServedDataset:
+
+    """
+    A dataset held in memory by the query server, with its load and query timings
+    """
+
+    def __init__(self, name, file_name, args):
+
+        self.name = name
+        self.file_name = file_name
+        self.args = args
+        self.dataset = None
+        self.fingerprint = None
+        self.load_seconds = None
+        self.loaded_at = None
+        self.reloads = 0
+        self.queries = 0
+        self.failed_queries = 0
+        self.total_query_ms = 0.0
+        self.last_query_ms = None
+        self.max_query_ms = 0.0
+
+    def load(self):
+
+        """
+        Opens the dataset with its columns in memory, replacing the one loaded before.
+        The file is only reloaded if its size or modification time changed.
+        Returns True if the dataset was (re)loaded.
+        """
+
+        file_stat = os.stat(self.file_name)
+        fingerprint = (file_stat.st_size, file_stat.st_mtime_ns)
+
+        if(fingerprint == self.fingerprint):
+
+            return False
+
+        start = time.perf_counter()
+        dataset = Dataset.open(self.file_name, cache=self.args.cache, use_cache=not self.args.no_cache)
+
+        if(self.dataset != None):
+
+            self.reloads += 1
+
+        self.dataset = dataset
+        self.fingerprint = fingerprint
+        self.load_seconds = time.perf_counter() - start
+        self.loaded_at = time.time()
+
+        return True
+
+    def record_query(self, elapsed_ms, failed):
+
+        self.queries += 1
+        self.total_query_ms += elapsed_ms
+        self.last_query_ms = elapsed_ms
+        self.max_query_ms = max(self.max_query_ms, elapsed_ms)
+
+        if(failed):
+
+            self.failed_queries += 1
+
+    def stats(self):
+
+        rows = None
+
+        if(self.dataset != None and self.dataset.columns != None):
+
+            rows = self.dataset.columns.row_count
+
+        mean_query_ms = None
+
+        if(self.queries > 0):
+
+            mean_query_ms = self.total_query_ms / self.queries
+
+        return {'file': self.file_name, 'rows': rows, 'load_seconds': self.load_seconds, 'loaded_at': self.loaded_at,
+                'reloads': self.reloads, 'queries': self.queries, 'failed_queries': self.failed_queries,
+                'mean_query_ms': mean_query_ms, 'last_query_ms': self.last_query_ms, 'max_query_ms': self.max_query_ms}
+
+class QueryServer:
+
+    """
+    Answers queries over HTTP on localhost or a Unix socket from datasets held in memory.
+
+        POST /query  with a JSON body such as {"dataset": "students", "groupby": "lunch", "aggs": ["count", ["mean", "math score"]]}
+                     returns {"header": [...], "rows": [...], "warnings": [...], "elapsed_ms": ...}
+        GET /stats   returns the load time, query timings and row count of every dataset and the resident memory
+        GET /datasets returns the names of the datasets
+
+    Queries run in a thread pool so the server keeps accepting connections while a query is computed.
+    """
+
+    def __init__(self, datasets, args):
+
+        self.datasets = datasets
+        self.args = args
+        self.started_at = time.time()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=args.threads)
+
+    async def handle_connection(self, reader, writer):
+
+        """
+        Answers the requests of one connection until the client closes it
+        """
+
+        try:
+
+            while True:
+
+                request_line = await reader.readline()
+
+                if(not request_line):
+
+                    break
+
+                (method, path) = request_line.decode("latin-1").split()[:2]
+                headers = {}
+
+                while True:
+
+                    header_line = await reader.readline()
+
+                    if(header_line in (b"\r\n", b"\n", b"")):
+
+                        break
+
+                    (name, value) = header_line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+
+                body = b""
+
+                if(int(headers.get('content-length', 0)) > 0):
+
+                    body = await reader.readexactly(int(headers['content-length']))
+
+                (status, response) = await self.respond(method, path, body)
+                response_body = json.dumps(response).encode("utf-8")
+                keep_alive = headers.get('connection', '').lower() != 'close'
+
+                writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n".format(
+                    status, http.HTTPStatus(status).phrase, len(response_body), "keep-alive" if keep_alive else "close").encode("latin-1") + response_body)
+                await writer.drain()
+
+                if(not keep_alive):
+
+                    break
+
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+
+            pass
+
+        finally:
+
+            writer.close()
+
+    async def respond(self, method, path, body):
+
+        """
+        Returns the HTTP status and the JSON response of one request
+        """
+
+        if(method == 'GET' and path == '/stats'):
+
+            (current, peak) = resident_memory()
+            datasets = {}
+
+            for name in self.datasets:
+
+                datasets[name] = self.datasets[name].stats()
+
+            return (200, {'uptime_seconds': time.time() - self.started_at, 'rss_bytes': current, 'peak_rss_bytes': peak, 'datasets': datasets})
+
+        if(method == 'GET' and path == '/datasets'):
+
+            return (200, {'datasets': list(self.datasets)})
+
+        if(method != 'POST' or path != '/query'):
+
+            return (404, {'error': "Error: no endpoint {} {}".format(method, path)})
+
+        try:
+
+            query = json.loads(body.decode("utf-8"))
+            served = self.datasets[query.get('dataset', self.args.default_dataset)]
+
+        except (ValueError, KeyError, AttributeError, TypeError):
+
+            return (404, {'error': "Error: the request must be a JSON object naming one of the datasets {}".format(list(self.datasets))})
+
+        unknown = [key for key in query if key not in SERVED_QUERY_KEYS]
+
+        if(unknown):
+
+            return (400, {'error': "Error: unknown query keys {}, a query can only hold {}".format(unknown, list(SERVED_QUERY_KEYS)), 'exit_code': 6})
+
+        start = time.perf_counter()
+
+        try:
+
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, run_served_query, served.dataset, query)
+
+        except Exception as error:
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            served.record_query(elapsed_ms, True)
+
+            # any other exception is reported to the client too, so it gets a reply and the server keeps running
+            if(not isinstance(error, OLAPError)):
+
+                return (400, {'error': "Error: the query could not be answered: {}: {}".format(type(error).__name__, error), 'exit_code': 6, 'warnings': [], 'elapsed_ms': elapsed_ms})
+
+            return (400, {'error': error.message, 'exit_code': error.exit_code, 'warnings': error.warnings, 'elapsed_ms': elapsed_ms})
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        served.record_query(elapsed_ms, False)
+
+        return (200, {'header': result.header, 'rows': result.rows, 'warnings': result.warnings, 'elapsed_ms': elapsed_ms})
+
+    async def watch_files(self):
+
+        """
+        Reloads a dataset when its file changes. The old dataset keeps answering queries until the new one is loaded.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        while True:
+
+            await asyncio.sleep(self.args.reload_interval)
+
+            for name in self.datasets:
+
+                try:
+
+                    if(await loop.run_in_executor(self.executor, self.datasets[name].load)):
+
+                        print("Reloaded {} in {:.3f} seconds".format(name, self.datasets[name].load_seconds), file=sys.stderr)
+
+                except (OSError, OLAPError) as error:
+
+                    print("Error: can't reload {}: {}".format(name, error), file=sys.stderr)
+
+    async def run(self):
+
+        if(self.args.socket):
+
+            server = await asyncio.start_unix_server(self.handle_connection, path=self.args.socket)
+            print("Serving {} on {}".format(", ".join(self.datasets), self.args.socket), file=sys.stderr)
+
+        else:
+
+            server = await asyncio.start_server(self.handle_connection, host=self.args.host, port=self.args.port)
+
+            # the port the server listens on is only known here when --port 0 picked a free one
+            print("Serving {} on http://{}:{}".format(", ".join(self.datasets), self.args.host, server.sockets[0].getsockname()[1]), file=sys.stderr, flush=True)
+
+        if(self.args.reload_interval > 0):
+
+            asyncio.get_running_loop().create_task(self.watch_files())
+
+        async with server:
+
+            await server.serve_forever()
+
+# the keys a query of the server can hold: the dataset and the keyword arguments of Dataset.query() it passes on
+
+SERVED_QUERY_KEYS = ('dataset', 'aggs', 'groupby', 'top', 'top_approx', 'where', 'order_by', 'limit')
+
+def run_served_query(dataset, query):
+
+    """
+    Answers one query of the server. query holds the keyword arguments of Dataset.query()
+    """
+
+    return dataset.query(aggs=query.get('aggs', ()), groupby=query.get('groupby'), top=query.get('top'), top_approx=query.get('top_approx'), where=query.get('where'),
+                         order_by=query.get('order_by'), limit=query.get('limit'))
+
+def serve(argv):
+
+    """
+    OLAP.py serve [name=]file.csv ... loads every file once and answers queries on them until stopped
+    """
+
+    parser = argparse.ArgumentParser(prog="OLAP.py serve")
+    parser.add_argument("datasets", nargs="+", help="The csv files to serve, each optionally prefixed with name= (the default name is the file name)")
+    parser.add_argument("--host", default="127.0.0.1", help="The address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="The port to listen on, 0 for any free port")
+    parser.add_argument("--socket", help="Listens on the specified Unix socket instead of a port")
+    parser.add_argument("--threads", type=int, default=4, help="The number of queries computed at the same time")
+    parser.add_argument("--reload-interval", type=float, default=2.0, help="Seconds between checks for changed files, 0 turns reloading off")
+    parser.add_argument("--cache", action="store_true", help="Builds the columnar cache of every file so restarts load faster")
+    parser.add_argument("--no-cache", action="store_true", help="Reads the csv files even if an up to date columnar cache exists")
+    args = parser.parse_args(argv)
+
+    datasets = {}
+
+    for dataset in args.datasets:
+
+        if("=" in dataset and not os.path.exists(dataset)):
+
+            (name, file_name) = dataset.split("=", 1)
+
+        else:
+
+            (name, file_name) = (os.path.basename(dataset), dataset)
+
+        datasets[name] = ServedDataset(name, file_name, args)
+
+        try:
+
+            datasets[name].load()
+
+        except (OSError, OLAPError) as error:
+
+            print(getattr(error, 'message', "Error: File not found or cannot be read!"), file=sys.stderr)
+            exit(6)
+
+        print("Loaded {} in {:.3f} seconds".format(name, datasets[name].load_seconds), file=sys.stderr)
+
+    args.default_dataset = list(datasets)[0]
+
+    try:
+
+        asyncio.run(QueryServer(datasets, args).run())
+
+    except KeyboardInterrupt:
+
+        pass
+
+def check_query(header_line, command_order, args):
+
+    """
+    Checks that the fields used by a query exist in header_line and that the argument of top is valid.
+    Raises an OLAPError if they do not.
+    The fields of top and group-by in args are converted to lowercase.
+    """
+
+    # look through the aggregate commands entered and see if 
+    # - the user entered a field that does not exist
+
+    for command in command_order:
+
+        if(command != 'count' and command[0] != 'top'):
+
+            if(command[1] not in header_line):
+
+                raise OLAPError("Error: {}:no field with name \'{}\' found".format(args.input, command[1]), 8)
+
+    # if the user called top k
+    # 1. check if k is an integer greater than 0
+    # 2. check the specified field is a valid categorical field
+
+    if(args.top):
+
+        k = args.top[0]
+        categorical_field = args.top[1].lower()
+        args.top[1] =  categorical_field
+                
+        if(k.isnumeric() == False or int(k) <= 0):
+            
+            raise OLAPError("Error: {} : The first argument for top must be an integer greater than 0.".format(args.input), 6)
+            
+        if(categorical_field not in header_line):
+            
+            raise OLAPError("Error: {}:no field with name \'{}\' found".format(args.input, args.top[1]), 6)
+
+
+    # if the user called group-by
+    # - check that field they requested exists in the input file
+
+    if(args.groupby):
+
+        args.groupby = [field.lower() for field in args.groupby]
+
+        for field in args.groupby:
+
+            if (field not in header_line):
+
+                raise OLAPError("Error: {}:no group-by argument with name \'{}\' found".format(args.input, field), 9)
+
+    if(args.where != None):
+
+        compile_where(args.where, header_line, args.input)
+
+    if(args.top_approx != None):
+
+        if(not args.top or args.groupby or not isinstance(args.top_approx, int) or args.top_approx < 1):
+
+            raise OLAPError("Error: {}: top-approx needs top, can't be combined with group-by and takes a capacity greater than 0".format(args.input), 6)
+
+    if((args.order_by != None or args.limit != None) and not args.groupby):
+
+        raise OLAPError("Error: {}: order-by and limit need group-by".format(args.input), 6)
+
+    if(args.limit != None and (not isinstance(args.limit, int) or args.limit < 1)):
+
+        raise OLAPError("Error: {}: The argument for limit must be an integer greater than 0.".format(args.input), 6)
+
+    if(args.order_by != None):
+
+        # order_by is the name of an aggregate column, optionally followed by the direction
+        order_by = [args.order_by] if isinstance(args.order_by, str) else list(args.order_by)
+        names = ['count' if command == 'count' else aggregate_header(command) for command in command_order if command == 'count' or command[0] != 'top']
+
+        if(len(order_by) not in (1, 2) or not all([isinstance(part, str) for part in order_by]) or order_by[0].lower() not in names
+           or (len(order_by) == 2 and order_by[1].lower() not in ('asc', 'desc'))):
+
+            raise OLAPError("Error: {}: order-by takes the name of an aggregate column of the output, such as count or mean_math score, optionally followed by asc or desc".format(args.input), 6)
+
+        args.order_by = (order_by[0].lower(), order_by[1].lower() if len(order_by) == 2 else 'asc')
+
+    if(args.progress_every != None):
+
+        every = progress_interval(args.progress_every)
+
+        if(every == None or args.memory_limit != None):
+
+            raise OLAPError("Error: {}: progress-every takes a number of rows greater than 0 or a number of seconds such as 10s, and can't be combined with memory-limit".format(args.input), 6)
+
+        args.progress_every = every
+
+    if(args.sample != None or args.sample_rows != None or args.keep_sample):
+
+        if((args.sample == None) == (args.sample_rows == None) or args.memory_limit != None or args.progress_every != None
+           or (args.sample != None and (not isinstance(args.sample, (int, float)) or not 0 < args.sample <= 1))
+           or (args.sample_rows != None and (not isinstance(args.sample_rows, int) or args.sample_rows < 1))):
+
+            raise OLAPError("Error: {}: Either sample, a share of the records greater than 0 and at most 1, or sample-rows, a number of records greater than 0, is needed. They can't be combined with memory-limit or progress-every".format(args.input), 6)
+
+    if(args.memory_limit != None):
+
+        if(not args.groupby or not args.no_cap or args.top or args.order_by != None or not isinstance(args.memory_limit, int) or args.memory_limit < 1):
+
+            raise OLAPError("Error: {}: memory-limit needs group-by and no-cap, can't be combined with top or order-by and takes a number of bytes greater than 0".format(args.input), 6)
+
+        # exact medians, quantiles and distinct counts keep every value of a group, so they can't be bounded
+
+        for command in command_order:
+
+            if(command != 'count' and ((command[0] == 'count_distinct' and command[2] == None) or (command[0] in ('median', 'quantile') and command[3] == None))):
+
+                raise OLAPError("Error: {}: memory-limit needs --quantile-sketch for median and quantile and --distinct-precision for count-distinct".format(args.input), 6)
+
+def query_result(scan_state, command_order, args):
+
+    """
+    Computes the QueryResult of a query from the state returned by scan()
+    """
+
+    (grand_total, categories, total_lines) = scan_state
+
+    # The following decision block decides what functions to call based off of the specified arguments
+        
+    if (args.groupby and args.top):    
+
+        (header, rows) = groupby(categories, command_order, args)
+    
+    elif (args.top and args.top_approx != None):
+
+        (header, rows) = top_approx_result(grand_total[('top_approx', args.top[1], args.top_approx)], int(args.top[0]), args)
+
+    elif (args.top):
+
+        k = args.top[0]
+        k = int(k)
+        categorical_field = args.top[1].lower()
+        cardinality = len(list(categories[args.top[1]].keys()))
+
+        if(cardinality > 20 and k > 20):
+
+            args.warnings.append("Error: {}: {} has been capped at 20 distinct values".format(args.input, categorical_field))
+            header = ["top_" + categorical_field + "_capped"]
+            rows = [[top(categories, 20, categorical_field)]]
+      
+        else:
+
+            header = ["top_" + categorical_field]
+            rows = [[top(categories, k, categorical_field)]]
+    
+    elif(args.groupby):
+
+        (header, rows) = groupby(categories, command_order, args)
+    
+    else:
+
+        if(len(command_order) == 0 or command_order == ['count']):
+
+            header = ['count']
+            rows = [[grand_total['count']]]
+
+        else:
+
+            (header, rows) = total_result(grand_total, command_order, grand_total['count'], args)
+
+    return QueryResult(header, rows, args.warnings)
+
+QUERIES_FILE_KEYS = ('name', 'output', 'aggregates', 'aggs', 'groupby', 'top', 'top_approx', 'where', 'order_by', 'limit')
+
+def read_queries(args):
+
+    """
+    Reads the queries of --queries. Every non-blank line of the file is a JSON object such as
+
+        {"name": "scores by lunch", "groupby": "lunch", "aggregates": ["count", ["mean", "math score"], ["top", 3, "gender"]], "output": "lunch.csv"}
+
+    "aggregates" (or "aggs", as in Dataset.query_many()) lists the aggregates in the order of the output columns, "groupby" (a field or a list of fields) and "name" are optional
+    and "top": [k, field] can be given instead of a top aggregate, with "top_approx": capacity to approximate it. "where" filters the
+    records of the query, and "order_by": [aggregate, "asc" or "desc"] and "limit" order and limit its groups. Without "output" the result is printed to
+    standard output after a line holding "# " and the name of the query. A line with any other key is not a valid query.
+
+    Returns: a list of dictionaries holding the name and output of every query and the keyword arguments
+             of Dataset.query()
+    """
+
+    queries = []
+
+    try:
+
+        with open(args.queries, 'r', encoding="utf-8") as queries_file:
+
+            lines = queries_file.readlines()
+
+    except OSError:
+
+        print("Error: Queries file not found or cannot be read!", end="", file=sys.stderr)
+        exit(6)
+
+    for line_number in range(1, len(lines) + 1):
+
+        line = lines[line_number - 1]
+
+        if(line.strip() == ''):
+
+            continue
+
+        try:
+
+            query = json.loads(line)
+            unknown = [key for key in query if key not in QUERIES_FILE_KEYS]
+
+            if(unknown or ('aggs' in query and 'aggregates' in query)):
+
+                print("Error: {}:{} is not a valid query: unknown key {}".format(args.queries, line_number, ", ".join(unknown) or "aggs next to aggregates"), end="", file=sys.stderr)
+                exit(6)
+
+            queries.append({'name': query.get('name', "query {}".format(line_number)), 'output': query.get('output'),
+                            'aggs': list(query.get('aggregates', query.get('aggs', []))), 'groupby': query.get('groupby'), 'top': query.get('top'),
+                            'top_approx': query.get('top_approx'), 'where': query.get('where'), 'order_by': query.get('order_by'), 'limit': query.get('limit')})
+
+        except (ValueError, TypeError, AttributeError):
+
+            print("Error: {}:{} is not a valid query".format(args.queries, line_number), end="", file=sys.stderr)
+            exit(6)
+
+    return queries
+
+def print_queries(results, queries):
+
+    """
+    Prints the result of every query to its output file, or to standard output after a line naming the query.
+    A query that failed does not stop the queries after it.
+
+    Returns: the exit code of the first query that failed, or 0
+    """
+
+    exit_code = 0
+
+    for i in range(len(queries)):
+
+        if(queries[i]['output'] == None):
+
+            print("# " + queries[i]['name'])
+
+        if(isinstance(results[i], OLAPError)):
+
+            print_error(results[i])
+
+            if(exit_code == 0):
+
+                exit_code = results[i].exit_code
+
+        elif(queries[i]['output'] != None):
+
+            for warning in results[i].warnings:
+
+                print(warning, file=sys.stderr)
+
+            with open(queries[i]['output'], 'w') as output_file:
+
+                output_file.write(results[i].to_csv())
+
+        else:
+
+            print_result(results[i])
+
+    return exit_code
+
+def make_plan(command_order, args):
+
+    """
+    Returns the running state a query needs as a dictionary with
+        'totals': the commands kept in grand_total, only needed when neither group-by nor top was called
+        'groups': for every field in categories, the commands kept in each of its groups
+        'where':  the filter of the query, or None
+        'memory_limit': the bytes of memory the groups may take before they are spilled to disk, or None
+        'sample': ('fraction', share, keep) or ('rows', rows, keep) to read a random sample of the records, see
+                  Sample, keeping it next to the input file if keep is True, or None
+    Groups of the top field only hold their count.
+    The commands of the plan are the commands of the running state, see state_command(), so aggregates that are
+    computed from the same state only keep it once.
+    """
+
+    plan = {'totals': [], 'groups': {}, 'where': args.where, 'memory_limit': args.memory_limit, 'sample': None}
+
+    if(args.sample != None):
+
+        plan['sample'] = ('fraction', args.sample, args.keep_sample)
+
+    elif(args.sample_rows != None):
+
+        plan['sample'] = ('rows', args.sample_rows, args.keep_sample)
+
+    commands = []
+
+    for command in command_order:
+
+        if(command != 'count' and state_command(command) not in commands):
+
+            commands.append(state_command(command))
+
+    # the confidence intervals of the estimates of --progress-every and --sample need the variance of every mean and sum field
+
+    if(args.progress_every != None or plan['sample'] != None):
+
+        for command in command_order:
+
+            if(command != 'count' and command[0] in ('mean', 'sum') and ('variance', command[1]) not in commands):
+
+                commands.append(('variance', command[1]))
+
+    if(args.groupby):
+
+        plan['groups'][group_key(args.groupby)] = commands
+
+    # an approximate top is kept in a heavy hitters sketch in grand_total instead of a group for every value
+
+    if(args.top and args.top_approx != None):
+
+        plan['totals'] = [('top_approx', args.top[1], args.top_approx)]
+
+    elif(args.top and args.top[1] not in plan['groups']):
+
+        plan['groups'][args.top[1]] = []
+
+    if(not args.groupby and not args.top):
+
+        plan['totals'] = commands
+
+    return plan
+
+def state_command(command):
+
+    """
+    Returns the command of the running state an aggregate command is computed from. The maximum, minimum, mean and
+    sum of a field are all computed from its running sum, so they are kept as ('sum', field), and its median and
+    quantiles with the same compression from one running quantile, kept as ('quantile', field, None, compression)
+    """
+
+    if(command != 'count' and command[0] in ('max', 'min', 'mean')):
+
+        return ('sum', command[1])
+
+    if(command != 'count' and command[0] in ('median', 'quantile')):
+
+        return ('quantile', command[1], None, command[3])
+
+    return command
+
+def group_key(fields):
+
+    """
+    Returns the key of the groups of the group-by fields in a plan and in categories: the field name when
+    there is one group-by field, otherwise the tuple of field names. The groups of a tuple of fields
+    are keyed on the tuple of their values.
+    """
+
+    if(len(fields) == 1):
+
+        return fields[0]
+
+    return tuple(fields)
+
+def group_fields(key):
+
+    """
+    Returns the list of field names of a key returned by group_key()
+    """
+
+    if(isinstance(key, tuple)):
+
+        return list(key)
+
+    return [key]
+
+def merge_plans(plans):
+
+    """
+    Returns a plan holding the union of the running state of every plan in plans, so they can be answered
+    by reading the input once. Every plan must have the same scan_key().
+    """
+
+    merged_plan = {'totals': [], 'groups': {}, 'where': plans[0]['where'], 'memory_limit': plans[0]['memory_limit'], 'sample': plans[0]['sample']}
+
+    for plan in plans:
+
+        for command in plan['totals']:
+
+            if(command not in merged_plan['totals']):
+
+                merged_plan['totals'].append(command)
+
+        for field in plan['groups']:
+
+            if(field not in merged_plan['groups']):
+
+                merged_plan['groups'][field] = []
+
+            for command in plan['groups'][field]:
+
+                if(command not in merged_plan['groups'][field]):
+
+                    merged_plan['groups'][field].append(command)
+
+    return merged_plan
+
+def scan_key(plan):
+
+    """
+    Returns the key of the read of the input that answers plan: plans with the same filter, memory limit and
+    sample can be merged by merge_plans() and answered by one read
+    """
+
+    return (plan['where'], plan['memory_limit'], plan['sample'])
+
+# Filters of --where are read by WhereParser into a tree of tuples and compiled into a function of a line:
+#     ('or', [filters]), ('and', [filters]), ('not', filter),
+#     ('=', field, text), ('!=', field, text), ('in', field, [texts]) compare the text of a field,
+#     ('<', field, number), ('<=', ...), ('>', ...), ('>=', ...) compare its numeric value
+
+WHERE_TOKEN = re.compile(r"""\s*(?:(\()|(\))|(,)|(<=|>=|!=|=|<|>)|'((?:[^']|'')*)'|"((?:[^"]|"")*)"|([^\s(),=<>!'"]+))""")
+
+def read_where(where, file_name):
+
+    """
+    Splits a filter into (kind, text) tokens, where kind is one of '(', ')', ',', 'op', 'text' (quoted) and 'word'.
+
+    Raises an OLAPError if the filter can't be split
+    """
+
+    tokens = []
+    position = 0
+    where = where.strip()
+
+    while(position < len(where)):
+
+        match = WHERE_TOKEN.match(where, position)
+
+        if(match == None):
+
+            raise OLAPError("Error: {}: can't read the filter at \'{}\'".format(file_name, where[position:]), 6)
+
+        (open_paren, close_paren, comma, op, single_quoted, double_quoted, word) = match.groups()
+
+        if(open_paren):
+
+            tokens.append(('(', open_paren))
+
+        elif(close_paren):
+
+            tokens.append((')', close_paren))
+
+        elif(comma):
+
+            tokens.append((',', comma))
+
+        elif(op):
+
+            tokens.append(('op', op))
+
+        elif(single_quoted != None):
+
+            tokens.append(('text', single_quoted.replace("''", "'")))
+
+        elif(double_quoted != None):
+
+            tokens.append(('text', double_quoted.replace('""', '"')))
+
+        else:
+
+            tokens.append(('word', word))
+
+        position = match.end()
+
+    return tokens
+
+class WhereParser:
+
+    """
+    Reads a filter such as "lunch = standard AND ('math score' >= 90 OR gender IN (male, other))" into its tree.
+    Field names are not case sensitive and are quoted if they hold spaces. AND binds tighter than OR.
+    """
+
+    def __init__(self, where, header_line, file_name):
+
+        self.where = where
+        self.header_line = header_line
+        self.file_name = file_name
+        self.tokens = read_where(where, file_name)
+        self.position = 0
+
+    def parse(self):
+
+        """
+        Returns the tree of the filter.
+
+        Raises an OLAPError with exit code 8 if a field does not exist, or 6 if the filter is not valid
+        """
+
+        tree = self.parse_or()
+
+        if(self.position != len(self.tokens)):
+
+            raise self.error()
+
+        return tree
+
+    def error(self):
+
+        return OLAPError("Error: {}: \'{}\' is not a valid filter".format(self.file_name, self.where), 6)
+
+    def next_kind(self):
+
+        if(self.position < len(self.tokens)):
+
+            return self.tokens[self.position][0]
+
+        return None
+
+    def next_keyword(self):
+
+        if(self.next_kind() == 'word'):
+
+            return self.tokens[self.position][1].upper()
+
+        return None
+
+    def take(self, kinds):
+
+        if(self.next_kind() not in kinds):
+
+            raise self.error()
+
+        self.position += 1
+
+        return self.tokens[self.position - 1][1]
+
+    def parse_or(self):
+
+        filters = [self.parse_and()]
+
+        while(self.next_keyword() == 'OR'):
+
+            self.position += 1
+            filters.append(self.parse_and())
+
+        return filters[0] if len(filters) == 1 else ('or', filters)
+
+    def parse_and(self):
+
+        filters = [self.parse_not()]
+
+        while(self.next_keyword() == 'AND'):
+
+            self.position += 1
+            filters.append(self.parse_not())
+
+        return filters[0] if len(filters) == 1 else ('and', filters)
+
+    def parse_not(self):
+
+        if(self.next_keyword() == 'NOT'):
+
+            self.position += 1
+
+            return ('not', self.parse_not())
+
+        if(self.next_kind() == '('):
+
+            self.position += 1
+            inner = self.parse_or()
+            self.take((')',))
+
+            return inner
+
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+
+        field = self.take(('word', 'text')).lower()
+
+        if(field not in self.header_line):
+
+            raise OLAPError("Error: {}:no field with name \'{}\' found".format(self.file_name, field), 8)
+
+        if(self.next_keyword() == 'IN'):
+
+            self.position += 1
+            self.take(('(',))
+            values = [self.take(('word', 'text'))]
+
+            while(self.next_kind() == ','):
+
+                self.position += 1
+                values.append(self.take(('word', 'text')))
+
+            self.take((')',))
+
+            return ('in', field, values)
+
+        op = self.take(('op',))
+        value = self.take(('word', 'text'))
+
+        if(op in ('=', '!=')):
+
+            return (op, field, value)
+
+        try:
+
+            return (op, field, float(value))
+
+        except ValueError:
+
+            raise OLAPError("Error: {}: can't compare field \'{}\' with non-numeric value \'{}\'".format(self.file_name, field, value), 6)
+
+COMPARISONS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+def compile_where(where, header_line, file_name=None):
+
+    """
+    Compiles a filter into a function that takes a line and returns True if it matches the filter.
+
+    = and != compare the text of a field and IN checks it against a set of texts, so they suit categorical fields.
+    <, <=, >, >= compare the numeric value of a field, and a line whose value is not numeric does not match.
+    Each comparison only reads its own field, and AND and OR stop at the first comparison that decides the result.
+
+    Raises an OLAPError if the filter is not valid, see WhereParser.parse()
+    """
+
+    field_index = {}
+
+    for i in range(len(header_line)):
+
+        field_index[header_line[i]] = i
+
+    return compile_filter(WhereParser(where, header_line, file_name).parse(), field_index)
+
+def both(first, second):
+
+    return lambda line: first(line) and second(line)
+
+def either(first, second):
+
+    return lambda line: first(line) or second(line)
+
+def compile_filter(tree, field_index):
+
+    """
+    Compiles one node of a filter tree returned by WhereParser.parse()
+    """
+
+    kind = tree[0]
+
+    if(kind in ('and', 'or')):
+
+        matches = compile_filter(tree[1][0], field_index)
+
+        for subtree in tree[1][1:]:
+
+            matches = (both if kind == 'and' else either)(matches, compile_filter(subtree, field_index))
+
+        return matches
+
+    if(kind == 'not'):
+
+        inner = compile_filter(tree[1], field_index)
+
+        return lambda line: not inner(line)
+
+    index = field_index[tree[1]]
+    value = tree[2]
+
+    if(kind == '='):
+
+        return lambda line: line[index] == value
+
+    if(kind == '!='):
+
+        return lambda line: line[index] != value
+
+    if(kind == 'in'):
+
+        values = frozenset(value)
+
+        return lambda line: line[index] in values
+
+    compare = COMPARISONS[kind]
+
+    def compare_number(line):
+
+        try:
+
+            return compare(float(line[index]), value)
+
+        except (ValueError, TypeError):
+
+            return False
+
+    return compare_number
+
+# the kinds of commands whose running aggregates convert every value to a number, see RunningAggregate
+
+NUMERIC_KINDS = ('sum', 'median', 'quantile', 'variance')
+
+def fused_columns(commands, field_index):
+
+    """
+    Splits the aggregate commands of a plan by the way their running aggregates read a value.
+
+    Returns: a tuple containing
+             1. (index, commands) pairs for the commands of NUMERIC_KINDS, one per column, so every value of a line
+                is converted to a number once however many aggregates read it
+             2. (command, index) pairs for the commands whose running aggregates take the text of a value
+    'count' and top commands are left out.
+    """
+
+    numeric_columns = {}
+    value_columns = []
+
+    for command in commands:
+
+        if(command == 'count' or command[0] == 'top'):
+
+            continue
+
+        if(command[0] in NUMERIC_KINDS):
+
+            numeric_columns.setdefault(field_index[command[1]], []).append(command)
+
+        else:
+
+            value_columns.append((command, field_index[command[1]]))
+
+    return (list(numeric_columns.items()), value_columns)
+
+def scan(csv_reader, header_line, plan, current_line=2):
+
+    """
+    Reads every line from csv_reader and folds it into new running state.
+
+    current_line is the line number of the first line read, used in non-numeric error messages.
+
+    Returns: a tuple containing
+             1. grand_total, the running aggregates used when neither group-by nor top was called
+             2. categories, the running state of every group of the group-by and top fields
+             3. the number of lines read, including lines rejected by the filter of the plan.
+                grand_total['count'] is the number of lines that matched it
+    """
+
+    # field_index maps every lowercase field name to its position in a line, so the columns used by
+    # the query are resolved once here instead of building a dictionary for every line
+
+    field_index = {}
+
+    for i in range(len(header_line)):
+
+        field_index[header_line[i]] = i
+
+    # Categories is the main dictionary that holds all of the information required to perform the necessary aggregate calculations
+    # categories[field][value] is the running state of one group: its row count plus one running aggregate
+    # object per command, so memory grows with the number of groups rather than the number of rows
+
+    categories = {}
+    grand_total = {'count': 0}
+
+    for field in plan['groups']:
+
+        categories[field] = {}
+
+    # grand_total is only printed when neither group-by nor top was called, so it only holds running
+    # aggregates in that case
+
+    for command in plan['totals']:
+
+        grand_total[command] = new_aggregate(command)
+
+    # the positions of the columns each part of the query reads, so a line only has to convert those columns
+    # numeric_totals holds (index, running aggregates) pairs for the aggregates of grand_total that take numbers,
+    # so every value is converted once however many of them read it, and value_totals holds
+    # (running aggregate, index) pairs for the ones that take the text of a value, see fused_columns()
+
+    (numeric_columns, value_columns) = fused_columns(grand_total, field_index)
+    numeric_totals = [(index, [grand_total[command] for command in commands]) for (index, commands) in numeric_columns]
+    value_totals = [(grand_total[command], index) for (command, index) in value_columns]
+
+    # the fields groups and top counts are keyed on are dictionary encoded while the lines are read: a value gets
+    # an integer code the first time it is seen, in the same order groups are first seen. Groups are kept in lists
+    # indexed by code and top counts are keyed by code, so each value is only hashed once per line however many
+    # groups use it. The codes are decoded back to values once every line has been read.
+    # encoded_columns holds (encoder, index) pairs, where encoder maps every value of the field to its code,
+    # and encoded_position maps every encoded field to the position of its code in the codes of a line
+
+    encoded_columns = []
+    encoded_position = {}
+
+    for field in categories:
+
+        names = group_fields(field)
+
+        for command in new_group(field, plan):
+
+            if(command != 'count' and command[0] == 'top'):
+
+                names.append(command[1])
+
+        for name in names:
+
+            if(name not in encoded_position):
+
+                encoded_position[name] = len(encoded_columns)
+                encoded_columns.append(({}, field_index[name]))
+
+    # group_columns holds (groups, positions, combinations, field, numeric_commands, value_commands, top_commands) for every
+    # field in categories, where
+    # - groups is the list of groups indexed by group code
+    # - positions is the position of the code of the field in the codes of a line, or the list of positions of
+    #   the codes of a tuple of group-by fields. combinations then maps every tuple of codes to its group code
+    # - numeric_commands holds (index, commands) pairs and value_commands holds (command, index) pairs for the
+    #   running aggregates kept in each group, as returned by fused_columns(), and top_commands holds
+    #   (command, position) pairs for the top counts
+
+    group_columns = []
+
+    for field in categories:
+
+        (numeric_commands, value_commands) = fused_columns(plan['groups'][field], field_index)
+        top_commands = []
+
+        for command in plan['groups'][field]:
+
+            if(command[0] == 'top'):
+
+                top_commands.append((command, encoded_position[command[1]]))
+
+        if(isinstance(field, tuple)):
+
+            group_columns.append(([], [encoded_position[name] for name in field], {}, field, numeric_commands, value_commands, top_commands))
+
+        else:
+
+            group_columns.append(([], encoded_position[field], None, field, numeric_commands, value_commands, top_commands))
+
+    header_length = len(header_line)
+
+    # total_lines tracks the number of lines read
+    # current_line tracks where we are at the file. since the first line of the file is headers,
+    # the actual data starts on line 2 of the file
+
+    total_lines = 0
+    matched_lines = 0
+
+    # the filter is compiled once into a function of a line that only looks at the fields it compares
+    matches = compile_where(plan['where'], header_line) if plan['where'] != None else None
+
+    # read in a line from the csv reader, represented as a list of values
+    for line in csv_reader:
+
+        # blank lines are skipped and are not counted as lines of data
+        if(not line):
+
+            continue
+
+        # missing values at the end of a short line are read as None
+        if(len(line) < header_length):
+
+            line = line + [None] * (header_length - len(line))
+
+        # lines rejected by the filter still count towards the line numbers of later lines
+        if(matches != None and not matches(line)):
+
+            total_lines += 1
+            current_line += 1
+            continue
+
+        matched_lines += 1
+
+        # fold the line into grand_total, which is used to perform calculations in the event the
+        # user only enters --input <some_file> or --input <some_file> --count
+
+        for (index, states) in numeric_totals:
+
+            value = line[index]
+
+            try:
+
+                number = float(value)
+
+            except (TypeError, ValueError):
+
+                for state in states:
+
+                    state.add_non_numeric(current_line, value)
+
+                continue
+
+            for state in states:
+
+                state.add(number)
+
+        for (state, index) in value_totals:
+
+            state.update(current_line, line[index])
+
+        line_codes = []
+
+        for (encoder, index) in encoded_columns:
+
+            value = line[index]
+            code = encoder.get(value)
+
+            if(code == None):
+
+                code = len(encoder)
+                encoder[value] = code
+
+            line_codes.append(code)
+
+        # The following block of code updates the running state of every group the line belongs to
+        # Data stored in categories is used to perform calculations based on the specified aggregates
+
+        for (groups, positions, combinations, field, numeric_commands, value_commands, top_commands) in group_columns:
+
+            if(combinations == None):
+
+                code = line_codes[positions]
+
+            else:
+
+                combination = tuple([line_codes[position] for position in positions])
+                code = combinations.get(combination)
+
+                if(code == None):
+
+                    code = len(combinations)
+                    combinations[combination] = code
+
+            # every line is folded into the groups of every field, so a new code is always the next group
+            if(code == len(groups)):
+
+                groups.append(new_group(field, plan))
+
+            group = groups[code]
+            group['count'] += 1
+
+            for (command, position) in top_commands:
+
+                top_counts = group[command]
+                top_code = line_codes[position]
+                top_counts[top_code] = top_counts.get(top_code, 0) + 1
+
+            for (index, commands) in numeric_commands:
+
+                value = line[index]
+
+                try:
+
+                    number = float(value)
+
+                except (TypeError, ValueError):
+
+                    for command in commands:
+
+                        group[command].add_non_numeric(current_line, value)
+
+                    continue
+
+                for command in commands:
+
+                    group[command].add(number)
+
+            for (command, index) in value_commands:
+
+                group[command].update(current_line, line[index])
+
+        total_lines += 1
+        current_line += 1
+
+    grand_total['count'] = matched_lines
+
+    # decode the group codes and top counts back to the values they stand for
+
+    values = []
+
+    for (encoder, index) in encoded_columns:
+
+        values.append(list(encoder))
+
+    for (groups, positions, combinations, field, numeric_commands, value_commands, top_commands) in group_columns:
+
+        if(combinations == None):
+
+            keys = values[positions]
+
+        else:
+
+            keys = []
+
+            for combination in combinations:
+
+                keys.append(tuple([values[positions[i]][combination[i]] for i in range(len(positions))]))
+
+        for code in range(len(groups)):
+
+            group = groups[code]
+
+            for (command, position) in top_commands:
+
+                top_counts = {}
+
+                for top_code in group[command]:
+
+                    top_counts[values[position][top_code]] = group[command][top_code]
+
+                group[command] = top_counts
+
+            categories[field][keys[code]] = group
+
+    return (grand_total, categories, total_lines)
+
+def read_byte_range(file_name, start, end):
+
+    """
+    Yields the decoded lines of file_name that start at a byte offset from start up to, but not including, end.
+    start must be the offset of the beginning of a line.
+    """
+
+    with open(file_name, 'rb') as input_file:
+
+        input_file.seek(start)
+        position = start
+
+        for raw_line in input_file:
+
+            if(position >= end):
+
+                break
+
+            position += len(raw_line)
+
+            yield raw_line.decode("utf-8")
+
+def scan_chunk(file_name, start, end, header_line, plan):
+
+    """
+    Runs scan() over one byte range of the input file in a worker process.
+    Line numbers in the returned state are relative to the start of the chunk and are fixed up by merge_scan().
+    """
+
+    return scan(csv.reader(read_byte_range(file_name, start, end)), header_line, plan, current_line=0)
+
+def count_quotes(file_name, start, end):
+
+    """
+    Returns the number of double quotes in file_name from the byte offset start up to, but not including, end
+    """
+
+    quotes = 0
+
+    with open(file_name, 'rb') as input_file:
+
+        input_file.seek(start)
+
+        while(start < end):
+
+            block = input_file.read(min(INPUT_CHUNK, end - start))
+
+            if(not block):
+
+                break
+
+            quotes += block.count(b'"')
+            start += len(block)
+
+    return quotes
+
+def chunk_offsets(file_name, workers):
+
+    """
+    Splits the lines after the header of file_name into at most workers byte ranges of about the same size.
+    Every range starts at the beginning of a line.
+
+    Returns: a list of (start, end) tuples
+    """
+
+    with open(file_name, 'rb') as input_file:
+
+        input_file.readline()
+        data_start = input_file.tell()
+        file_size = os.fstat(input_file.fileno()).st_size
+
+        offsets = [data_start]
+
+        for i in range(1, workers):
+
+            input_file.seek(max(data_start + (file_size - data_start) * i // workers - 1, offsets[-1]))
+            input_file.readline()
+            offsets.append(max(input_file.tell(), offsets[-1]))
+
+        offsets.append(file_size)
+
+    chunks = []
+
+    for i in range(len(offsets) - 1):
+
+        if(offsets[i] < offsets[i + 1]):
+
+            chunks.append((offsets[i], offsets[i + 1]))
+
+    return chunks
+
+def merge_group(group, other_group, line_offset):
+
+    """
+    Adds the running state of other_group into group.
+    """
+
+    group['count'] += other_group['count']
+
+    for command in other_group:
+
+        if(command == 'count'):
+
+            continue
+
+        if(command[0] == 'top'):
+
+            for value in other_group[command]:
+
+                group[command][value] = group[command].get(value, 0) + other_group[command][value]
+
+        else:
+
+            group[command].merge(other_group[command], line_offset)
+
+def merge_scan(scan_state, other_state, line_offset, plan):
+
+    """
+    Adds the state returned by scan() for a later part of the file into scan_state.
+
+    line_offset is added to the line numbers recorded in other_state. Groups are merged in the order
+    they were first seen so the output is the same as reading the whole file in one pass.
+    """
+
+    (grand_total, categories, total_lines) = scan_state
+    (other_total, other_categories, other_lines) = other_state
+
+    for command in other_total:
+
+        if(command != 'count'):
+
+            grand_total[command].merge(other_total[command], line_offset)
+
+    for field in other_categories:
+
+        for value in other_categories[field]:
+
+            if(value not in categories[field]):
+
+                categories[field][value] = new_group(field, plan)
+
+            merge_group(categories[field][value], other_categories[field][value], line_offset)
+
+    total_lines += other_lines
+    grand_total['count'] += other_total['count']
+
+    return (grand_total, categories, total_lines)
+
+def progress_scan(csv_reader, header_line, plan, progress):
+
+    """
+    Reads every line from csv_reader like scan(), in segments of progress.segment_rows() lines whose state is
+    merged into the state of the lines before them, so progress can report running estimates after every
+    segment. The result is the same as reading the lines in one scan().
+    """
+
+    scan_state = scan([], header_line, plan)
+    segment_rows = progress.segment_rows()
+
+    while(True):
+
+        first_line = next(csv_reader, None)
+
+        if(first_line == None):
+
+            break
+
+        segment = itertools.chain([first_line], itertools.islice(csv_reader, segment_rows - 1))
+        scan_state = merge_scan(scan_state, scan(segment, header_line, plan, scan_state[2] + 2), 0, plan)
+        progress.update(scan_state)
+
+    return scan_state
+
+def parallel_scan(file_name, header_line, plan, workers):
+
+    """
+    Reads the input file in workers processes, each scanning one range of lines, and merges their state
+    in file order. Returns the same tuple as scan(), or None if a range would start inside a quoted value.
+    """
+
+    chunks = chunk_offsets(file_name, workers)
+
+    # the merged state starts out as the state of an empty file
+    scan_state = scan([], header_line, plan)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+
+        # a line starts a record only if an even number of quotes comes before it, since quoted values can hold
+        # line breaks and every escaped quote is doubled. The quotes are counted before any range is scanned, as
+        # a range that starts inside a quoted value may fail or count the wrong records.
+        ranges = [(0, chunks[0][0])] + chunks if chunks else []
+        quote_counts = list(executor.map(count_quotes, [file_name] * len(ranges), [start for (start, end) in ranges], [end for (start, end) in ranges]))
+
+        for i in range(2, len(ranges)):
+
+            if(sum(quote_counts[:i]) % 2 != 0):
+
+                return None
+
+        futures = []
+
+        for (start, end) in chunks:
+
+            futures.append(executor.submit(scan_chunk, file_name, start, end, header_line, plan))
+
+        for future in futures:
+
+            # the first line of data is line 2 of the file
+            scan_state = merge_scan(scan_state, future.result(), scan_state[2] + 2, plan)
+
+    return scan_state
+
+def input_files(file_name):
+
+    """
+    Returns the files of a directory, including its subdirectories, or of a glob pattern, sorted by name.
+    Only files with .csv in their name are read from a directory, e.g. day.csv or day.csv.gz.
+
+    Returns: the list of files, or None if file_name is one file
+
+    Raises an OLAPError if the directory or pattern holds no files
+    """
+
+    if(os.path.isdir(file_name)):
+
+        files = []
+
+        for (directory, subdirectories, names) in os.walk(file_name):
+
+            subdirectories.sort()
+
+            for name in sorted(names):
+
+                if(name.endswith(".csv") or ".csv." in name):
+
+                    files.append(os.path.join(directory, name))
+
+    elif(re.search(r"[*?[]", file_name) and not os.path.exists(file_name)):
+
+        files = sorted([name for name in glob.glob(file_name, recursive=True) if os.path.isfile(name)])
+
+    else:
+
+        return None
+
+    if(len(files) == 0):
+
+        raise OLAPError("Error: No csv files found in {}".format(file_name), 6)
+
+    return files
+
+def partition_values(files):
+
+    """
+    Returns the partition fields of files and the value of every field for every file. A directory named
+    field=value in the path of a file, such as data/dt=2026-10-01/part.csv, gives the file that value of field.
+    Files without some field get an empty value.
+    """
+
+    fields = []
+    file_partitions = []
+
+    for file_name in files:
+
+        partitions = {}
+
+        for directory in os.path.dirname(file_name).split(os.sep):
+
+            if("=" in directory):
+
+                (field, value) = directory.split("=", 1)
+                partitions[field.lower()] = value
+
+                if(field.lower() not in fields):
+
+                    fields.append(field.lower())
+
+        file_partitions.append(partitions)
+
+    values = []
+
+    for partitions in file_partitions:
+
+        values.append([partitions.get(field, "") for field in fields])
+
+    return (fields, values)
+
+def partition_match(tree, partition_index, values):
+
+    """
+    Checks a filter tree returned by WhereParser.parse() against the partition values of a file.
+    partition_index maps every partition field to its position in values.
+
+    Returns: True or False if the comparisons on partition fields decide the filter for every line of the file,
+             otherwise None
+    """
+
+    kind = tree[0]
+
+    if(kind in ('and', 'or')):
+
+        matches = [partition_match(subtree, partition_index, values) for subtree in tree[1]]
+        decisive = (kind == 'or')
+
+        if(decisive in matches):
+
+            return decisive
+
+        return (not decisive) if None not in matches else None
+
+    if(kind == 'not'):
+
+        match = partition_match(tree[1], partition_index, values)
+
+        return None if match == None else not match
+
+    if(tree[1] not in partition_index):
+
+        return None
+
+    return compile_filter(tree, partition_index)(values)
+
+def scan_partitions(partitions, fields, header_line, plan, workers):
+
+    """
+    Reads a list of (file name, partition values) as one table, whose header line is the header line of the
+    files followed by the partition fields in fields, and returns the same tuple as scan().
+
+    Files whose partition values don't match the filter of the plan are skipped without opening them. The other
+    files must have the same header line as the first file. They are read by up to workers processes and their
+    states are merged in the order of the files, so line numbers count the lines of the files as if they were
+    one file with one header line. Non-numeric values are reported with their own file and line number.
+
+    Raises an OLAPError if the header line of a file does not match
+    """
+
+    file_header = header_line[:len(header_line) - len(fields)]
+    partition_index = {}
+
+    for i in range(len(fields)):
+
+        partition_index[fields[i]] = i
+
+    if(plan['where'] != None):
+
+        tree = WhereParser(plan['where'], header_line, None).parse()
+        partitions = [(file_name, values) for (file_name, values) in partitions if partition_match(tree, partition_index, values) != False]
+
+    for (file_name, values) in partitions:
+
+        if(read_header(file_name) != file_header):
+
+            raise OLAPError("Error: {}: the header line does not match the header line of the other files".format(file_name), 6)
+
+    scan_state = scan([], header_line, plan)
+
+    if(workers and workers > 1 and len(partitions) > 1):
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(partitions))) as executor:
+
+            futures = []
+
+            for (file_name, values) in partitions:
+
+                futures.append(executor.submit(scan_partition, file_name, values, header_line, plan))
+
+            for future in futures:
+
+                scan_state = merge_scan(scan_state, future.result(), scan_state[2] + 2, plan)
+
+    else:
+
+        for (file_name, values) in partitions:
+
+            scan_state = merge_scan(scan_state, scan_partition(file_name, values, header_line, plan), scan_state[2] + 2, plan)
+
+    return scan_state
+
+def scan_partition(file_name, values, header_line, plan):
+
+    """
+    Runs scan() over one file of scan_partitions(), adding its partition values to every line.
+    Line numbers in the returned state start at 0 and are fixed up by merge_scan(). The non-numeric values also
+    keep file_name and their line number in it, which merge_scan() leaves as they are.
+    """
+
+    file_width = len(header_line) - len(values)
+
+    with open_input(file_name) as input_file:
+
+        csv_reader = csv.reader(input_file)
+        next(csv_reader, None)
+
+        if(values):
+
+            csv_reader = partition_lines(csv_reader, file_width, values)
+
+        scan_state = scan(csv_reader, header_line, plan, current_line=0)
+
+    (grand_total, categories, total_lines) = scan_state
+
+    for container in [grand_total] + [group for field in categories for group in categories[field].values()]:
+
+        for command in container:
+
+            if(command != 'count' and hasattr(container[command], 'non_numeric')):
+
+                # the first line of data is line 2 of the file
+                container[command].non_numeric = [(line_number, value, file_name, line_number + 2) for (line_number, value) in container[command].non_numeric]
+
+    return scan_state
+
+def partition_lines(csv_reader, file_width, values):
+
+    """
+    Yields every line of csv_reader followed by the partition values. Short lines are padded with None, like
+    scan() does, so the values stay in their fields.
+    """
+
+    for line in csv_reader:
+
+        if(len(line) != file_width):
+
+            line = line[:file_width] + [None] * (file_width - len(line))
+
+        yield line + values
+
+# The state file of --state keeps the running state of every plan it was used with, in JSON, together with the
+# byte offset of the end of the last line that was read and a hash of every byte of the file up to that offset
+
+STATE_VERSION = 3
+
+def incremental_scan(file_name, header_line, plan, state_file):
+
+    """
+    Reads only the lines appended to file_name since the state of plan was last saved to state_file, merges them
+    into the saved state and saves it again. The whole file is read if there is no saved state for the plan, or if
+    the file was truncated or rewritten since. Returns the same tuple as scan().
+
+    A last line without a line break may not be completely written yet, so it is added to the returned state but
+    not saved.
+    """
+
+    states = read_state(state_file, header_line)
+    plan_key = json.dumps([plan['totals'], list(plan['groups'].items()), plan['where']])
+
+    with open(file_name, 'rb') as input_file:
+
+        input_file.readline()
+        data_start = input_file.tell()
+        file_size = os.fstat(input_file.fileno()).st_size
+        end = line_end(input_file, data_start, file_size)
+        saved = states.get(plan_key)
+
+        # a rewrite can change any byte, so the whole saved part is hashed, and the hash goes on over the new
+        # lines so the file is only read once. Hashing is much faster than parsing the lines again.
+        hashed = saved['offset'] if saved != None and data_start <= saved['offset'] <= end else 0
+        content_hash = update_hash(hashlib.blake2b(digest_size=16), input_file, 0, hashed)
+
+        if(hashed != 0 and saved['hash'] == content_hash.hexdigest()):
+
+            (scan_state, start) = (state_from_json(saved['state'], plan), saved['offset'])
+
+        else:
+
+            (scan_state, start) = (scan([], header_line, plan), data_start)
+
+        end_hash = update_hash(content_hash, input_file, hashed, end).hexdigest()
+
+    # like the chunks of parallel_scan(), the new lines are numbered from 0 and moved after the saved lines
+
+    new_state = scan(csv.reader(read_byte_range(file_name, start, end)), header_line, plan, current_line=0)
+    scan_state = merge_scan(scan_state, new_state, scan_state[2] + 2, plan)
+    states[plan_key] = {'offset': end, 'hash': end_hash, 'state': state_to_json(scan_state)}
+    write_state(state_file, header_line, states)
+
+    if(end < file_size):
+
+        last_line = scan(csv.reader(read_byte_range(file_name, end, file_size)), header_line, plan, current_line=0)
+        scan_state = merge_scan(scan_state, last_line, scan_state[2] + 2, plan)
+
+    return scan_state
+
+def update_hash(content_hash, input_file, start, end):
+
+    """
+    Adds the bytes of an open file from the offset start up to, but not including, end to content_hash.
+    Returns: content_hash
+    """
+
+    input_file.seek(start)
+
+    while(start < end):
+
+        block = input_file.read(min(INPUT_CHUNK, end - start))
+
+        if(not block):
+
+            break
+
+        content_hash.update(block)
+        start += len(block)
+
+    return content_hash
+
+def line_end(input_file, start, end):
+
+    """
+    Returns the offset after the last line break between start and end of an open file, or start if there is none
+    """
+
+    position = end
+
+    while(position > start):
+
+        block_start = max(start, position - HASH_BLOCK)
+        input_file.seek(block_start)
+        block = input_file.read(position - block_start)
+        line_break = block.rfind(b"\n")
+
+        if(line_break >= 0):
+
+            return block_start + line_break + 1
+
+        position = block_start
+
+    return start
+
+def read_state(state_file, header_line):
+
+    """
+    Returns the saved states of state_file by plan, or no states if it does not exist, can't be read or was
+    saved for a file with another header
+    """
+
+    try:
+
+        with open(state_file, 'r', encoding="utf-8") as input_file:
+
+            state = json.load(input_file)
+
+        if(state['version'] == STATE_VERSION and state['header'] == header_line):
+
+            return state['plans']
+
+    except (OSError, ValueError, KeyError, TypeError):
+
+        pass
+
+    return {}
+
+def write_state(state_file, header_line, states):
+
+    """
+    Writes the states by plan to state_file, replacing it only once it is completely written
+    """
+
+    temporary_name = state_file + ".tmp{}".format(os.getpid())
+
+    try:
+
+        with open(temporary_name, 'w', encoding="utf-8") as output_file:
+
+            json.dump({'version': STATE_VERSION, 'header': header_line, 'plans': states}, output_file)
+
+        os.replace(temporary_name, state_file)
+
+    except OSError:
+
+        if(os.path.exists(temporary_name)):
+
+            os.remove(temporary_name)
+
+        raise OLAPError("Error: The state file {} could not be written".format(state_file), 6)
+
+def state_to_json(scan_state):
+
+    """
+    Returns the state returned by scan() as lists that can be written as JSON.
+    Commands, fields and group values that are tuples are written as lists.
+    """
+
+    (grand_total, categories, total_lines) = scan_state
+    totals = []
+    json_categories = []
+
+    for command in grand_total:
+
+        if(command != 'count'):
+
+            totals.append([command, grand_total[command].to_json()])
+
+    for field in categories:
+
+        groups = []
+
+        for value in categories[field]:
+
+            groups.append(group_to_json(value, categories[field][value]))
+
+        json_categories.append([field, groups])
+
+    return {'count': grand_total['count'], 'totals': totals, 'categories': json_categories, 'lines': total_lines}
+
+def group_to_json(value, group):
+
+    """
+    Returns the group of value as a list [value, count, [[command, state], ...]] that can be written as JSON
+    """
+
+    group_states = []
+
+    for command in group:
+
+        if(command != 'count'):
+
+            group_states.append([command, group[command] if command[0] == 'top' else group[command].to_json()])
+
+    return [value, group['count'], group_states]
+
+def group_from_json(count, group_states):
+
+    """
+    Returns the group written by group_to_json() from its count and the states of its commands
+    """
+
+    group = {'count': count}
+
+    for (command, aggregate) in group_states:
+
+        command = json_key(command)
+        group[command] = aggregate if command[0] == 'top' else AGGREGATE_KINDS[aggregate['kind']].from_json(aggregate)
+
+    return group
+
+def json_key(key):
+
+    return tuple(key) if isinstance(key, list) else key
+
+def state_from_json(state, plan):
+
+    """
+    Returns the state written by state_to_json() in the form returned by scan()
+    """
+
+    grand_total = {'count': state['count']}
+    categories = {}
+
+    for (command, aggregate) in state['totals']:
+
+        grand_total[json_key(command)] = AGGREGATE_KINDS[aggregate['kind']].from_json(aggregate)
+
+    for field in plan['groups']:
+
+        categories[field] = {}
+
+    for (field, groups) in state['categories']:
+
+        for (value, count, group_states) in groups:
+
+            categories[json_key(field)][json_key(value)] = group_from_json(count, group_states)
+
+    return (grand_total, categories, state['lines'])
+
+# --memory-limit keeps the groups of a group-by in memory until their estimated size reaches the limit. They are
+# then written to a temporary file as one run of JSON lines sorted by group value, and the scan goes on with no
+# groups in memory. The runs are merged by group value when the rows are output, so they come out sorted.
+# The memory of the groups is estimated every SPILL_CHECK_GROUPS new groups from the size of SPILL_SAMPLE of them,
+# and runs are merged into one whenever there are more than MAX_SPILL_RUNS, to bound the number of open files.
+
+SPILL_CHECK_GROUPS = 1024
+SPILL_SAMPLE = 32
+MAX_SPILL_RUNS = 64
+
+def spill_scan(csv_reader, header_line, plan, memory_limit, current_line=2):
+
+    """
+    Reads every line from csv_reader like scan(), but keeps the groups of every field in a SpilledGroups, which
+    writes them to temporary files whenever the estimated memory of the groups held in memory reaches
+    memory_limit bytes. The plan must not hold totals or top.
+
+    Returns: the state returned by scan(), where categories maps every field to its SpilledGroups
+    """
+
+    field_index = {}
+
+    for i in range(len(header_line)):
+
+        field_index[header_line[i]] = i
+
+    categories = {}
+
+    # group_columns holds (groups, indexes, numeric_commands, value_commands) for every field in categories, where
+    # indexes is the index of the group-by field or the list of the indexes of a tuple of group-by fields
+
+    group_columns = []
+
+    for field in plan['groups']:
+
+        categories[field] = SpilledGroups(field, plan)
+        indexes = [field_index[name] for name in field] if isinstance(field, tuple) else field_index[field]
+        (numeric_commands, value_commands) = fused_columns(plan['groups'][field], field_index)
+        group_columns.append((categories[field], indexes, numeric_commands, value_commands))
+
+    header_length = len(header_line)
+    total_lines = 0
+    matched_lines = 0
+    new_groups = 0
+    matches = compile_where(plan['where'], header_line) if plan['where'] != None else None
+
+    for line in csv_reader:
+
+        if(not line):
+
+            continue
+
+        if(len(line) < header_length):
+
+            line = line + [None] * (header_length - len(line))
+
+        if(matches != None and not matches(line)):
+
+            total_lines += 1
+            current_line += 1
+            continue
+
+        matched_lines += 1
+
+        for (spilled, indexes, numeric_commands, value_commands) in group_columns:
+
+            key = tuple([line[index] for index in indexes]) if isinstance(indexes, list) else line[indexes]
+            group = spilled.groups.get(key)
+
+            if(group == None):
+
+                group = new_group(spilled.field, plan)
+                spilled.groups[key] = group
+                new_groups += 1
+
+            group['count'] += 1
+
+            for (index, commands) in numeric_commands:
+
+                value = line[index]
+
+                try:
+
+                    number = float(value)
+
+                except (TypeError, ValueError):
+
+                    for command in commands:
+
+                        group[command].add_non_numeric(current_line, value)
+
+                    continue
+
+                for command in commands:
+
+                    group[command].add(number)
+
+            for (command, index) in value_commands:
+
+                group[command].update(current_line, line[index])
+
+        total_lines += 1
+        current_line += 1
+
+        if(new_groups >= SPILL_CHECK_GROUPS):
+
+            new_groups = 0
+
+            if(sum([spilled.memory() for spilled in categories.values()]) >= memory_limit):
+
+                for spilled in categories.values():
+
+                    spilled.spill()
+
+    return ({'count': matched_lines}, categories, total_lines)
+
+def object_size(value):
+
+    """
+    Returns an estimate of the bytes of memory held by value, following the attributes of objects and the items
+    of dictionaries, lists and tuples
+    """
+
+    size = sys.getsizeof(value)
+
+    if(hasattr(value, '__dict__')):
+
+        return size + object_size(value.__dict__)
+
+    if(isinstance(value, dict)):
+
+        return size + sum([object_size(key) + object_size(item) for (key, item) in value.items()])
+
+    if(isinstance(value, (list, tuple))):
+
+        return size + sum([object_size(item) for item in value])
+
+    return size
+
+def read_run(run):
+
+    """
+    Yields the (value, group) pairs of a run written by SpilledGroups.spill()
+    """
+
+    run.seek(0)
+
+    for line in run:
+
+        (value, count, group_states) = json.loads(line)
+
+        yield (json_key(value), group_from_json(count, group_states))
+
+def merge_runs(runs):
+
+    """
+    Merges iterators of (value, group) pairs sorted by value into one, adding up the groups of the same value.
+    Groups of the same value are merged in the order of runs, which is the order of their lines.
+    """
+
+    current = None
+
+    for (value, group) in heapq.merge(*runs, key=operator.itemgetter(0)):
+
+        if(current != None and current[0] == value):
+
+            merge_group(current[1], group, 0)
+
+        else:
+
+            if(current != None):
+
+                yield current
+
+            current = (value, group)
+
+    if(current != None):
+
+        yield current
+
+class SpilledGroups:
+
+    """
+    The groups of one group-by field read by spill_scan().
+
+    groups holds the groups read since the last spill, keyed by group value like categories[field], and runs
+    holds the temporary files the earlier groups were spilled to. non_numeric counts the non-numeric values
+    of every command in the spilled groups.
+    """
+
+    def __init__(self, field, plan):
+
+        self.field = field
+        self.plan = plan
+        self.groups = {}
+        self.runs = []
+        self.non_numeric = {}
+
+    def memory(self):
+
+        """
+        Returns the estimated bytes of memory held by the groups in memory
+        """
+
+        if(not self.groups):
+
+            return 0
+
+        sample = list(itertools.islice(self.groups.items(), SPILL_SAMPLE))
+        group_size = sum([object_size(key) + object_size(group) for (key, group) in sample]) / len(sample)
+
+        return sys.getsizeof(self.groups) + len(self.groups) * group_size
+
+    def spill(self):
+
+        """
+        Writes the groups in memory to a new run sorted by group value and removes them from memory
+        """
+
+        if(not self.groups):
+
+            return
+
+        run = tempfile.TemporaryFile('w+', encoding="utf-8")
+
+        for value in sorted(self.groups):
+
+            self.count_non_numeric(self.groups[value], self.non_numeric)
+            run.write(json.dumps(group_to_json(value, self.groups[value])) + "\n")
+
+        self.runs.append(run)
+        self.groups = {}
+
+        if(len(self.runs) > MAX_SPILL_RUNS):
+
+            merged_run = tempfile.TemporaryFile('w+', encoding="utf-8")
+
+            for (value, group) in merge_runs([read_run(run) for run in self.runs]):
+
+                merged_run.write(json.dumps(group_to_json(value, group)) + "\n")
+
+            for run in self.runs:
+
+                run.close()
+
+            self.runs = [merged_run]
+
+    def count_non_numeric(self, group, non_numeric):
+
+        """
+        Adds the number of non-numeric values of every command of group to non_numeric
+        """
+
+        for command in group:
+
+            if(command != 'count' and hasattr(group[command], 'non_numeric_count')):
+
+                non_numeric[command] = non_numeric.get(command, 0) + group[command].non_numeric_count
+
+    def non_numeric_counts(self):
+
+        """
+        Returns the number of non-numeric values of every command across all groups
+        """
+
+        non_numeric = dict(self.non_numeric)
+
+        for group in self.groups.values():
+
+            self.count_non_numeric(group, non_numeric)
+
+        return non_numeric
+
+    def items(self):
+
+        """
+        Yields the (value, group) pair of every group sorted by value, merging the runs with the groups in memory.
+        The groups can only be read once, since merging them changes the groups in memory.
+        """
+
+        in_memory = [(value, self.groups[value]) for value in sorted(self.groups)]
+
+        try:
+
+            yield from merge_runs([read_run(run) for run in self.runs] + [iter(in_memory)])
+
+        finally:
+
+            for run in self.runs:
+
+                run.close()
+
+# The columnar cache of an input file is stored next to it as <input file>.olapcache
+# Layout: CACHE_MAGIC, the length of the metadata as an 8 byte little-endian integer, the metadata as JSON,
+# then the column arrays, each starting at a multiple of 8 bytes from the start of the data section
+
+CACHE_SUFFIX = ".olapcache"
+CACHE_MAGIC = b"OLAPCACHE2"
+
+# Columns are dictionary encoded as 32 bit codes. Once a column has more than CATEGORICAL_LIMIT distinct values
+# it is stored as float64 values with a validity bitmap instead, if at least NUMERIC_SHARE of those values are numeric
+
+CATEGORICAL_LIMIT = 65536
+NUMERIC_SHARE = 0.99
+
+# Every block of ZONE_ROWS rows has a zone map so filters can skip blocks: the codes present in the block for
+# dictionary encoded columns with at most ZONE_CODES_LIMIT distinct values, and the lowest and highest value
+# for numeric columns. Bitmap indexes hold one bitmap of rows per code and are only built for dictionary encoded
+# columns with at most INDEX_LIMIT distinct values
+
+ZONE_ROWS = 16384
+ZONE_CODES_LIMIT = 1024
+INDEX_LIMIT = 4096
+
+# the positions of the set bits of every byte, used to list the rows of a selection
+BYTE_BITS = [[bit for bit in range(8) if byte >> bit & 1] for byte in range(256)]
+
+# The content hash covers HASH_BLOCK bytes at the start and end of the file and at HASH_SAMPLES places in between
+
+HASH_BLOCK = 65536
+HASH_SAMPLES = 16
+
+def file_fingerprint(file_name):
+
+    """
+    Returns a dictionary with the size, modification time and a hash of sampled blocks of file_name.
+    A cache is only used if the fingerprint stored in it matches the fingerprint of the input file.
+    """
+
+    file_stat = os.stat(file_name)
+
+    with open(file_name, 'rb') as input_file:
+
+        content_hash = sampled_hash(input_file, file_stat.st_size)
+
+    return {'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns, 'hash': content_hash}
+
+def sampled_hash(input_file, size):
+
+    """
+    Returns a hash of HASH_BLOCK bytes at the start and end of the first size bytes of an open file and at
+    HASH_SAMPLES places in between
+    """
+
+    content_hash = hashlib.blake2b(digest_size=16)
+
+    for i in range(HASH_SAMPLES + 2):
+
+        position = max(0, (size - HASH_BLOCK) * i // (HASH_SAMPLES + 1))
+        input_file.seek(position)
+        content_hash.update(input_file.read(min(HASH_BLOCK, size - position)))
+
+    return content_hash.hexdigest()
+
+def align(offset):
+
+    return (offset + 7) // 8 * 8
+
+class ColumnBuilder:
+
+    """
+    Collects the values of one column while the cache is built.
+    Values are dictionary encoded until the column turns out to be a high cardinality numeric column.
+    """
+
+    def __init__(self, indexed=False):
+
+        self.codes = array.array('I')
+        self.dictionary = {}
+        self.values = None
+        self.exceptions = {}
+        self.checked_numeric = False
+        self.indexed = indexed
+
+    def append(self, value, row):
+
+        if(self.values != None):
+
+            try:
+
+                self.values.append(float(value))
+
+            except:
+
+                self.values.append(0.0)
+                self.exceptions[row] = value
+
+            return
+
+        code = self.dictionary.get(value)
+
+        if(code == None):
+
+            code = len(self.dictionary)
+            self.dictionary[value] = code
+
+            if(code >= CATEGORICAL_LIMIT and not self.checked_numeric):
+
+                self.checked_numeric = True
+
+                if(self.switch_to_numeric()):
+
+                    self.append(value, row)
+                    return
+
+        self.codes.append(code)
+
+    def switch_to_numeric(self):
+
+        """
+        Converts the codes read so far to float64 values if enough of the distinct values are numeric.
+        Returns True if the column was converted.
+        """
+
+        numbers = []
+        numeric_count = 0
+
+        for value in self.dictionary:
+
+            try:
+
+                numbers.append(float(value))
+                numeric_count += 1
+
+            except:
+
+                numbers.append(None)
+
+        if(numeric_count < NUMERIC_SHARE * len(self.dictionary)):
+
+            return False
+
+        keys = list(self.dictionary)
+        self.values = array.array('d')
+
+        for row in range(len(self.codes)):
+
+            number = numbers[self.codes[row]]
+
+            if(number == None):
+
+                self.values.append(0.0)
+                self.exceptions[row] = keys[self.codes[row]]
+
+            else:
+
+                self.values.append(number)
+
+        self.codes = None
+        self.dictionary = None
+
+        return True
+
+    def column(self, row_count):
+
+        """
+        Returns the collected column as a CategoricalColumn or NumericColumn
+        """
+
+        (column, column_arrays) = self.arrays(row_count)
+
+        if(self.values == None):
+
+            return CategoricalColumn(self.codes, column['dictionary'], column['zones'], column_arrays[1] if column['indexed'] else None)
+
+        return NumericColumn(self.values, column_arrays[1], self.exceptions, column['zones'])
+
+    def arrays(self, row_count):
+
+        """
+        Returns the metadata of the column and the list of arrays to write for it
+        """
+
+        if(self.values == None):
+
+            column = {'kind': 'categorical', 'dictionary': list(self.dictionary), 'zones': self.zones(row_count), 'indexed': False}
+            column_arrays = [self.codes.tobytes()]
+
+            if(self.indexed and len(self.dictionary) <= INDEX_LIMIT):
+
+                column['indexed'] = True
+                column_arrays.append(self.bitmaps(row_count))
+
+            return (column, column_arrays)
+
+        validity = bytearray(b"\xff" * ((row_count + 7) // 8))
+
+        for row in self.exceptions:
+
+            validity[row >> 3] &= ~(1 << (row & 7)) & 0xff
+
+        exceptions = []
+
+        for row in self.exceptions:
+
+            exceptions.append([row, self.exceptions[row]])
+
+        return ({'kind': 'numeric', 'exceptions': exceptions, 'zones': self.zones(row_count)}, [self.values.tobytes(), bytes(validity)])
+
+    def zones(self, row_count):
+
+        """
+        Returns the zone map of every block of ZONE_ROWS rows: the sorted codes present in the block, or None if
+        the column has too many distinct values, for a dictionary encoded column. For a numeric column it is
+        [lowest, highest, exact] of the numeric values of the block, where exact is False if the block also holds
+        NaN or non-numeric values. lowest and highest are None if the block holds no comparable values.
+        """
+
+        zones = []
+        exception_blocks = set([row // ZONE_ROWS for row in self.exceptions])
+
+        for start in range(0, row_count, ZONE_ROWS):
+
+            end = min(start + ZONE_ROWS, row_count)
+
+            if(self.values == None):
+
+                zones.append(sorted(set(self.codes[start:end])) if len(self.dictionary) <= ZONE_CODES_LIMIT else None)
+                continue
+
+            values = self.values[start:end]
+            exact = True
+
+            if(start // ZONE_ROWS in exception_blocks):
+
+                values = [values[row - start] for row in range(start, end) if row not in self.exceptions]
+                exact = False
+
+            # NaN values never match a comparison and would confuse min() and max(), and a NaN sum is the cheap
+            # way to find out whether the block holds any
+            total = sum(values)
+
+            if(total != total):
+
+                comparable = [value for value in values if value == value]
+                exact = exact and len(comparable) == len(values)
+                values = comparable
+
+            zones.append([min(values), max(values), exact] if values else [None, None, False])
+
+        return zones
+
+    def bitmaps(self, row_count):
+
+        """
+        Returns the bitmap index of a dictionary encoded column: for every code in turn, a bitmap of
+        (row_count + 7) // 8 bytes where bit row % 8 of byte row // 8 is set if the row holds that code
+        """
+
+        bitmap_length = (row_count + 7) // 8
+        bitmaps = bytearray(bitmap_length * len(self.dictionary))
+
+        for row in range(row_count):
+
+            bitmaps[self.codes[row] * bitmap_length + (row >> 3)] |= 1 << (row & 7)
+
+        return bytes(bitmaps)
+
+def read_columns(file_name, indexes=()):
+
+    """
+    Reads every column of file_name. The columns named in indexes get a bitmap index.
+
+    Returns: a tuple containing
+             1. the header line
+             2. the number of lines read
+             3. a ColumnBuilder holding the values of every column
+    """
+
+    with open_input(file_name) as input_file:
+
+        csv_reader = csv.reader(input_file)
+        header_line = [i.lower() for i in next(csv_reader)]
+        header_length = len(header_line)
+
+        builders = []
+
+        for field in header_line:
+
+            builders.append(ColumnBuilder(field in indexes))
+
+        row_count = 0
+
+        # lines are read the same way scan() reads them
+        for line in csv_reader:
+
+            if(not line):
+
+                continue
+
+            if(len(line) < header_length):
+
+                line = line + [None] * (header_length - len(line))
+
+            for i in range(header_length):
+
+                builders[i].append(line[i], row_count)
+
+            row_count += 1
+
+    return (header_line, row_count, builders)
+
+def load_columns(file_name, indexes=()):
+
+    """
+    Reads every column of file_name into memory, with a bitmap index for the columns named in indexes.
+    Returns: a ColumnStore holding the columns
+    """
+
+    (header_line, row_count, builders) = read_columns(file_name, indexes)
+    columns = {}
+
+    for i in range(len(header_line)):
+
+        columns[header_line[i]] = builders[i].column(row_count)
+
+    return ColumnStore(header_line, row_count, columns)
+
+def build_cache(file_name, indexes=()):
+
+    """
+    Reads every column of file_name and writes its columnar cache next to it, with a bitmap index for the
+    columns named in indexes. The cache is not written if the file changes while it is read.
+
+    Returns: the opened cache, or None if it could not be written
+    """
+
+    fingerprint = file_fingerprint(file_name)
+    (header_line, row_count, builders) = read_columns(file_name, indexes)
+
+    if(file_fingerprint(file_name) != fingerprint):
+
+        return None
+
+    columns = []
+    data = []
+    offset = 0
+
+    for builder in builders:
+
+        (column, column_arrays) = builder.arrays(row_count)
+        column['arrays'] = []
+
+        for column_array in column_arrays:
+
+            column['arrays'].append([offset, len(column_array)])
+            data.append((offset, column_array))
+            offset = align(offset + len(column_array))
+
+        columns.append(column)
+
+    metadata = {'fingerprint': fingerprint, 'byteorder': sys.byteorder, 'header': header_line, 'rows': row_count, 'columns': columns}
+
+    cache_name = file_name + CACHE_SUFFIX
+    temporary_name = cache_name + ".tmp{}".format(os.getpid())
+    metadata_bytes = json.dumps(metadata).encode("utf-8")
+    data_start = align(len(CACHE_MAGIC) + 8 + len(metadata_bytes))
+
+    try:
+
+        with open(temporary_name, 'wb') as cache_file:
+
+            cache_file.write(CACHE_MAGIC + struct.pack("<Q", len(metadata_bytes)) + metadata_bytes)
+
+            for (array_offset, column_array) in data:
+
+                cache_file.seek(data_start + array_offset)
+                cache_file.write(column_array)
+
+            cache_file.truncate(data_start + offset)
+
+        os.replace(temporary_name, cache_name)
+
+    except OSError:
+
+        if(os.path.exists(temporary_name)):
+
+            os.remove(temporary_name)
+
+        return None
+
+    return open_cache(file_name, header_line)
+
+def mark_block(bitmap, start, end):
+
+    """
+    Sets the bits of rows start to end in a bitmap. start is a multiple of ZONE_ROWS, so it starts a byte, and
+    the bits past the last row are cleared by the caller.
+    """
+
+    bitmap[start >> 3:(end + 7) >> 3] = b"\xff" * (((end + 7) >> 3) - (start >> 3))
+
+def selected_rows(selection, row_count):
+
+    """
+    Returns the rows whose bit is set in selection, in order
+    """
+
+    rows = array.array('I')
+    data = selection.to_bytes((row_count + 7) // 8, "little")
+
+    # most bytes of a selective filter are zero, so only the others are looked at
+
+    for match in re.finditer(b"[^\x00]", data):
+
+        position = match.start()
+
+        for bit in BYTE_BITS[data[position]]:
+
+            rows.append(position * 8 + bit)
+
+    return rows
+
+class CategoricalColumn:
+
+    """
+    A dictionary encoded column of the cache. codes holds the code of every row and dictionary[code] is its value.
+
+    zones holds the zone map of every block of ZONE_ROWS rows (see ColumnBuilder.zones()) and index the bitmap index
+    of the column, or None. A column of the rows selected by a filter has neither, and rows holds the row of the
+    file every row of the column was read from.
+    """
+
+    kind = 'categorical'
+
+    def __init__(self, codes, dictionary, zones=None, index=None, rows=None):
+
+        self.codes = codes
+        self.dictionary = dictionary
+        self.zones = zones
+        self.index = index
+        self.rows = rows
+        self.numbers = None
+
+    def line_number(self, row):
+
+        """
+        Returns the line number in the file of a row of the column
+        """
+
+        return (row if self.rows == None else self.rows[row]) + 2
+
+    def bitmap(self, code):
+
+        """
+        Returns the bitmap of the rows holding code as an integer, where bit row is set if the row holds it
+        """
+
+        bitmap_length = len(self.index) // len(self.dictionary)
+
+        return int.from_bytes(self.index[code * bitmap_length:(code + 1) * bitmap_length], "little")
+
+    def select_rows(self, rows):
+
+        """
+        Returns the column of the listed rows. Its codes are given out again in the order values are first seen
+        in those rows, so values that are not in any of them are not in its dictionary.
+        """
+
+        codes = array.array('I')
+        new_codes = {}
+        dictionary = []
+
+        for row in rows:
+
+            code = self.codes[row]
+            new_code = new_codes.get(code)
+
+            if(new_code == None):
+
+                new_code = len(dictionary)
+                new_codes[code] = new_code
+                dictionary.append(self.dictionary[code])
+
+            codes.append(new_code)
+
+        return CategoricalColumn(codes, dictionary, rows=rows)
+
+    def matching_codes(self, kind, value):
+
+        """
+        Returns the set of codes whose value matches the comparison kind of a filter
+        """
+
+        if(kind in ('=', '!=', 'in')):
+
+            values = frozenset(value if kind == 'in' else [value])
+            codes = set([code for code in range(len(self.dictionary)) if self.dictionary[code] in values])
+
+            if(kind == '!='):
+
+                codes = set(range(len(self.dictionary))) - codes
+
+            return codes
+
+        compare = COMPARISONS[kind]
+        numbers = self.parsed_dictionary()
+
+        return set([code for code in range(len(numbers)) if numbers[code] != None and compare(numbers[code], value)])
+
+    def matching_rows(self, codes, row_count):
+
+        """
+        Returns the rows holding one of codes as an integer where bit row is set if the row holds one.
+        Uses the bitmap index if the column has one. Otherwise the blocks whose zone map holds none of codes are
+        skipped and the blocks that only hold codes are taken whole.
+        """
+
+        if(len(codes) == 0):
+
+            return 0
+
+        if(self.index != None):
+
+            rows = 0
+
+            for code in codes:
+
+                rows |= self.bitmap(code)
+
+            return rows
+
+        bitmap = bytearray((row_count + 7) // 8)
+
+        for block in range(len(self.zones)):
+
+            start = block * ZONE_ROWS
+            end = min(start + ZONE_ROWS, row_count)
+            zone = self.zones[block]
+
+            if(zone != None):
+
+                present = codes.intersection(zone)
+
+                if(len(present) == 0):
+
+                    continue
+
+                if(len(present) == len(zone)):
+
+                    mark_block(bitmap, start, end)
+                    continue
+
+            for (row, code) in enumerate(self.codes[start:end], start):
+
+                if(code in codes):
+
+                    bitmap[row >> 3] |= 1 << (row & 7)
+
+        return int.from_bytes(bitmap, "little") & ((1 << row_count) - 1)
+
+    def parsed_dictionary(self):
+
+        """
+        Returns the float value of every dictionary entry, or None for entries that are not numeric.
+        Each distinct value is only converted once.
+        """
+
+        if(self.numbers == None):
+
+            self.numbers = []
+
+            for value in self.dictionary:
+
+                try:
+
+                    self.numbers.append(float(value))
+
+                except:
+
+                    self.numbers.append(None)
+
+        return self.numbers
+
+class NumericColumn:
+
+    """
+    A float64 column of the cache. A row is numeric if its bit in validity is set,
+    otherwise exceptions[row] holds its original value.
+    """
+
+    kind = 'numeric'
+
+    def __init__(self, values, validity, exceptions, zones=None, rows=None):
+
+        self.values = values
+        self.validity = validity
+        self.exceptions = exceptions
+        self.zones = zones
+        self.rows = rows
+
+    def line_number(self, row):
+
+        return (row if self.rows == None else self.rows[row]) + 2
+
+    def is_numeric(self, row):
+
+        return self.validity[row >> 3] & (1 << (row & 7))
+
+    def select_rows(self, rows):
+
+        """
+        Returns the column of the listed rows
+        """
+
+        values = array.array('d', [self.values[row] for row in rows])
+        validity = bytearray(b"\xff" * ((len(rows) + 7) // 8))
+        exceptions = {}
+
+        for i in range(len(rows)):
+
+            if(rows[i] in self.exceptions):
+
+                validity[i >> 3] &= ~(1 << (i & 7)) & 0xff
+                exceptions[i] = self.exceptions[rows[i]]
+
+        return NumericColumn(values, bytes(validity), exceptions, rows=rows)
+
+    def matching_rows(self, kind, value, row_count):
+
+        """
+        Returns the rows whose numeric value matches the comparison kind of a filter, as an integer where bit row
+        is set if the row matches. The blocks whose zone map shows that no row can match are skipped and the
+        blocks where every row matches are taken whole.
+        """
+
+        compare = COMPARISONS[kind]
+        bitmap = bytearray((row_count + 7) // 8)
+
+        for block in range(len(self.zones)):
+
+            start = block * ZONE_ROWS
+            end = min(start + ZONE_ROWS, row_count)
+            (lowest, highest, exact) = self.zones[block]
+
+            # the comparisons are monotonic, so some value of the block matches only if lowest or highest does
+
+            if(lowest == None or not (compare(lowest, value) or compare(highest, value))):
+
+                continue
+
+            if(exact and compare(lowest, value) and compare(highest, value)):
+
+                mark_block(bitmap, start, end)
+                continue
+
+            for row in range(start, end):
+
+                if(self.is_numeric(row) and compare(self.values[row], value)):
+
+                    bitmap[row >> 3] |= 1 << (row & 7)
+
+        return int.from_bytes(bitmap, "little") & ((1 << row_count) - 1)
+
+class ColumnStore:
+
+    """
+    Every column of an input file, either read into memory or memory mapped from its columnar cache.
+    columns maps every field name to its CategoricalColumn or NumericColumn.
+    """
+
+    def __init__(self, header_line, row_count, columns, cache_map=None):
+
+        self.header_line = header_line
+        self.row_count = row_count
+        self.columns = columns
+        self.cache_map = cache_map
+
+    def can_answer(self, plan):
+
+        """
+        Returns True if the fields that are grouped or counted by the plan are dictionary encoded and its filter,
+        if any, only compares the text of dictionary encoded fields
+        """
+
+        if(plan['where'] != None and not self.can_filter(WhereParser(plan['where'], self.header_line, None).parse())):
+
+            return False
+
+        # the values of numeric columns are only kept as floats, so their distinct values can't be counted
+
+        for command in plan['totals']:
+
+            if(command[0] in ('top_approx', 'count_distinct') and self.columns[command[1]].kind != 'categorical'):
+
+                return False
+
+        for field in plan['groups']:
+
+            for command in plan['groups'][field]:
+
+                if(command[0] == 'count_distinct' and self.columns[command[1]].kind != 'categorical'):
+
+                    return False
+
+        for field in plan['groups']:
+
+            for name in group_fields(field):
+
+                if(self.columns[name].kind != 'categorical'):
+
+                    return False
+
+        return True
+
+    def can_filter(self, tree):
+
+        """
+        Returns True if every comparison of a filter tree returned by WhereParser.parse() can be checked on the
+        columns. Numeric columns only keep float values, so =, != and IN can't compare their text.
+        """
+
+        if(tree[0] in ('and', 'or')):
+
+            return all([self.can_filter(subtree) for subtree in tree[1]])
+
+        if(tree[0] == 'not'):
+
+            return self.can_filter(tree[1])
+
+        return tree[0] not in ('=', '!=', 'in') or self.columns[tree[1]].kind == 'categorical'
+
+    def selection(self, tree):
+
+        """
+        Returns the rows that match a filter tree returned by WhereParser.parse(), as an integer where bit row is
+        set if the row matches
+        """
+
+        kind = tree[0]
+        all_rows = (1 << self.row_count) - 1
+
+        if(kind == 'and'):
+
+            rows = all_rows
+
+            for subtree in tree[1]:
+
+                rows &= self.selection(subtree)
+
+                if(rows == 0):
+
+                    break
+
+            return rows
+
+        if(kind == 'or'):
+
+            rows = 0
+
+            for subtree in tree[1]:
+
+                rows |= self.selection(subtree)
+
+                if(rows == all_rows):
+
+                    break
+
+            return rows
+
+        if(kind == 'not'):
+
+            return all_rows & ~self.selection(tree[1])
+
+        column = self.columns[tree[1]]
+
+        if(column.kind == 'categorical'):
+
+            return column.matching_rows(column.matching_codes(kind, tree[2]), self.row_count)
+
+        return column.matching_rows(kind, tree[2], self.row_count)
+
+    def filtered(self, rows, names):
+
+        """
+        Returns a ColumnStore of the listed rows of the columns in names
+        """
+
+        columns = {}
+
+        for name in names:
+
+            columns[name] = self.columns[name].select_rows(rows)
+
+        return ColumnStore(self.header_line, len(rows), columns)
+
+    def group_codes(self, field):
+
+        """
+        Returns the group code of every row for a key of categories and the value of every group code.
+        A tuple of fields gets a code for every combination of their codes, given out in the order the
+        combinations are first seen, like the codes of one column.
+        """
+
+        names = group_fields(field)
+
+        if(len(names) == 1):
+
+            column = self.columns[names[0]]
+
+            return (column.codes, column.dictionary)
+
+        columns = [self.columns[name] for name in names]
+        codes = array.array('I')
+        combination_codes = {}
+        keys = []
+
+        for combination in zip(*[column.codes for column in columns]):
+
+            code = combination_codes.get(combination)
+
+            if(code == None):
+
+                code = len(keys)
+                combination_codes[combination] = code
+                keys.append(tuple([columns[i].dictionary[combination[i]] for i in range(len(columns))]))
+
+            codes.append(code)
+
+        return (codes, keys)
+
+def open_cache(file_name, header_line):
+
+    """
+    Opens the columnar cache of file_name.
+
+    Returns: the cache, or None if there is no cache or it does not belong to the current contents of the file
+    """
+
+    try:
+
+        with open(file_name + CACHE_SUFFIX, 'rb') as cache_file:
+
+            if(cache_file.read(len(CACHE_MAGIC)) != CACHE_MAGIC):
+
+                return None
+
+            metadata_length = struct.unpack("<Q", cache_file.read(8))[0]
+            metadata = json.loads(cache_file.read(metadata_length).decode("utf-8"))
+
+            if(metadata['byteorder'] != sys.byteorder or metadata['header'] != header_line):
+
+                return None
+
+            if(metadata['fingerprint'] != file_fingerprint(file_name)):
+
+                return None
+
+            return map_cache(cache_file, metadata, align(len(CACHE_MAGIC) + 8 + metadata_length))
+
+    except (OSError, ValueError, KeyError, struct.error):
+
+        return None
+
+def map_cache(cache_file, metadata, data_start):
+
+    """
+    Memory maps the column arrays of an open cache file.
+    Returns: a ColumnStore holding the columns
+    """
+
+    cache_map = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+    data = memoryview(cache_map)[data_start:]
+    header_line = metadata['header']
+    columns = {}
+
+    for i in range(len(header_line)):
+
+        column = metadata['columns'][i]
+        column_arrays = []
+
+        for (array_offset, length) in column['arrays']:
+
+            column_arrays.append(data[array_offset:array_offset + length])
+
+        if(column['kind'] == 'categorical'):
+
+            index = column_arrays[1] if column['indexed'] else None
+            columns[header_line[i]] = CategoricalColumn(column_arrays[0].cast('I'), column['dictionary'], column['zones'], index)
+
+        else:
+
+            exceptions = {}
+
+            for (row, value) in column['exceptions']:
+
+                exceptions[row] = value
+
+            columns[header_line[i]] = NumericColumn(column_arrays[0].cast('d'), column_arrays[1], exceptions, column['zones'])
+
+    return ColumnStore(header_line, metadata['rows'], columns, cache_map)
+
+def fold_column(column, states, group_codes):
+
+    """
+    Folds every value of a CategoricalColumn or NumericColumn into running aggregates.
+
+    states holds one running aggregate per group code and group_codes holds the group code of every row.
+    When group_codes is None, every row is folded into states[0].
+    """
+
+    if(column.kind == 'categorical'):
+
+        numbers = column.parsed_dictionary()
+
+        # values that occur many times are added once with their count
+        if(group_codes == None):
+
+            pair_counts = collections.Counter(column.codes)
+            pairs = [((0, code), pair_counts[code]) for code in pair_counts]
+
+        else:
+
+            pairs = collections.Counter(zip(group_codes, column.codes)).items()
+
+        non_numeric_present = False
+
+        for ((group_code, code), times) in pairs:
+
+            if(numbers[code] == None):
+
+                non_numeric_present = True
+
+            else:
+
+                states[group_code].add_repeated(numbers[code], times)
+
+        # non-numeric values are reported with their line numbers, so the rows holding them are looked up in order
+        if(non_numeric_present):
+
+            for row in range(len(column.codes)):
+
+                if(numbers[column.codes[row]] == None):
+
+                    group_code = 0 if group_codes == None else group_codes[row]
+                    states[group_code].add_non_numeric(column.line_number(row), column.dictionary[column.codes[row]])
+
+        return
+
+    values = column.values
+    validity = column.validity
+
+    for row in range(len(values)):
+
+        group_code = 0 if group_codes == None else group_codes[row]
+
+        if(validity[row >> 3] & (1 << (row & 7))):
+
+            states[group_code].add(values[row])
+
+        else:
+
+            states[group_code].add_non_numeric(column.line_number(row), column.exceptions[row])
+
+def fold_distinct(column, states, group_codes):
+
+    """
+    Adds every distinct value of a CategoricalColumn to the distinct counts in states, once per group.
+    states and group_codes are the same as for fold_column().
+    """
+
+    if(group_codes == None):
+
+        pairs = [(0, code) for code in set(column.codes)]
+
+    else:
+
+        pairs = set(zip(group_codes, column.codes))
+
+    for (group_code, code) in pairs:
+
+        states[group_code].update(0, column.dictionary[code])
+
+def count_indexed_groups(column, selection, groups, field, plan):
+
+    """
+    Counts the selected rows of every value of an indexed column into groups, which holds the groups of field.
+    The groups are created in the order their first selected row is in, like scan() does.
+    """
+
+    firsts = []
+
+    for code in range(len(column.dictionary)):
+
+        rows = selection & column.bitmap(code)
+
+        if(rows):
+
+            # rows & -rows keeps the lowest set bit, the first selected row holding the value
+            firsts.append(((rows & -rows).bit_length(), code, rows.bit_count()))
+
+    for (first, code, count) in sorted(firsts):
+
+        group = new_group(field, plan)
+        group['count'] = count
+        groups[column.dictionary[code]] = group
+
+def scan_columns(store, header_line, plan):
+
+    """
+    Computes the same running state as scan() from a ColumnStore instead of the csv file.
+
+    The rows that match the filter of the plan are found from the bitmap indexes and zone maps of the columns,
+    and only those rows of the columns the plan uses are folded. Groups of an indexed field that are only
+    counted are counted from its bitmaps without taking out the rows.
+    """
+
+    (grand_total, categories, total_lines) = scan([], header_line, plan)
+
+    total_lines = store.row_count
+    grand_total['count'] = total_lines
+    counted = set()
+
+    if(plan['where'] != None):
+
+        selection = store.selection(WhereParser(plan['where'], header_line, None).parse())
+        grand_total['count'] = selection.bit_count()
+        names = set()
+
+        for field in categories:
+
+            column = store.columns[field] if field in store.columns else None
+
+            if(column != None and column.index != None and list(new_group(field, plan)) == ['count']):
+
+                count_indexed_groups(column, selection, categories[field], field, plan)
+                counted.add(field)
+
+        for command in grand_total:
+
+            if(command != 'count'):
+
+                names.add(command[1])
+
+        for field in categories:
+
+            if(field not in counted):
+
+                names.update(group_fields(field))
+
+                for command in plan['groups'][field]:
+
+                    names.add(command[1])
+
+        if(len(names) == 0):
+
+            return (grand_total, categories, total_lines)
+
+        store = store.filtered(selected_rows(selection, store.row_count), names)
+
+    for command in grand_total:
+
+        if(command == 'count'):
+
+            continue
+
+        column = store.columns[command[1]]
+
+        if(command[0] == 'top_approx'):
+
+            counts = collections.Counter(column.codes)
+
+            for code in range(len(column.dictionary)):
+
+                grand_total[command].add_repeated(column.dictionary[code], counts[code])
+
+        elif(command[0] == 'count_distinct'):
+
+            fold_distinct(column, [grand_total[command]], None)
+
+        else:
+
+            fold_column(column, [grand_total[command]], None)
+
+    for field in categories:
+
+        if(field in counted):
+
+            continue
+
+        (codes, keys) = store.group_codes(field)
+        counts = collections.Counter(codes)
+
+        # codes are given out in the order values are first seen, so groups are created in the same order as scan()
+        groups = []
+
+        for code in range(len(keys)):
+
+            group = new_group(field, plan)
+            group['count'] = counts[code]
+            categories[field][keys[code]] = group
+            groups.append(group)
+
+        for command in new_group(field, plan):
+
+            if(command == 'count'):
+
+                continue
+
+            if(command[0] == 'top'):
+
+                top_column = store.columns[command[1]]
+                pair_counts = collections.Counter(zip(codes, top_column.codes))
+
+                for (group_code, code) in pair_counts:
+
+                    groups[group_code][command][top_column.dictionary[code]] = pair_counts[(group_code, code)]
+
+            else:
+
+                states = []
+
+                for group in groups:
+
+                    states.append(group[command])
+
+                if(command[0] == 'count_distinct'):
+
+                    fold_distinct(store.columns[command[1]], states, codes)
+
+                else:
+
+                    fold_column(store.columns[command[1]], states, codes)
+
+    return (grand_total, categories, total_lines)
+
+# The data cube of an input file is stored next to it as <input file>.olapcube, in JSON
+
+CUBE_SUFFIX = ".olapcube"
+CUBE_VERSION = 2
+MAX_CUBE_DIMS = 8
+
+# the running aggregate of a cube cell that answers each kind of running state: max, min, mean and sum are all
+# read from the running sum, see state_command()
+CUBE_STATES = {'sum': 'sum'}
+
+def new_cell(measures):
+
+    """
+    Returns a new cube cell: its row count and a running sum, which keeps the max and min too, for every measure
+    """
+
+    cell = {'count': 0}
+
+    for measure in measures:
+
+        cell[measure] = {'sum': RunningSum()}
+
+    return cell
+
+def cube_subsets(dims):
+
+    """
+    Returns every subset of dims, from the full set of dims down to the empty set (the grand total),
+    each as a tuple in the order of dims
+    """
+
+    subsets = []
+
+    for size in range(len(dims), -1, -1):
+
+        for subset in itertools.combinations(dims, size):
+
+            subsets.append(subset)
+
+    return subsets
+
+def build_cube(file_name, header_line, dims, measures):
+
+    """
+    Computes the count and the running sum, max and min of every measure for every group of every subset of dims
+    (a ROLLUP over all of them, including the grand total) and writes them next to file_name.
+
+    The file is read once into the cells of the full set of dims. The cells of smaller subsets are merged from them.
+
+    Returns: the cube as returned by open_cube(), or None if it could not be written
+    """
+
+    fingerprint = file_fingerprint(file_name)
+
+    field_index = {}
+
+    for i in range(len(header_line)):
+
+        field_index[header_line[i]] = i
+
+    dim_indexes = [field_index[dim] for dim in dims]
+    measure_indexes = [(measure, field_index[measure]) for measure in measures]
+    header_length = len(header_line)
+    cells = {}
+    row_count = 0
+    current_line = 2
+
+    with open_input(file_name) as input_file:
+
+        csv_reader = csv.reader(input_file)
+        next(csv_reader, None)
+
+        for line in csv_reader:
+
+            if(not line):
+
+                continue
+
+            if(len(line) < header_length):
+
+                line = line + [None] * (header_length - len(line))
+
+            key = tuple([line[index] for index in dim_indexes])
+            cell = cells.get(key)
+
+            if(cell == None):
+
+                cell = new_cell(measures)
+                cells[key] = cell
+
+            cell['count'] += 1
+
+            for (measure, index) in measure_indexes:
+
+                for state in cell[measure].values():
+
+                    state.update(current_line, line[index])
+
+            row_count += 1
+            current_line += 1
+
+    if(file_fingerprint(file_name) != fingerprint):
+
+        return None
+
+    # every smaller subset is rolled up from the cells of the full set of dims. Those cells are in the order their
+    # keys were first seen, so the rolled up cells are too
+
+    cuboids = {}
+
+    for subset in cube_subsets(dims):
+
+        positions = [dims.index(dim) for dim in subset]
+        subset_cells = {}
+
+        for key in cells:
+
+            subset_key = tuple([key[position] for position in positions])
+
+            if(subset_key not in subset_cells):
+
+                subset_cells[subset_key] = new_cell(measures)
+
+            subset_cell = subset_cells[subset_key]
+            subset_cell['count'] += cells[key]['count']
+
+            for measure in measures:
+
+                for kind in subset_cell[measure]:
+
+                    subset_cell[measure][kind].merge_unordered(cells[key][measure][kind])
+
+        cuboids[subset] = subset_cells
+
+    cube = {'fingerprint': fingerprint, 'header': header_line, 'dims': dims, 'measures': measures, 'rows': row_count, 'cuboids': cuboids}
+
+    json_cuboids = []
+
+    for subset in cuboids:
+
+        json_cells = []
+
+        for key in cuboids[subset]:
+
+            cell = cuboids[subset][key]
+            json_cell = {'key': list(key), 'count': cell['count']}
+
+            for measure in measures:
+
+                json_cell[measure] = {}
+
+                for kind in cell[measure]:
+
+                    json_cell[measure][kind] = cell[measure][kind].to_json()
+
+            json_cells.append(json_cell)
+
+        json_cuboids.append({'dims': list(subset), 'cells': json_cells})
+
+    cube_name = file_name + CUBE_SUFFIX
+    temporary_name = cube_name + ".tmp{}".format(os.getpid())
+
+    try:
+
+        with open(temporary_name, 'w', encoding="utf-8") as cube_file:
+
+            json.dump({'version': CUBE_VERSION, 'fingerprint': fingerprint, 'header': header_line, 'dims': dims, 'measures': measures, 'rows': row_count, 'cuboids': json_cuboids}, cube_file)
+
+        os.replace(temporary_name, cube_name)
+
+    except OSError:
+
+        if(os.path.exists(temporary_name)):
+
+            os.remove(temporary_name)
+
+        return None
+
+    return cube
+
+def open_cube(file_name, header_line):
+
+    """
+    Reads the data cube of file_name.
+
+    Returns: the cube, or None if there is no cube, it was written by a version of OLAP.py that kept other
+             running aggregates, or it does not belong to the current contents of the file
+    """
+
+    try:
+
+        with open(file_name + CUBE_SUFFIX, 'r', encoding="utf-8") as cube_file:
+
+            cube = json.load(cube_file)
+
+        if(cube.get('version') != CUBE_VERSION or cube['header'] != header_line or cube['fingerprint'] != file_fingerprint(file_name)):
+
+            return None
+
+        cuboids = {}
+
+        for json_cuboid in cube['cuboids']:
+
+            cells = {}
+
+            for json_cell in json_cuboid['cells']:
+
+                cell = {'count': json_cell['count']}
+
+                for measure in cube['measures']:
+
+                    cell[measure] = {}
+
+                    for kind in json_cell[measure]:
+
+                        cell[measure][kind] = AGGREGATE_KINDS[json_cell[measure][kind]['kind']].from_json(json_cell[measure][kind])
+
+                cells[tuple(json_cell['key'])] = cell
+
+            cuboids[tuple(json_cuboid['dims'])] = cells
+
+        cube['cuboids'] = cuboids
+
+        return cube
+
+    except (OSError, ValueError, KeyError, TypeError):
+
+        return None
+
+def cube_can_answer(cube, plan):
+
+    """
+    Returns True if every group field of plan is a dim of the cube, every aggregate is on a measure,
+    every top field is a dim and the plan has no filter
+    """
+
+    if(plan['where'] != None):
+
+        return False
+
+    for command in plan['totals']:
+
+        if(command[0] not in CUBE_STATES or command[1] not in cube['measures']):
+
+            return False
+
+    for field in plan['groups']:
+
+        for name in group_fields(field):
+
+            if(name not in cube['dims']):
+
+                return False
+
+        for command in plan['groups'][field]:
+
+            if(command[0] == 'top' and command[1] not in cube['dims']):
+
+                return False
+
+            if(command[0] != 'top' and (command[0] not in CUBE_STATES or command[1] not in cube['measures'])):
+
+                return False
+
+    return True
+
+def cube_key(cube, fields):
+
+    """
+    Returns the cuboid of the cube for the set of fields
+    """
+
+    subset = []
+
+    for dim in cube['dims']:
+
+        if(dim in fields):
+
+            subset.append(dim)
+
+    return tuple(subset)
+
+def cube_value(subset, key, names):
+
+    """
+    Returns the value of the group of the fields in names held by the cell key of the cuboid of subset,
+    in the form scan() keys it
+    """
+
+    values = tuple([key[subset.index(name)] for name in names])
+
+    if(len(values) == 1):
+
+        return values[0]
+
+    return values
+
+def scan_cube(cube, header_line, plan):
+
+    """
+    Computes the same running state as scan() from the cells of the data cube, without reading the input file.
+    The running aggregates are shared with the cube cells.
+    """
+
+    (grand_total, categories, total_lines) = scan([], header_line, plan)
+
+    total_lines = cube['rows']
+    grand_total['count'] = total_lines
+    total_cell = cube['cuboids'][()][()] if cube['rows'] > 0 else new_cell(cube['measures'])
+
+    for command in plan['totals']:
+
+        grand_total[command] = total_cell[command[1]][CUBE_STATES[command[0]]]
+
+    for field in plan['groups']:
+
+        names = group_fields(field)
+        subset = cube_key(cube, names)
+        cells = cube['cuboids'][subset]
+
+        for key in cells:
+
+            group = {'count': cells[key]['count']}
+
+            for command in plan['groups'][field]:
+
+                if(command[0] == 'top'):
+
+                    group[command] = {}
+
+                else:
+
+                    group[command] = cells[key][command[1]][CUBE_STATES[command[0]]]
+
+            categories[field][cube_value(subset, key, names)] = group
+
+        # the value counts of the top field in every group come from the cuboid of the group fields and the top field
+        for command in plan['groups'][field]:
+
+            if(command[0] != 'top'):
+
+                continue
+
+            subset = cube_key(cube, names + [command[1]])
+            top_position = subset.index(command[1])
+
+            for key in cube['cuboids'][subset]:
+
+                categories[field][cube_value(subset, key, names)][command][key[top_position]] = cube['cuboids'][subset][key]['count']
+
+    return (grand_total, categories, total_lines)
+
+def get_numeric(tuple):
+
+    """
+    Takes in a tuple containing two elements and returns the second element which is the numeric element.
+
+    """
+    
+    return tuple[1]
+
+# Only the first 101 non-numeric values of an aggregate are kept, since the 101st is the one that stops the program
+
+MAX_NON_NUMERIC = 100
+
+class RunningAggregate:
+
+    """
+    Base class for the running state of one aggregate on one numeric field.
+
+    The state is updated once per line during the scan with update(line_number, value). Values that cannot be
+    converted to a float are counted, and the first MAX_NON_NUMERIC + 1 of them are kept as (line_number, value)
+    tuples so the same error messages can be printed once the scan is finished.
+    """
+
+    def __init__(self):
+
+        self.non_numeric = []
+        self.non_numeric_count = 0
+
+    def update(self, line_number, value):
+
+        try:
+
+            number = float(value)
+
+        except:
+
+            self.add_non_numeric(line_number, value)
+            return
+
+        self.add(number)
+
+    def add_non_numeric(self, line_number, value):
+
+        self.non_numeric_count += 1
+
+        if(len(self.non_numeric) <= MAX_NON_NUMERIC):
+
+            self.non_numeric.append((line_number, value))
+
+    def add(self, number):
+
+        raise NotImplementedError
+
+    def add_repeated(self, number, times):
+
+        """
+        Adds the same number times times. Used when the values of a column are read from their counts
+        """
+
+        raise NotImplementedError
+
+    def merge(self, other, line_offset):
+
+        """
+        Adds the state of other, computed over a later part of the file, into this aggregate.
+        line_offset is added to the line numbers of the non-numeric values kept by other.
+        """
+
+        for element in other.non_numeric:
+
+            if(len(self.non_numeric) > MAX_NON_NUMERIC):
+
+                break
+
+            self.non_numeric.append((element[0] + line_offset,) + tuple(element[1:]))
+
+        self.non_numeric_count += other.non_numeric_count
+
+    def merge_unordered(self, other):
+
+        """
+        Adds the state of other, computed over lines that may come before or between the lines of this aggregate,
+        into this aggregate. The non-numeric values kept are the first ones by line number.
+        """
+
+        non_numeric = sorted(self.non_numeric + other.non_numeric, key=get_line_number)[:MAX_NON_NUMERIC + 1]
+        self.merge(other, 0)
+        self.non_numeric = non_numeric
+
+    def to_json(self):
+
+        """
+        Returns the state of the aggregate as a dictionary that can be written as JSON
+        """
+
+        state = dict(vars(self))
+        state['kind'] = type(self).__name__
+
+        return state
+
+    @classmethod
+    def from_json(cls, state):
+
+        """
+        Returns the aggregate whose state was returned by to_json()
+        """
+
+        aggregate = cls()
+
+        for name in state:
+
+            if(name != 'kind'):
+
+                setattr(aggregate, name, state[name])
+
+        aggregate.non_numeric = [tuple(element) for element in aggregate.non_numeric]
+
+        return aggregate
+
+def get_line_number(element):
+
+    """
+    Takes in a (line_number, value) tuple of a non-numeric value and returns the line number
+    """
+
+    return element[0]
+
+# Every finite float is a whole multiple of 2 ** -1074, so sums are kept exactly as integers scaled by 2 ** 1074
+
+SUM_SCALE = 1074
+
+# the maximum and minimum of a running sum start from these values, and one that never moved from them is NaN,
+# matching the original list based computation
+
+MAX_START = -100000000000.0
+MIN_START = 100000000000.0
+
+class RunningSum(RunningAggregate):
+
+    """
+    Keeps the sum, count, maximum and minimum of the numeric values seen so far. Used for max, min, sum and mean,
+    so the aggregates of one field share one running state, see state_command().
+
+    The sum is kept exactly and only rounded to a float when it is read, so the result does not depend on the
+    order the values were added in and running sums over different parts of a file can be merged.
+    Infinite and NaN values are added up separately as floats.
+    """
+
+    def __init__(self):
+
+        RunningAggregate.__init__(self)
+        self.scaled_sum = 0
+        self.non_finite_sum = 0.0
+        self.numeric_count = 0
+        self.maximum = MAX_START
+        self.minimum = MIN_START
+
+    def add(self, number):
+
+        self.numeric_count += 1
+
+        if(self.maximum < number):
+
+            self.maximum = number
+
+        if(self.minimum > number):
+
+            self.minimum = number
+
+        try:
+
+            (numerator, denominator) = number.as_integer_ratio()
+
+        except (OverflowError, ValueError):
+
+            self.non_finite_sum += number
+            return
+
+        self.scaled_sum += numerator << (SUM_SCALE + 1 - denominator.bit_length())
+
+    def add_repeated(self, number, times):
+
+        self.numeric_count += times
+
+        if(self.maximum < number):
+
+            self.maximum = number
+
+        if(self.minimum > number):
+
+            self.minimum = number
+
+        try:
+
+            (numerator, denominator) = number.as_integer_ratio()
+
+        except (OverflowError, ValueError):
+
+            self.non_finite_sum += number * times
+            return
+
+        self.scaled_sum += (numerator << (SUM_SCALE + 1 - denominator.bit_length())) * times
+
+    def merge(self, other, line_offset):
+
+        RunningAggregate.merge(self, other, line_offset)
+        self.scaled_sum += other.scaled_sum
+        self.non_finite_sum += other.non_finite_sum
+        self.numeric_count += other.numeric_count
+
+        if(self.maximum < other.maximum):
+
+            self.maximum = other.maximum
+
+        if(self.minimum > other.minimum):
+
+            self.minimum = other.minimum
+
+    def to_json(self):
+
+        # the scaled sum is written as a hexadecimal string without its trailing zeros, which are most of its digits
+
+        state = RunningAggregate.to_json(self)
+        shift = (self.scaled_sum & -self.scaled_sum).bit_length() - 1 if self.scaled_sum else 0
+        state['scaled_sum'] = [hex(self.scaled_sum >> shift), shift]
+
+        return state
+
+    @classmethod
+    def from_json(cls, state):
+
+        state = dict(state)
+        (digits, shift) = state['scaled_sum']
+        state['scaled_sum'] = int(digits, 16) << shift
+
+        return super().from_json(state)
+
+    @property
+    def total_sum(self):
+
+        try:
+
+            finite_sum = self.scaled_sum / (1 << SUM_SCALE)
+
+        except OverflowError:
+
+            finite_sum = float("inf") if self.scaled_sum > 0 else float("-inf")
+
+        if(self.non_finite_sum == 0.0):
+
+            return finite_sum
+
+        return finite_sum + self.non_finite_sum
+
+class RunningVariance(RunningAggregate):
+
+    """
+    Keeps the count, mean and sum of squared differences from the mean of the numeric values seen so far, with
+    Welford's method, so the variance of a field can be read at any time. Only kept for --progress-every and
+    --sample, whose confidence intervals need it, see SampleDesign.
+    """
+
+    def __init__(self):
+
+        RunningAggregate.__init__(self)
+        self.numeric_count = 0
+        self.mean = 0.0
+        self.squares = 0.0
+
+    def add(self, number):
+
+        self.numeric_count += 1
+        delta = number - self.mean
+        self.mean += delta / self.numeric_count
+        self.squares += delta * (number - self.mean)
+
+    def merge(self, other, line_offset):
+
+        RunningAggregate.merge(self, other, line_offset)
+
+        if(other.numeric_count == 0):
+
+            return
+
+        count = self.numeric_count + other.numeric_count
+        delta = other.mean - self.mean
+        self.squares += other.squares + delta * delta * self.numeric_count * other.numeric_count / count
+        self.mean += delta * other.numeric_count / count
+        self.numeric_count = count
+
+    @property
+    def variance(self):
+
+        if(self.numeric_count < 2):
+
+            return float("nan")
+
+        return self.squares / (self.numeric_count - 1)
+
+def interpolated_quantile(values, p):
+
+    """
+    Returns the p quantile of a sorted list of numbers, interpolated linearly between the two closest values.
+    The 0.5 quantile of an even number of values is the mean of the two middle values.
+    """
+
+    position = p * (len(values) - 1)
+    lower = int(position)
+
+    if(lower + 1 >= len(values)):
+
+        return values[lower]
+
+    return values[lower] + (values[lower + 1] - values[lower]) * (position - lower)
+
+class RunningQuantile(RunningAggregate):
+
+    """
+    Keeps every numeric value seen so far, so any quantile can be computed exactly. Used for median and quantile.
+    """
+
+    def __init__(self):
+
+        RunningAggregate.__init__(self)
+        self.values = array.array('d')
+        self.numeric_count = 0
+
+    def add(self, number):
+
+        self.values.append(number)
+        self.numeric_count += 1
+
+    def add_repeated(self, number, times):
+
+        self.values.extend(array.array('d', [number]) * times)
+        self.numeric_count += times
+
+    def merge(self, other, line_offset):
+
+        RunningAggregate.merge(self, other, line_offset)
+        self.values.extend(other.values)
+        self.numeric_count += other.numeric_count
+
+    def quantile(self, p):
+
+        return interpolated_quantile(sorted(self.values), p)
+
+    def to_json(self):
+
+        state = RunningAggregate.to_json(self)
+        state['values'] = list(self.values)
+
+        return state
+
+    @classmethod
+    def from_json(cls, state):
+
+        aggregate = super().from_json(state)
+        aggregate.values = array.array('d', aggregate.values)
+
+        return aggregate
+
+MIN_QUANTILE_COMPRESSION = 20
+
+class TDigest(RunningAggregate):
+
+    """
+    Estimates quantiles in bounded memory with a merging t-digest. Used for median and quantile with a compression.
+
+    Values are collected in a buffer of 10 * compression values. When it is full, the buffer and the centroids are
+    sorted together and merged into new centroids of (mean, weight). A centroid may only grow while it spans less
+    than one unit of the scale function k(q) = compression / (2 * pi) * asin(2q - 1), so centroids near the lowest and
+    highest values stay small and tail quantiles such as 0.99 stay accurate. There are about compression centroids.
+    Until the buffer first overflows every value is kept and quantiles are exact. Digests are merged by adding their
+    centroids and buffers together.
+    """
+
+    def __init__(self, compression=MIN_QUANTILE_COMPRESSION):
+
+        RunningAggregate.__init__(self)
+        self.compression = compression
+        self.centroids = []
+        self.buffer = []
+        self.weighted = []
+        self.numeric_count = 0
+        self.minimum = float("inf")
+        self.maximum = float("-inf")
+
+    def add(self, number):
+
+        self.buffer.append(number)
+        self.numeric_count += 1
+
+        if(number < self.minimum):
+
+            self.minimum = number
+
+        if(number > self.maximum):
+
+            self.maximum = number
+
+        if(len(self.buffer) > 10 * self.compression):
+
+            self.compress()
+
+    def add_repeated(self, number, times):
+
+        # while every value is kept, repeated values are kept one by one so quantiles stay exact
+
+        if(not self.centroids and not self.weighted and len(self.buffer) + times <= 10 * self.compression):
+
+            self.buffer.extend([number] * times)
+
+        else:
+
+            self.weighted.append((number, times))
+
+        self.numeric_count += times
+        self.minimum = min(self.minimum, number)
+        self.maximum = max(self.maximum, number)
+
+        if(len(self.buffer) + len(self.weighted) > 10 * self.compression):
+
+            self.compress()
+
+    def merge(self, other, line_offset):
+
+        RunningAggregate.merge(self, other, line_offset)
+        self.centroids = self.centroids + other.centroids
+        self.buffer.extend(other.buffer)
+        self.weighted.extend(other.weighted)
+        self.numeric_count += other.numeric_count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+        if(other.centroids or len(self.buffer) + len(self.weighted) > 10 * self.compression):
+
+            self.compress()
+
+    def compress(self):
+
+        """
+        Merges the buffer into the centroids
+        """
+
+        items = self.centroids + self.weighted + [(number, 1) for number in self.buffer]
+        items.sort()
+        self.buffer = []
+        self.weighted = []
+
+        total = self.numeric_count
+        scale = self.compression / (2 * math.pi)
+        centroids = []
+        (mean, weight) = items[0]
+        weight_before = 0
+        limit = self.weight_limit(0, total, scale)
+
+        for (item_mean, item_weight) in items[1:]:
+
+            if(weight_before + weight + item_weight <= limit):
+
+                weight += item_weight
+                mean += (item_mean - mean) * item_weight / weight
+
+            else:
+
+                centroids.append((mean, weight))
+                weight_before += weight
+                limit = self.weight_limit(weight_before, total, scale)
+                (mean, weight) = (item_mean, item_weight)
+
+        centroids.append((mean, weight))
+        self.centroids = centroids
+
+    def weight_limit(self, weight_before, total, scale):
+
+        """
+        Returns the highest weight before the end of a centroid that starts after weight_before values
+        """
+
+        k = scale * math.asin(2 * weight_before / total - 1) + 1
+
+        if(k >= scale * math.pi / 2):
+
+            return total
+
+        return total * (math.sin(k / scale) + 1) / 2
+
+    def quantile(self, p):
+
+        if(not self.centroids and not self.weighted):
+
+            return interpolated_quantile(sorted(self.buffer), p)
+
+        if(self.buffer or self.weighted):
+
+            self.compress()
+
+        # the quantile is interpolated between the centers of the two closest centroids, or the lowest or
+        # highest value at either end
+
+        target = p * self.numeric_count
+        previous_mean = self.minimum
+        previous_center = 0
+        weight_before = 0
+
+        for (mean, weight) in self.centroids:
+
+            center = weight_before + weight / 2
+
+            if(target < center):
+
+                return previous_mean + (mean - previous_mean) * (target - previous_center) / (center - previous_center)
+
+            (previous_mean, previous_center) = (mean, center)
+            weight_before += weight
+
+        if(target >= self.numeric_count):
+
+            return self.maximum
+
+        return previous_mean + (self.maximum - previous_mean) * (target - previous_center) / (self.numeric_count - previous_center)
+
+    @classmethod
+    def from_json(cls, state):
+
+        aggregate = super().from_json(state)
+        aggregate.centroids = [tuple(centroid) for centroid in aggregate.centroids]
+        aggregate.weighted = [tuple(item) for item in aggregate.weighted]
+
+        return aggregate
+
+TOP_APPROX_CAPACITY = 1000
+
+class SpaceSaving:
+
+    """
+    A heavy hitters sketch that counts the most common values of a field in bounded memory (Space-Saving).
+
+    At most 2 * capacity values are counted. When there are more, only the capacity values with the highest counts
+    are kept and floor is raised to the highest count dropped, which bounds the count of every value that is not
+    counted. A value seen again after it was dropped starts from floor, so counts[value] is never lower than its
+    true count and errors[value] is how much it may be overestimated by. Values are exact while there are at most
+    2 * capacity distinct values.
+    """
+
+    def __init__(self, capacity):
+
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.floor = 0
+
+    def update(self, line_number, value):
+
+        count = self.counts.get(value)
+
+        if(count != None):
+
+            self.counts[value] = count + 1
+            return
+
+        self.counts[value] = self.floor + 1
+        self.errors[value] = self.floor
+
+        if(len(self.counts) > 2 * self.capacity):
+
+            self.prune()
+
+    def add_repeated(self, value, times):
+
+        """
+        Counts the same value times times. Used when the values of a column are read from their counts
+        """
+
+        count = self.counts.get(value)
+
+        if(count != None):
+
+            self.counts[value] = count + times
+            return
+
+        self.counts[value] = self.floor + times
+        self.errors[value] = self.floor
+
+        if(len(self.counts) > 2 * self.capacity):
+
+            self.prune()
+
+    def prune(self):
+
+        """
+        Drops every value but the capacity values with the highest counts
+        """
+
+        kept = heapq.nlargest(self.capacity, self.counts.items(), key=get_numeric)
+        kept_values = set([value for (value, count) in kept])
+
+        for value in list(self.counts):
 
-        print("Error: You must provide the aggregate mean with one argument everytime it is called", end="", file=sys.stderr)
-        exit(6)
-    
-    if(args.sum and (len(args.sum) < 1 or [] in args.sum)):
+            if(value not in kept_values):
 
-        print("Error: You must provide the aggregate sum with one argument everytime it is called", end="", file=sys.stderr)
-        exit(6)
+                self.floor = max(self.floor, self.counts[value])
+                del self.counts[value]
+                del self.errors[value]
 
-    if(args.input==None):
+    def merge(self, other, line_offset):
 
-        print("Error: You must specify a file using the command --input <filename>", end="", file=sys.stderr)
-        exit(6)
+        """
+        Adds the sketch of another part of the file into this one. A value missing from one of the sketches
+        may have been counted up to its floor there.
+        """
 
+        for value in self.counts:
 
-    inputs = sys.argv
-    keywords = ["--min", "--mean", "--max", "--sum", "--top"]
+            if(value not in other.counts):
 
-    # inputs is a list of all commands entered minus any digits that may have been present in the arguments
+                self.counts[value] += other.floor
+                self.errors[value] += other.floor
 
-    for input in inputs:
+        for value in other.counts:
 
-        if (input.isdigit()):
+            if(value in self.counts):
 
-            inputs.remove(input)
+                self.counts[value] += other.counts[value]
+                self.errors[value] += other.errors[value]
 
-    
-    # populates the list of tuples called command_order where each tuple contains the command name followed by the field
-    # there is an exception for 'count' which is just listed as an individual string (not part of a tuple)
-    # command_order is used to help determine the order in which to compute arguments and display the names in the header
+            else:
 
-    command_order = []
+                self.counts[value] = other.counts[value] + self.floor
+                self.errors[value] = other.errors[value] + self.floor
 
-    for i in range(len(inputs)):
+        self.floor += other.floor
 
-        if(inputs[i] in keywords):
+        if(len(self.counts) > 2 * self.capacity):
 
-            command_order.append((inputs[i].strip("--"), inputs[i+1].lower()))
+            self.prune()
 
-        elif(inputs[i] == '--count'):
+    def top(self, k):
 
-            command_order.append('count')
-    
-    # Tries opening the input file, throws an error and exits if file does not exist or is not readable
+        """
+        Returns (value, count, error) for the k values with the highest counts
+        """
 
-    try:
-        with open(args.input, 'r', encoding="utf-8-sig") as input_file:
+        top_counts = heapq.nlargest(k, self.counts.items(), key=get_numeric)
 
-            if(not args.input.endswith(".csv")):
+        return [(value, count, self.errors[value]) for (value, count) in top_counts]
 
-                print("Error: The file you entered in not a csv file. This program only works for csv files.", file=sys.stderr)
-                exit(6)
+    def scaled(self, fraction):
 
-            csv_reader = csv.DictReader(input_file)
+        """
+        Returns a copy of the sketch of fraction of the records, whose counts and errors are scaled to every record
+        """
 
-            header_line = csv_reader.fieldnames
-            
-            if(header_line == None):
+        sketch = SpaceSaving(self.capacity)
+        sketch.counts = {value: round(count / fraction) for (value, count) in self.counts.items()}
+        sketch.errors = {value: round(error / fraction) for (value, error) in self.errors.items()}
+        sketch.floor = round(self.floor / fraction)
 
-                print("Error:{} is empty".format(args.input), file=sys.stderr)
-                exit(6)
+        return sketch
 
-            header_line = [i.lower() for i in header_line]
-  
-            # look through the aggregate commands entered and see if 
-            # - the user entered a field that does not exist
+    def to_json(self):
 
-            for command in command_order:
+        return {'kind': 'SpaceSaving', 'capacity': self.capacity, 'counts': self.counts, 'errors': self.errors, 'floor': self.floor}
 
-                if(command != 'count' and command[0] != 'top'):
+    @classmethod
+    def from_json(cls, state):
 
-                    if(command[1] not in header_line):
+        sketch = cls(state['capacity'])
+        sketch.counts = state['counts']
+        sketch.errors = state['errors']
+        sketch.floor = state['floor']
 
-                        print("Error: {}:no field with name \'{}\' found".format(args.input, command[1]), end="", file=sys.stderr)
-                        exit(8)
+        return sketch
 
-            # if the user called top k
-            # 1. check if k is an integer greater than 0
-            # 2. check the specified field is a valid categorical field
+class DistinctCount:
 
-            if(args.top):
+    """
+    Keeps every distinct value of a field seen so far. Missing values at the end of short lines are not counted.
+    """
 
-                k = args.top[0]
-                categorical_field = args.top[1].lower()
-                args.top[1] =  categorical_field
-                        
-                if(k.isnumeric() == False or int(k) <= 0):
-                    
-                    print("Error: {} : The first argument for top must be an integer greater than 0.".format(args.input), end="", file=sys.stderr)
-                    exit(6)
-                    
-                if(categorical_field not in header_line):
-                    
-                    print("Error: {}:no field with name \'{}\' found".format(args.input, args.top[1]), end="", file=sys.stderr)
-                    exit(6)
+    def __init__(self):
 
+        self.values = set()
 
-            # if the user called group-by
-            # - check that field they requested exists in the input file
+    def update(self, line_number, value):
 
-            if(args.groupby):
+        if(value != None):
 
-                args.groupby[0] = args.groupby[0].lower()
+            self.values.add(value)
 
-                if (args.groupby[0] not in header_line):
+    def merge(self, other, line_offset):
 
-                    print("Error: {}:no group-by argument with name \'{}\' found".format(args.input, args.groupby[0]), end="", file=sys.stderr)
-                    exit(9)
+        self.values |= other.values
 
-            # Categories is the main dictionary that holds all of the information required to perform the necessary aggregate calculations
-           
-            categories = {}
-            grand_total = {'count': 0}
+    def estimate(self):
 
-            for field in header_line:
+        return len(self.values)
 
-                grand_total[field] = []
+    def to_json(self):
 
-                if((args.groupby and args.groupby[0] == field) or (args.top and args.top[1] == field)):
+        return {'kind': 'DistinctCount', 'values': list(self.values)}
 
-                    categories[field] = {}
+    @classmethod
+    def from_json(cls, state):
 
-           # total_lines tracks the number of lines read
-           # current_line tracks where we are at the file. since the first line of the file is headers,
-           # the actual data starts on line 2 of the file
+        distinct = cls()
+        distinct.values = set(state['values'])
 
-            total_lines = 0
-            current_line = 2
+        return distinct
 
-            # read in a line from the csv reader, represented as a dictionary
-            for line in csv_reader:
+# HyperLogLog sketches use 2 ** precision registers of one byte each
 
-                # new line is a dictionary that is the same as line, but all keys have been converted to lowercase
-                new_line = {}
+MIN_DISTINCT_PRECISION = 4
+MAX_DISTINCT_PRECISION = 16
+HLL_RECENT = 1024
 
-                for field in line:
+class HyperLogLog:
 
-                    new_line[field.lower()] = line[field]
-                
-                # now fill the dictionary grand_total which is used to perform calculations in the event the
-                # user only enters --input <some_file> or --input <some_file> --count
-                # grand_total stores field names and a list of the tuples (line_number, value)
-                # the value portion of each tuple is converted to a float if possible
+    """
+    Estimates the number of distinct values of a field in 2 ** precision bytes, with a standard error of about
+    1.04 / sqrt(2 ** precision). Missing values at the end of short lines are not counted.
 
-                for field in new_line:
+    Values are hashed with blake2b rather than hash(), which is salted per process, so sketches of different
+    processes can be merged by taking the larger of every register. Adding a value twice does not change the
+    sketch, so up to HLL_RECENT values that were already added are remembered and not hashed again.
+    """
 
-                    if(field in grand_total):
+    def __init__(self, precision):
 
-                        try:
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+        self.recent = set()
 
-                            element = (current_line, float(new_line[field]))
-                            grand_total[field].append(element)
+    def update(self, line_number, value):
 
-                        except:
+        if(value == None or value in self.recent):
 
-                            element = (current_line, new_line[field])
-                            grand_total[field].append(element)
+            return
 
-                # The following block of code fills the main dictionary categories
-                # Data stored in categories is used to perform calculations based on the specified aggregates
+        if(len(self.recent) >= HLL_RECENT):
 
-                for field in header_line:
+            self.recent.clear()
 
-                    if field in categories:
+        self.recent.add(value)
 
-                        if (new_line[field] not in categories[field]):
+        hash_value = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+        register = hash_value >> (64 - self.precision)
+        rank = 64 - self.precision - (hash_value & ((1 << (64 - self.precision)) - 1)).bit_length() + 1
 
-                            categories[field][new_line[field]] = {field: new_line[field], 'count': 1}
+        if(self.registers[register] < rank):
 
-                            for other_field in header_line:
+            self.registers[register] = rank
 
-                                if(other_field != field):
+    def merge(self, other, line_offset):
 
-                                    if((args.groupby and args.groupby[0] == other_field) or (args.top and args.top[1] ==other_field)):
+        self.registers = bytearray(map(max, self.registers, other.registers))
 
-                                        categories[field][new_line[field]][other_field] = [1, new_line[other_field]]
+    def estimate(self):
 
-                                    else:
+        register_count = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / register_count)
+        raw_estimate = alpha * register_count * register_count / sum([2.0 ** -rank for rank in self.registers])
+        zero_registers = self.registers.count(0)
 
-                                        try:
+        # linear counting is more accurate while many registers are still empty
+        if(raw_estimate <= 2.5 * register_count and zero_registers > 0):
 
-                                            categories[field][new_line[field]][other_field] = [(current_line, float(new_line[other_field]))]
+            return round(register_count * math.log(register_count / zero_registers))
 
-                                        except:
+        return round(raw_estimate)
 
-                                            categories[field][new_line[field]][other_field] = [(current_line, new_line[other_field])]
+    def to_json(self):
 
+        # the values that were recently added are only a shortcut and are not kept
 
-                        else:
+        return {'kind': 'HyperLogLog', 'precision': self.precision, 'registers': self.registers.hex()}
 
-                            categories[field][new_line[field]]['count'] += 1
+    @classmethod
+    def from_json(cls, state):
 
-                            for other_field in header_line:
+        sketch = cls(state['precision'])
+        sketch.registers = bytearray.fromhex(state['registers'])
 
-                                if(other_field != field):
+        return sketch
 
-                                    if((args.groupby and args.groupby[0] == other_field) or (args.top and args.top[1] ==other_field)):
+AGGREGATE_KINDS = {'RunningSum': RunningSum, 'RunningVariance': RunningVariance, 'RunningQuantile': RunningQuantile,
+                   'TDigest': TDigest, 'SpaceSaving': SpaceSaving, 'DistinctCount': DistinctCount, 'HyperLogLog': HyperLogLog}
 
-                                        categories[field][new_line[field]][other_field].append(new_line[other_field])
-                                        categories[field][new_line[field]][other_field][0] += 1
+def new_aggregate(command):
 
-                                    else:    
-                                       
-                                        try:
+    """
+    Returns a new running aggregate object for a command tuple of the running state such as ('sum', 'math score')
+    """
 
-                                            categories[field][new_line[field]][other_field].append((current_line, float(new_line[other_field])))
+    if(command[0] == 'top_approx'):
 
-                                        except:
+        return SpaceSaving(command[2])
 
-                                            categories[field][new_line[field]][other_field].append((current_line, new_line[other_field]))
+    if(command[0] == 'count_distinct'):
 
-                total_lines += 1
-                current_line += 1
+        return DistinctCount() if command[2] == None else HyperLogLog(command[2])
 
-            grand_total['count'] = total_lines
+    if(command[0] in ('median', 'quantile')):
 
-    except FileNotFoundError:
+        return RunningQuantile() if command[3] == None else TDigest(command[3])
 
-        print("Error: File not found or cannot be read!", end="", file=sys.stderr)
-        exit(6)
+    if(command[0] == 'variance'):
 
-    # The following decision block decides what functions to call based off of the specified arguments
-        
-    if (args.groupby and args.top):    
+        return RunningVariance()
 
-        groupby(categories, command_order, args)
-    
-    elif (args.top):
+    return RunningSum()
 
-        k = args.top[0]
-        k = int(k)
-        categorical_field = args.top[1].lower()
-        cardinality = len(list(categories[args.top[1]].keys()))
+def new_group(field, plan):
 
-        if(cardinality > 20 and k > 20):
+    """
+    Returns the running state of a new group in categories[field].
 
-            print("Error: {}: {} has been capped at 20 distinct values".format(args.input, categorical_field), end="", file=sys.stderr)
-            print("top_" + categorical_field + "_capped")
-            print(top(categories, 20, categorical_field))
-      
-        else:
+    Every group holds its row count. Groups of the group-by field also hold one running aggregate per command
+    in the plan, and a dictionary of value counts for the top field if top was called.
+    """
 
-            print("top_" + categorical_field)
-            print(top(categories, k, categorical_field))
-    
-    elif(args.groupby):
+    group = {'count': 0}
 
-        groupby(categories, command_order, args)
-    
-    else:
+    for command in plan['groups'][field]:
 
-        if(len(command_order) == 0 or command_order == ['count']):
+        if(command[0] == 'top'):
 
-            print('count')
-            print(total_lines)
+            group[command] = {}
 
         else:
 
-            print_total(grand_total, command_order, total_lines, args)
+            group[command] = new_aggregate(command)
 
-def get_numeric(tuple):
+    return group
+
+def report_non_numeric(state, args, field_name, aggregate_name):
 
     """
-    Takes in a tuple containing two elements and returns the second element which is the numeric element.
+    Adds a warning for every non-numeric value found by a running aggregate.
 
+    Raises an OLAPError with exit code 7 if there are more than 100 non-numeric values
     """
-    
-    return tuple[1]
+
+    non_numeric_count = 0
+
+    for element in state.non_numeric:
+
+        non_numeric_count += 1
+
+        # values found in one of several input files carry that file and their line number in it
+        (file_name, line_number) = (element[2], element[3]) if len(element) > 2 else (args.input, element[0])
+        args.warnings.append("Error:{}:{} can't compute {} on non-numeric value \'{}\'".format(file_name, line_number, aggregate_name, element[1]))
+
+        if(non_numeric_count > MAX_NON_NUMERIC):
+
+            raise OLAPError("Error:{}:more than 100 non-numeric values found in aggregate column \'{}\'".format(args.input, field_name), 7)
 
 def top(data, k, category, key_list=None):
 
@@ -313,7 +6990,36 @@ def top(data, k, category, key_list=None):
     If there are less values than the user requested, all of the values in that category are printed.
     If there are more than 20 distinct values and the user called for more than 20 values  (e.g. top 25 ticker),
     the output will only contain the counts of the top 20 values
+
+    When key_list is given (the value counts of one group), only the values present in key_list are considered
+    
+    """
+
+    field_plus_count = top_counts(data, k, category, key_list)
+
+    output_string  = ''
+    output_string += '\"'
+
+    for i in range(len(field_plus_count)):
+
+
+        if( i < len(field_plus_count)-1):
+
+            output_string += (str(field_plus_count[i][0]).strip() + ": " + str(field_plus_count[i][1]).strip() + ",")
+
+        else:
+
+            output_string += (str(field_plus_count[i][0]).strip() + ": " + str(field_plus_count[i][1]).strip())
+
     
+    output_string += '\"'
+
+    return output_string
+
+def top_counts(data, k, category, key_list=None):
+
+    """
+    Returns the (value, count) pairs of the k most common values of category, in the order top() prints them
     """
 
     field_plus_count = []
@@ -336,145 +7042,141 @@ def top(data, k, category, key_list=None):
 
         k = len(field_plus_count)
 
-    field_plus_count.sort(key=get_numeric, reverse=True)
-
-    output_string  = ''
-    output_string += '\"'
+    # only the k values with the highest counts are sorted, in the order they were first seen when counts tie
+    return heapq.nlargest(k, field_plus_count, key=get_numeric)
 
-    for i in range(k):
+def top_approx_result(sketch, k, args):
 
+    """
+    Computes the top k most common values of the top field from its heavy hitters sketch.
 
-        if( i < k-1):
+    Returns: the header and the one row of the result, a string like the one of top() where counts that may be
+    overestimated are followed by the lowest the true count can be
 
-            output_string += (str(field_plus_count[i][0]).strip() + ": " + str(field_plus_count[i][1]).strip() + ",")
+    Example: --top 3 ticker --top-approx
+             "ibm: 14059,dis: 12072 (at least 12040),axp: 11556 (at least 11540)"
+    """
 
-        else:
+    categorical_field = args.top[1]
+    header = ["top_" + categorical_field + "_approx"]
 
-            output_string += (str(field_plus_count[i][0]).strip() + ": " + str(field_plus_count[i][1]).strip())
+    if(k > 20 and len(sketch.counts) > 20):
 
-    
-    output_string += '\"'
+        args.warnings.append("Error: {}: {} has been capped at 20 distinct values".format(args.input, categorical_field))
+        header = ["top_" + categorical_field + "_approx_capped"]
+        k = 20
 
-    return output_string
+    top_values = []
 
-def print_total(data, command_order, line_count, args):
+    for (value, count, error) in sketch.top(k):
 
-    """
-    print_total() prints handles printing all of the requested aggregates in the event that group-by was not called.
+        if(error == 0):
 
-    The printed result is the computed values of each aggregates in the order they were entered on the command line.
+            top_values.append(str(value).strip() + ": " + str(count))
 
-    """
+        else:
 
-    header_string = ''
-    value_string  = ''
+            top_values.append(str(value).strip() + ": " + str(count) + " (at least " + str(count - error) + ")")
 
-    for command in command_order:
+    return (header, [['\"' + ",".join(top_values) + '\"']])
 
-        if(command != 'count'):
+def aggregate_header(command):
 
-            header_string += command[0] + "_" + command[1] + ","
+    """
+    Returns the name of the output column of an aggregate command, e.g. mean_math score.
+    Estimated distinct counts and quantiles are marked with _approx.
+    """
 
-        else:
+    if(command[0] == 'count_distinct' and command[2] != None):
 
-            header_string += 'count' + ","
+        return command[0] + "_" + command[1] + "_approx"
 
-    if(header_string.endswith(",")):
+    if(command[0] == 'median' and command[3] != None):
 
-        header_string = header_string[:-1]
+        return "median_" + command[1] + "_approx"
 
-    print(header_string)
+    if(command[0] == 'quantile'):
 
-    
-    for command in command_order:
+        return "quantile_{:g}_".format(command[2]) + command[1] + ("_approx" if command[3] != None else "")
 
-        if(command != 'count'):
+    return command[0] + "_" + command[1]
 
-            if (command[0] == 'max'):
+def total_result(data, command_order, line_count, args):
 
-                value_string += str(custom_max(data[command[1]], args, command[1])) + ","
+    """
+    total_result() handles computing all of the requested aggregates in the event that group-by was not called.
 
-            if(command[0] == 'min'):
+    Returns: the header and a list holding the one row of the result. The row holds the computed values of
+    each aggregate in the order they were entered on the command line.
 
-                value_string += str(custom_min(data[command[1]], args, command[1])) + ","
+    """
 
-            if(command[0] == 'mean'):
+    header = []
+    values = []
 
-                value_string += str(mean(data[command[1]], args, command[1])) + ","
+    for command in command_order:
 
-            if(command[0] == 'sum'):
+        if(command != 'count'):
 
-                value_string += str(numeric_sum_count(data[command[1]], args, command[1])[0]) + ","
+            header.append(aggregate_header(command))
 
         else:
 
-            value_string += str(line_count) + ","
-    
-    if value_string.endswith(","):
-
-        value_string = value_string[:-1]
-
-    print(value_string)
+            header.append('count')
 
+    for command in command_order:
 
-def non_numeric_error_check(data, command_order, fields, flag):
-
-    non_nums_max = 0
-    non_nums_min = 0
-    non_nums_mean = 0
-    non_nums_sum = 0
-
-    for field in fields:
+        if(command != 'count'):
 
-        for command in command_order:
+            if (command[0] == 'max'):
 
-            if(command[0] == 'max'):
+                values.append(custom_max(data[state_command(command)], args, command[1]))
 
-               for element in  data[flag][field][command[1].lower()]:
+            if(command[0] == 'min'):
 
-                   try:
-                       float(element[1])
+                values.append(custom_min(data[state_command(command)], args, command[1]))
 
-                   except:
+            if(command[0] == 'mean'):
 
-                       non_nums_max += 1
+                values.append(mean(data[state_command(command)], args, command[1]))
 
-            if(command[0] == 'min'):
+            if(command[0] == 'sum'):
 
-                for element in data[flag][field][command[1].lower()]:
+                values.append(numeric_sum_count(data[command], args, command[1])[0])
 
-                    try:
-                        float(element[1])
+            if(command[0] == 'count_distinct'):
 
-                    except:
+                values.append(data[command].estimate())
 
-                        non_nums_min += 1
+            if(command[0] in ('median', 'quantile')):
 
-            if(command[0] == 'mean'):
+                values.append(custom_quantile(data[state_command(command)], args, command))
 
-                for element in data[flag][field][command[1].lower()]:
+        else:
 
-                    try:
-                        float(element[1])
+            values.append(line_count)
 
-                    except:
+    return (header, [values])
 
-                        non_nums_mean += 1
 
-            if(command[0] == 'sum'):
+def non_numeric_error_check(data, command_order, fields, flag):
 
+    """
+    Returns True if more than 100 non-numeric values were found across all groups for any one kind of aggregate.
+    In that case groupby() does not print its rows.
+    """
 
+    non_nums = {'max': 0, 'min': 0, 'mean': 0, 'sum': 0, 'median': 0, 'quantile': 0}
 
-                for element in data[flag][field][command[1].lower()]:
+    for field in fields:
 
-                    try:
-                        float(element[1])
+        for command in command_order:
 
-                    except:
+            if(command != 'count' and command[0] in non_nums):
 
-                        non_nums_sum += 1
+                non_nums[command[0]] += data[flag][field][state_command(command)].non_numeric_count
 
-        if (max(non_nums_max, non_nums_min, non_nums_mean, non_nums_sum) > 100):
+        if (max(non_nums.values()) > 100):
             
             return True
 
@@ -486,244 +7188,322 @@ def groupby(data, command_order, args):
 
     """
     Computes all requested aggregates for each distinct value in the categorical field passed to group-by
-    up to a maximum of 20.
+    up to a maximum of 20, or of --limit. When several fields are passed to group-by, each distinct combination of their
+    values is one group and the value of every field has its own column.
 
-    If there are more than 20 distinct values in the specified categorical field, a message gets printed to stderr and
-    another function, group_by_overflow, gets called to handle printing the remaining records.
+    If there are more than 20 distinct values in the specified categorical field, a warning is added and
+    another function, group_by_overflow, gets called to compute the row of the remaining records.
+
+    The groups are sorted by value, or by the aggregate of --order-by, see ordered_groups().
+    With --no-cap every group is output and there is no row of the remaining records. Groups spilled to disk
+    by --memory-limit are handled by spilled_groupby().
+
+    Returns: the header and the rows of the result. The header is None and only the row of the remaining
+    records is returned if more than 100 non-numeric values were found across all groups.
     """
 
     top_info = args.top
-    flag = args.groupby[0]
+    flag = group_key(args.groupby)
     file_name = args.input
 
+    if(isinstance(data[flag], SpilledGroups)):
+
+        return spilled_groupby(data, command_order, args)
+
     fields = list(data[flag].keys()) 
     
     error_present = non_numeric_error_check(data, command_order, fields, flag)
 
     num_fields = len(fields)
-    fields.sort()
-    cap = 20
+    cap = group_cap(args, num_fields)
+
+    if(args.order_by != None):
+
+        fields = ordered_groups(data, fields, command_order, args, cap)
+
+    else:
+
+        fields.sort()
     num_out = 0
+    rows = []
+    k = None
     
     if(top_info):
 
         k = int(top_info[0])
     
-    header_string = flag.lower() + ","
+    header = list(args.groupby)
 
     for command in command_order:
 
-        if(command[1] == flag):
+        if(command[1] in args.groupby):
 
-            print("Error: {} : can't compute aggregate {} on group-by field \'{}\'".format(args.input, command[0], command[1]), end="", file=sys.stderr)
-            exit(6)
+            raise OLAPError("Error: {} : can't compute aggregate {} on group-by field \'{}\'".format(args.input, command[0], command[1]), 6)
 
         if (command[0] =='top' and k > 20 and num_fields > 20):
 
-            header_string += command[0] + "_" + command[1] + "_capped,"
-            print("Error: {}: {} has been capped at 20 distinct values".format(args.input, args.top[1].lower()), end="", file=sys.stderr)
+            header.append(command[0] + "_" + command[1] + "_capped")
+            args.warnings.append("Error: {}: {} has been capped at 20 distinct values".format(args.input, args.top[1].lower()))
         
         elif(command != 'count'):
 
-            header_string += command[0] + "_" + command[1] + ","
+            header.append(aggregate_header(command))
 
         else:
 
-            header_string += 'count' + ","
-    
-    if(header_string.endswith(",")):
+            header.append('count')
 
-        header_string = header_string[:-1]
-    
-    if(not error_present):
+    for field in fields:
 
-        print(header_string)
+        if(num_out < cap):
 
-    for field in fields:
+            values = group_row(data, flag, field, data[flag][field], command_order, args, k)
 
-        value_string  = ''
+            if(not error_present):
 
-        if(num_out < cap):
+                rows.append(values)
 
-            value_string += field + ","
+        num_out += 1
 
-            for command in command_order:
+    if(error_present):
 
-                if(command != 'count'):
+        header = None
 
-                    if(command[0] == 'max'):
+    # The code below handles the case when group-by has been called on a category with more than 20 values,
+    # or more than the --limit
 
-                        value_string += str(custom_max(data[flag][field][command[1].lower()], args, command[1])) + ","
+    if (num_fields > cap):
 
-                    if(command[0] == 'min'):
+        args.warnings.append("Error: {}:{} has been capped at {} distinct values".format(file_name, " ".join(args.groupby), cap))
+        args.warnings.append("Error: {}:group-by argument {} has high cardinality".format(file_name, " ".join(args.groupby)))
 
-                        value_string += str(custom_min(data[flag][field][command[1].lower()], args, command[1])) + ","
+        rows.append(group_by_overflow(data, command_order, fields[cap:], args))
 
-                    if(command[0] == 'mean'):
+    return (header, rows)
 
-                        value_string += str(mean(data[flag][field][command[1].lower()], args, command[1])) + ","
+def group_cap(args, group_count):
 
-                    if(command[0] == 'sum'):
+    """
+    Returns the number of groups output before the row of the remaining groups: 20, the --limit, or all of them
+    with --no-cap
+    """
 
-                        value_string += str(numeric_sum_count(data[flag][field][command[1].lower()], args, command[1])[0]) + ","
+    return group_count if args.no_cap else (args.limit or 20)
 
-                    if(command[0] == 'top'):
+def group_row(data, flag, field, group, command_order, args, k=None):
 
-                        if(len(data[flag][field][command[1].lower()]) > 1):
+    """
+    Returns the row of one group: the value of field, or its values when there are several group-by fields,
+    followed by the value of every aggregate in command_order. k is the k of top if top was called.
+    """
 
-                            value_string += top(data, k, command[1], key_list=data[flag][field][command[1].lower()]) + ","
+    values = group_fields(field) if isinstance(flag, tuple) else [field]
 
-                        else:
+    for command in command_order:
 
-                            value_string += top(data, k, command[1], None) + ","
-                else:
+        values.append(aggregate_value(data, group, command, args, k))
 
-                    value_string += str(data[flag][field]['count']) + ","
+    return values
 
-            if(value_string.endswith(",")):
+def aggregate_value(data, group, command, args, k=None):
 
-                value_string = value_string[:-1]
-               
-            if(not error_present):
+    """
+    Returns the value of the aggregate command for one group
+    """
 
-                print(value_string)
+    if(command == 'count'):
 
-        num_out += 1
+        return group['count']
 
-    # The code below handles the case when group-by has been called on a category with more than 20 values
+    if(command[0] == 'max'):
 
-    if (num_fields > cap):
+        return custom_max(group[state_command(command)], args, command[1])
 
-        print("Error: {}:{} has been capped at 20 distinct values".format(file_name, flag), file=sys.stderr)
-        print("Error: {}:group-by argument {} has high cardinality".format(file_name, flag), file=sys.stderr)
+    if(command[0] == 'min'):
 
-        group_by_overflow(data, command_order, fields[20:], args)
-        
+        return custom_min(group[state_command(command)], args, command[1])
 
-def numeric_sum_count(tuple_list, args, field_name):
+    if(command[0] == 'mean'):
 
-    """
-    Takes a list of two-element tuples as a parameter where the first element represents the line number
-    and the second element represents the value of the numerical field at that line number
-    
-    Returns: a tuple containing 
-             1. the total sum of all numeric elements in the tuple_list
-             2. the total count of all numeric elements in the tuple_list
+        return mean(group[state_command(command)], args, command[1])
+
+    if(command[0] == 'sum'):
+
+        return numeric_sum_count(group[command], args, command[1])[0]
+
+    if(command[0] == 'count_distinct'):
+
+        return group[command].estimate()
+
+    if(command[0] in ('median', 'quantile')):
+
+        return custom_quantile(group[state_command(command)], args, command)
+
+    return top(data, k, command[1], key_list=group[command])
+
+def ordered_groups(data, fields, command_order, args, n):
 
-    Throws an error and exits with code 7 if there are more than 100 non-numeric elements in the tuple_list
+    """
+    Returns fields, the values of the groups of data, with the n groups that come first by the aggregate of
+    --order-by at the front in that order, followed by the other groups in the order of fields.
+    Only the n groups are sorted: they are picked with a heap. Groups with the same value are ordered by their
+    group-by values, and groups whose value is NaN come last.
     """
 
-    total_sum = 0
-    numeric_count = 0
-    non_numeric_count = 0
+    (name, direction) = args.order_by
+    flag = group_key(args.groupby)
 
-    for element in tuple_list:
+    for command in command_order:
+
+        if((aggregate_header(command) if command != 'count' else 'count') == name):
+
+            order_command = command
+
+    # the value of every group is computed with its own warnings, so the warnings of the output are not repeated
+    order_args = args.copy()
+
+    def order_key(field):
 
         try:
 
-            if(type(element) == tuple):
-                
-                total_sum += float(element[1])
-                numeric_count += 1
+            value = aggregate_value(data, data[flag][field], order_command, order_args)
 
-        except:
+        except OLAPError:
 
-            non_numeric_count += 1
-            print("Error:{}:{} can't compute mean or sum on non-numeric value \'{}\'".format(args.input, element[0], element[1]), file=sys.stderr)
+            value = "NaN"
 
-        if(non_numeric_count > 100):
+        if(not isinstance(value, (int, float)) or math.isnan(value)):
 
-            print("Error:{}:more than 100 non-numeric values found in aggregate column \'{}\'".format(args.input, field_name), file=sys.stderr)
-            exit(7)
+            return (1, 0, field)
 
-    if(numeric_count == 0):
-        
-        return ("NaN", "NaN")
+        return (0, value if direction == 'asc' else -value, field)
 
-    return (total_sum, numeric_count)
+    selected = heapq.nsmallest(n, fields, key=order_key)
+    selected_fields = set(selected)
 
+    return selected + [field for field in fields if field not in selected_fields]
 
-def custom_max(tuple_list, args, field_name):
+def spilled_groupby(data, command_order, args):
 
     """
-    Takes a list of two-element tuples as a parameter where the first element represents the line number
-    and the second element represents the value of the numerical field at that line number
-    
-    Returns: the maximum value of the numerical field in the tuple list
+    Computes the rows of a group-by whose groups were spilled to disk by spill_scan().
 
-    Throws an error and exits if there are more than 100 non-numeric elements in the tuple_list
+    Returns: the header and an iterator over the rows, which are computed one group at a time while the sorted
+    runs of the groups are merged, so they can only be read once. As in groupby(), the header is None and there
+    are no rows if more than 100 non-numeric values were found across all groups.
     """
 
-    maximum = -100000000000.0
-    non_numeric_count = 0
-    total_numeric_count = 0
+    flag = group_key(args.groupby)
+    spilled = data[flag]
+    header = list(args.groupby)
 
-    for element in tuple_list:
+    for command in command_order:
 
-        try:
+        if(command[1] in args.groupby):
 
-            if (type(element) == tuple and maximum < float(element[1])):
+            raise OLAPError("Error: {} : can't compute aggregate {} on group-by field \'{}\'".format(args.input, command[0], command[1]), 6)
 
-                maximum = float(element[1])
+        header.append(aggregate_header(command) if command != 'count' else 'count')
 
-                total_numeric_count += 1
+    non_nums = {}
+    non_numeric_counts = spilled.non_numeric_counts()
 
-        except:
+    # counted per kind of aggregate like non_numeric_error_check()
+    for command in command_order:
 
-            non_numeric_count += 1
-            print("Error:{}:{} can't compute max on non-numeric value \'{}\'".format(args.input, element[0], element[1]), file=sys.stderr)
+        if(command != 'count' and state_command(command) in non_numeric_counts):
 
-        if(non_numeric_count > 100):
+            non_nums[command[0]] = non_nums.get(command[0], 0) + non_numeric_counts[state_command(command)]
 
-            print("Error:{}:more than 100 non-numeric values found in aggregate column \'{}\'".format(args.input, field_name), file=sys.stderr)
-            exit(7)
+    rows = (group_row(data, flag, field, group, command_order, args) for (field, group) in spilled.items())
 
-    if(total_numeric_count == 0):
+    if(non_nums and max(non_nums.values()) > MAX_NON_NUMERIC):
+
+        # the rows are still computed for the warnings and errors of their non-numeric values
+        for row in rows:
+
+            pass
+
+        return (None, [])
+
+    return (header, rows)
+        
+
+def numeric_sum_count(state, args, field_name):
+
+    """
+    Takes the running sum of a numerical field as a parameter
+
+    Returns: a tuple containing 
+             1. the total sum of all numeric elements seen by the running sum
+             2. the total count of all numeric elements seen by the running sum
+
+    Raises an OLAPError with exit code 7 if there were more than 100 non-numeric elements
+    """
+
+    report_non_numeric(state, args, field_name, "mean or sum")
+
+    if(state.numeric_count == 0):
+        
+        return ("NaN", "NaN")
+
+    return (state.total_sum, state.numeric_count)
+
+
+def custom_max(state, args, field_name):
+
+    """
+    Takes the running sum of a numerical field, which keeps its maximum, as a parameter
+    
+    Returns: the maximum value of the numerical field
+
+    Raises an OLAPError if there were more than 100 non-numeric elements
+    """
+
+    report_non_numeric(state, args, field_name, "max")
+
+    if(state.maximum == MAX_START):
             
         return "NaN"
     
-    return maximum
+    return state.maximum
 
-def custom_min(tuple_list, args, field_name):
+def custom_min(state, args, field_name):
 
     """
-    Takes a list of two-element tuples as a parameter where the first element represents the line number
-    and the second element represents the value of the numerical field at that line number
+    Takes the running sum of a numerical field, which keeps its minimum, as a parameter
     
-    Returns: the minimum value of the numerical field in the tuple list
+    Returns: the minimum value of the numerical field
 
-    Throws an error and exits if there are more than 100 non-numeric elements in the tuple_list
+    Raises an OLAPError if there were more than 100 non-numeric elements
     """
 
-    minimum = 100000000000.0
-    non_numeric_count = 0
-    total_numeric_count = 0
+    report_non_numeric(state, args, field_name, "max")
 
-    for element in tuple_list:
+    if(state.minimum == MIN_START):
+        
+        return "NaN"
+    
+    return state.minimum
 
-        try:
 
-            if (type(element) == tuple and minimum > float(element[1])):
+def custom_quantile(state, args, command):
 
-                minimum = float(element[1])
-                
-                total_numeric_count += 1
-        except:
+    """
+    Takes the running quantile of a numerical field and its median or quantile command as parameters
 
-            non_numeric_count += 1
-            print("Error:{}:{} can't compute max on non-numeric value \'{}\'".format(args.input, element[0], element[1]), file=sys.stderr)
+    Returns: the median or quantile of the numerical field
 
-        if(non_numeric_count > 100):
+    Raises an OLAPError if there were more than 100 non-numeric elements
+    """
 
-            print("Error:{}:more than 100 non-numeric values found in aggregate column \'{}\'".format(args.input, field_name), file=sys.stderr)
-            exit(7)
+    report_non_numeric(state, args, command[1], command[0])
+
+    if(state.numeric_count == 0):
 
-    if(total_numeric_count == 0):
-        
         return "NaN"
-    
-    return minimum
 
+    return state.quantile(command[2])
 
 def mean(data, args, field_name):
 
@@ -746,13 +7526,14 @@ def group_by_overflow(data, command_order, fields, args):
 
     """
     In the event the cardinality of the group-by field is greater than 20,
-    this function prints a summary of the results for the remaining elements in the specified field.
-    The output format is: _OTHER value1, value2, ...., 
+    this function computes a summary of the results for the remaining elements in the specified field.
+
+    Returns: the row _OTHER, value1, value2, .... with an empty column for every group-by field after the first
     """
 
-    flag = args.groupby[0]
+    flag = group_key(args.groupby)
 
-    value_string = '_OTHER' + ","
+    values = ['_OTHER'] + [''] * (len(args.groupby) - 1)
 
     for command in command_order:
 
@@ -772,7 +7553,7 @@ def group_by_overflow(data, command_order, fields, args):
 
                   count += data[flag][field]['count']
 
-            value_string += str(count) + ","
+            values.append(count)
         
         else:
 
@@ -784,17 +7565,17 @@ def group_by_overflow(data, command_order, fields, args):
 
                     for field in fields:
 
-                        current_max = custom_max(data[flag][field][command[1].lower()], args, command[1])
+                        current_max = custom_max(data[flag][field][state_command(command)], args, command[1])
 
                         if(current_max > maximum):
 
                             maximum = current_max
 
-                    value_string += str(maximum) + ","
+                    values.append(maximum)
 
                 except:
                     
-                    value_string += "NaN"
+                    values.append("NaN")
 
 
             if(command[0] == 'min'):
@@ -805,17 +7586,17 @@ def group_by_overflow(data, command_order, fields, args):
 
                     for field in fields:
 
-                        current_min = custom_min(data[flag][field][command[1].lower()], args, command[1])
+                        current_min = custom_min(data[flag][field][state_command(command)], args, command[1])
 
                         if(current_min < minimum):
 
                             minimum = current_min
 
-                    value_string += str(minimum) + ","
+                    values.append(minimum)
 
                 except:
                     
-                    value_string += "NaN"
+                    values.append("NaN")
 
 
             if(command[0] == 'sum'):
@@ -826,13 +7607,13 @@ def group_by_overflow(data, command_order, fields, args):
 
                     for field in fields:
 
-                        total_sum += numeric_sum_count(data[flag][field][command[1].lower()], args, command[1])[0]
+                        total_sum += numeric_sum_count(data[flag][field][command], args, command[1])[0]
 
-                    value_string += str(total_sum) + ","
+                    values.append(total_sum)
 
                 except:
 
-                    value_string += "NaN"
+                    values.append("NaN")
 
             
             if(command[0] == 'mean'):
@@ -840,14 +7621,47 @@ def group_by_overflow(data, command_order, fields, args):
                 total_sum = 0
                 total_count = 0
 
+                try:
+
+                    for field in fields:
+
+                        sum_and_count = numeric_sum_count(data[flag][field][state_command(command)], args, command[1])
+                        total_sum += sum_and_count[0]
+                        total_count += sum_and_count[1]
+
+                    values.append(total_sum/total_count)
+
+                except:
+
+                    values.append("NaN")
+
+            # the distinct values of the remaining groups are counted by merging their states into a new one
+            if(command[0] == 'count_distinct'):
+
+                distinct = new_aggregate(command)
+
                 for field in fields:
 
-                    sum_and_count = numeric_sum_count(data[flag][field][command[1].lower()], args, command[1])
-                    total_sum += sum_and_count[0]
-                    total_count += sum_and_count[1]
+                    distinct.merge(data[flag][field][command], 0)
+
+                values.append(distinct.estimate())
+
+            # the remaining groups are merged into a new running quantile in the order of their lines
+            if(command[0] in ('median', 'quantile')):
+
+                try:
+
+                    quantile = new_aggregate(command)
+
+                    for field in fields:
+
+                        quantile.merge_unordered(data[flag][field][state_command(command)])
+
+                    values.append(custom_quantile(quantile, args, command))
+
+                except:
 
-                average = total_sum/total_count
-                value_string += str(average) + ","
+                    values.append("NaN")
 
             if(command[0] == 'top'):
 
@@ -855,9 +7669,7 @@ def group_by_overflow(data, command_order, fields, args):
 
                 for field in fields:
 
-                    field_plus_count.append((field, data[flag][field]['count']))
-
-                field_plus_count.sort(key=get_numeric, reverse=True)
+                    field_plus_count.append(("|".join(group_fields(field)) if isinstance(flag, tuple) else field, data[flag][field]['count']))
 
                 k = int(args.top[0])
 
@@ -869,16 +7681,17 @@ def group_by_overflow(data, command_order, fields, args):
 
                     k = len(field_plus_count)
 
-                for i in range(k):
+                field_plus_count = heapq.nlargest(k, field_plus_count, key=get_numeric)
 
-                    value_string += ('\"' + str(field_plus_count[i][0]).strip() + ": " + str(field_plus_count[i][1]).strip() + '\"' + ",")
+                top_values = []
 
+                for i in range(k):
 
-    if(value_string.endswith(",")):
+                    top_values.append('\"' + str(field_plus_count[i][0]).strip() + ": " + str(field_plus_count[i][1]).strip() + '\"')
 
-        value_string = value_string[:-1]
+                values.append(",".join(top_values))
 
-    print(value_string)
+    return values
 
 
 if __name__ == "__main__":
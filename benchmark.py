@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+
+import csv
+import argparse
+import sys
+import os
+import json
+import platform
+import random
+import subprocess
+import time
+
+# Synthetic input files copy the schema and the value distribution of StudentsPerformance.csv by drawing its
+# records at random. They are written in batches of BATCH_ROWS records.
+
+SOURCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "StudentsPerformance.csv")
+OLAP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "OLAP.py")
+BATCH_ROWS = 10000
+NON_NUMERIC_VALUE = "n/a"
+GROUP_FIELD = "race/ethnicity"
+MAX_NON_NUMERIC = 100
+
+# Every workload is a name and the aggregate arguments of OLAP.py it runs. groupby_wide groups by GROUP_FIELD,
+# which has more than 20 values when the files are generated with --groups above 20, so the output is capped.
+# OLAP.py stops with exit code 7 after more than MAX_NON_NUMERIC non-numeric values in a column, so the workloads that
+# aggregate the scores run on files with at most half that many non-numeric scores expected in every score column
+
+WORKLOADS = [
+    ("count", ["--count"]),
+    ("sum", ["--sum", "math score"]),
+    ("mean", ["--mean", "math score", "--mean", "reading score", "--mean", "writing score"]),
+    ("groupby", ["--groupby", "parental level of education", "--count", "--mean", "math score", "--max", "reading score"]),
+    ("groupby_wide", ["--groupby", GROUP_FIELD, "--count", "--mean", "math score"]),
+    ("top", ["--top", "3", "parental level of education"]),
+]
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Generates synthetic input files with the schema of StudentsPerformance.csv and benchmarks OLAP.py on them")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser("generate", help="Writes one synthetic input file")
+    generate_parser.add_argument("--rows", type=row_count, required=True, help="The number of records, e.g. 10K, 1M or 100M")
+    generate_parser.add_argument("--output", required=True, help="The name of the file to write")
+    add_data_arguments(generate_parser)
+
+    run_parser = subparsers.add_parser("run", help="Runs every workload on synthetic input files of every size and compares the results to a baseline")
+    run_parser.add_argument("--rows", type=row_count, nargs='+', default=[10000, 100000], help="The number of records of every input file (default: 10K 100K)")
+    run_parser.add_argument("--workloads", nargs='+', choices=[name for (name, arguments) in WORKLOADS], help="The workloads to run (default: all)")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Runs every workload this many times and keeps the fastest run (default: 3)")
+    run_parser.add_argument("--data-dir", default="benchmark_data", help="Where the input files are generated. Files that already exist are reused (default: benchmark_data)")
+    run_parser.add_argument("--output", default="benchmark_results.json", help="The JSON file the results are written to (default: benchmark_results.json)")
+    run_parser.add_argument("--baseline", default="benchmark_baseline.json", help="The JSON file of earlier results to compare to (default: benchmark_baseline.json)")
+    run_parser.add_argument("--save-baseline", action="store_true", help="Also writes the results to the baseline file")
+    run_parser.add_argument("--tolerance", type=float, default=0.1, help="The share by which rows/sec may drop or peak memory may grow before it is reported as a regression (default: 0.1)")
+    add_data_arguments(run_parser)
+
+    args = parser.parse_args()
+
+    if(args.command == "generate"):
+
+        generate(args.output, args.rows, args.groups, args.non_numeric_rate, args.seed)
+        return
+
+    if(args.repeat < 1):
+
+        print("Error: The argument for repeat must be an integer greater than 0.", end="", file=sys.stderr)
+        exit(6)
+
+    if(args.workloads):
+
+        workloads = [workload for workload in WORKLOADS if workload[0] in args.workloads]
+
+    else:
+
+        workloads = WORKLOADS
+
+    results = run(workloads, args)
+
+    with open(args.output, 'w') as output_file:
+
+        json.dump(results, output_file, indent=1)
+
+    regressions = compare(results, args.baseline, args.tolerance)
+
+    if(args.save_baseline):
+
+        with open(args.baseline, 'w') as baseline_file:
+
+            json.dump(results, baseline_file, indent=1)
+
+    failures = [result['workload'] for result in results['results'] if result['exit_code'] != 0]
+
+    if(failures):
+
+        print("Error: OLAP.py failed on the workloads {}, so their timings were not compared.".format(" ".join(sorted(set(failures)))), end="", file=sys.stderr)
+        exit(2)
+
+    if(regressions):
+
+        exit(1)
+
+def reads_scores(arguments):
+
+    """
+    Returns True if the workload arguments aggregate a score field, which fails on files with non-numeric scores
+    """
+
+    return any([argument.endswith(" score") for argument in arguments])
+
+def workload_rate(arguments, rows, non_numeric_rate):
+
+    """
+    Returns the share of non-numeric scores of the input file of rows records a workload runs on: non_numeric_rate,
+    lowered for the workloads that aggregate the scores so that MAX_NON_NUMERIC / 2 non-numeric values are expected
+    in every score column and OLAP.py does not stop at MAX_NON_NUMERIC
+    """
+
+    if(reads_scores(arguments)):
+
+        return min(non_numeric_rate, MAX_NON_NUMERIC / 2 / rows)
+
+    return non_numeric_rate
+
+def add_data_arguments(parser):
+
+    parser.add_argument("--groups", type=group_count, help="Draws {} from this many values instead of the values in StudentsPerformance.csv".format(GROUP_FIELD))
+    parser.add_argument("--non-numeric-rate", type=share, default=0.0, help="The share of score values replaced with the non-numeric value '{}', between 0 and 1. The workloads that aggregate the scores use a lower share on large files so that OLAP.py does not stop (default: 0)".format(NON_NUMERIC_VALUE))
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the random generator, so the same arguments generate the same file (default: 0)")
+
+def row_count(text):
+
+    """
+    Takes in a number of rows with an optional K or M suffix, e.g. 100M, and returns it as an integer
+    """
+
+    multipliers = {'K': 1000, 'M': 1000000}
+    suffix = text[-1:].upper()
+
+    try:
+
+        if(suffix in multipliers):
+
+            rows = int(float(text[:-1]) * multipliers[suffix])
+
+        else:
+
+            rows = int(text)
+
+    except ValueError:
+
+        raise argparse.ArgumentTypeError("invalid number of rows: '{}'".format(text))
+
+    if(rows < 1):
+
+        raise argparse.ArgumentTypeError("the number of rows must be greater than 0")
+
+    return rows
+
+def group_count(text):
+
+    """
+    Takes in the number of values of GROUP_FIELD and returns it as an integer
+    """
+
+    try:
+
+        groups = int(text)
+
+    except ValueError:
+
+        raise argparse.ArgumentTypeError("invalid number of groups: '{}'".format(text))
+
+    if(groups < 1):
+
+        raise argparse.ArgumentTypeError("the number of groups must be greater than 0")
+
+    return groups
+
+def share(text):
+
+    """
+    Takes in a share between 0 and 1 and returns it as a float
+    """
+
+    try:
+
+        value = float(text)
+
+    except ValueError:
+
+        raise argparse.ArgumentTypeError("invalid share: '{}'".format(text))
+
+    if(not 0 <= value <= 1):
+
+        raise argparse.ArgumentTypeError("the share must be between 0 and 1")
+
+    return value
+
+def generate(file_name, rows, groups=None, non_numeric_rate=0.0, seed=0):
+
+    """
+    Writes a csv file of rows records drawn at random from StudentsPerformance.csv.
+
+    groups:           draws GROUP_FIELD from groups values named "group 1" to "group <groups>" instead
+    non_numeric_rate: the share of score values replaced with NON_NUMERIC_VALUE
+
+    The file is written under a temporary name and renamed once it is complete.
+    """
+
+    with open(SOURCE_FILE, 'r', encoding="utf-8-sig", newline='') as source_file:
+
+        csv_reader = csv.reader(source_file)
+        header_line = next(csv_reader)
+        records = [line for line in csv_reader if len(line) == len(header_line)]
+
+    group_index = header_line.index(GROUP_FIELD)
+    score_indexes = [i for i in range(len(header_line)) if header_line[i].endswith(" score")]
+    generator = random.Random(seed)
+    temporary_name = file_name + ".tmp{}".format(os.getpid())
+
+    with open(temporary_name, 'w', newline='') as output_file:
+
+        csv_writer = csv.writer(output_file, quoting=csv.QUOTE_ALL)
+        csv_writer.writerow(header_line)
+        written = 0
+
+        while(written < rows):
+
+            batch = generator.choices(records, k=min(BATCH_ROWS, rows - written))
+
+            # records are only copied when they are changed, since copying every record halves the speed
+
+            if(groups or non_numeric_rate):
+
+                batch = [list(line) for line in batch]
+
+                for line in batch:
+
+                    if(groups):
+
+                        line[group_index] = "group {}".format(generator.randrange(groups) + 1)
+
+                    for i in score_indexes:
+
+                        if(non_numeric_rate and generator.random() < non_numeric_rate):
+
+                            line[i] = NON_NUMERIC_VALUE
+
+            csv_writer.writerows(batch)
+            written += len(batch)
+
+    os.replace(temporary_name, file_name)
+
+def data_file(args, rows, non_numeric_rate):
+
+    """
+    Returns the name of the input file of rows records with a share of non_numeric_rate non-numeric scores,
+    generating it if it does not exist yet
+    """
+
+    file_name = os.path.join(args.data_dir, "students_{}_{}_{}_{}.csv".format(rows, args.groups or "source", non_numeric_rate, args.seed))
+
+    if(not os.path.exists(file_name)):
+
+        os.makedirs(args.data_dir, exist_ok=True)
+        print("Generating {}".format(file_name), file=sys.stderr)
+        generate(file_name, rows, args.groups, non_numeric_rate, args.seed)
+
+    return file_name
+
+def measure(file_name, arguments):
+
+    """
+    Runs OLAP.py on file_name with arguments, without its cache or cube.
+    Returns: the wall time in seconds, the peak resident memory in bytes and the exit code of the run
+    """
+
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, OLAP_FILE, "--input", file_name, "--no-cache"] + arguments, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    # wait4 returns the resource usage of this one child, unlike getrusage(RUSAGE_CHILDREN)
+    (pid, status, usage) = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+    return (wall_time, peak, process.returncode)
+
+def run(workloads, args):
+
+    """
+    Runs every workload args.repeat times on the input file of every size in args.rows.
+    Returns: the results as a dictionary that can be written as JSON
+    """
+
+    results = []
+
+    for rows in args.rows:
+
+        for (name, arguments) in workloads:
+
+            non_numeric_rate = workload_rate(arguments, rows, args.non_numeric_rate)
+            file_name = data_file(args, rows, non_numeric_rate)
+            runs = [measure(file_name, arguments) for i in range(args.repeat)]
+            failed_runs = [run for run in runs if run[2] != 0]
+
+            # the time of a run that stopped with an error says nothing about the speed of the workload
+
+            if(failed_runs):
+
+                result = {'workload': name, 'rows': rows, 'non_numeric_rate': non_numeric_rate, 'wall_time': None, 'rows_per_sec': None, 'peak_rss': None, 'exit_code': failed_runs[0][2]}
+                results.append(result)
+
+                print("{:<14}{:>12} rows  FAILED with exit code {}".format(name, rows, result['exit_code']), file=sys.stderr)
+                continue
+
+            (wall_time, peak, exit_code) = min(runs)
+            result = {'workload': name, 'rows': rows, 'non_numeric_rate': non_numeric_rate, 'wall_time': wall_time, 'rows_per_sec': rows / wall_time,
+                      'peak_rss': max([run[1] for run in runs]), 'exit_code': exit_code}
+            results.append(result)
+
+            print("{:<14}{:>12} rows{:>10.3f} s{:>14.0f} rows/sec{:>10.1f} MB peak".format(name, rows, wall_time, result['rows_per_sec'], result['peak_rss'] / 1e6), file=sys.stderr)
+
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'groups': args.groups,
+            'non_numeric_rate': args.non_numeric_rate, 'seed': args.seed, 'repeat': args.repeat, 'results': results}
+
+def compare(results, baseline_file, tolerance):
+
+    """
+    Compares results to the results in baseline_file that ran the same workload on the same number of rows of
+    the same kind of data, and prints every change. A drop in rows/sec or a growth of the peak resident memory
+    by more than tolerance is a regression.
+
+    Workloads that failed in either run are skipped.
+
+    Returns: the number of regressions, or 0 if there is no baseline file
+    """
+
+    try:
+
+        with open(baseline_file, 'r') as input_file:
+
+            baseline = json.load(input_file)
+
+    except (OSError, ValueError):
+
+        print("No baseline to compare to in {}".format(baseline_file), file=sys.stderr)
+        return 0
+
+    if([baseline.get(name) for name in ('groups', 'non_numeric_rate', 'seed')] != [results[name] for name in ('groups', 'non_numeric_rate', 'seed')]):
+
+        print("The baseline in {} was measured on other data".format(baseline_file), file=sys.stderr)
+        return 0
+
+    baseline_results = {}
+
+    for result in baseline['results']:
+
+        baseline_results[(result['workload'], result['rows'])] = result
+
+    regressions = 0
+
+    for result in results['results']:
+
+        old_result = baseline_results.get((result['workload'], result['rows']))
+
+        # failed runs have no timings, so they are neither compared nor compared to
+
+        if(old_result == None or result['exit_code'] != 0 or old_result.get('exit_code', 0) != 0):
+
+            continue
+
+        speed_change = result['rows_per_sec'] / old_result['rows_per_sec'] - 1
+        memory_change = result['peak_rss'] / old_result['peak_rss'] - 1
+        regressed = speed_change < -tolerance or memory_change > tolerance
+
+        if(regressed):
+
+            regressions += 1
+
+        print("{:<14}{:>12} rows  rows/sec {:+7.1%}  peak memory {:+7.1%}{}".format(result['workload'], result['rows'], speed_change, memory_change, "  REGRESSION" if regressed else ""), file=sys.stderr)
+
+    return regressions
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,35 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from helpers import ROOT, SOURCE_FILE, write_table
+
+sys.path.insert(0, ROOT)
+
+@pytest.fixture
+def table(tmp_path):
+
+    """
+    The name of a csv file of 6000 records written by write_table() in a temporary directory
+    """
+
+    file_name = str(tmp_path / "table.csv")
+    write_table(file_name, 6000)
+
+    return file_name
+
+@pytest.fixture
+def students(tmp_path):
+
+    """
+    The name of a copy of StudentsPerformance.csv in a temporary directory
+    """
+
+    file_name = str(tmp_path / "students.csv")
+    shutil.copyfile(SOURCE_FILE, file_name)
+
+    return file_name
@@ -0,0 +1,123 @@
+import csv
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+
+# The tests run OLAP.py as a command, the way it is used, on files written to a temporary directory so caches,
+# cubes and state files never land next to the files of the repository
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OLAP_FILE = os.path.join(ROOT, "OLAP.py")
+SOURCE_FILE = os.path.join(ROOT, "StudentsPerformance.csv")
+
+# Queries on the file written by write_table() that cover every kind of aggregate, group-by and top. x holds a few
+# empty and non-numeric values, so the messages about them and their line numbers are compared too, and h has more
+# than 20 values, so the output of grouping by it is capped
+
+QUERIES = [
+    ["--count"],
+    ["--count", "--sum", "x", "--mean", "y", "--min", "x", "--max", "y"],
+    ["--groupby", "g", "--count", "--mean", "x", "--max", "y"],
+    ["--groupby", "g", "h", "--count", "--sum", "y"],
+    ["--groupby", "h", "--no-cap", "--count", "--mean", "x"],
+    ["--top", "3", "h"],
+    ["--groupby", "k", "--top", "2", "h", "--min", "x"],
+    ["--median", "y", "--quantile", "0.9", "x", "--count-distinct", "h"],
+    ["--where", "g IN (a, b) AND y >= 10", "--groupby", "g", "--sum", "x"],
+]
+
+def olap(*arguments, stdin=None):
+
+    """
+    Runs OLAP.py with arguments, feeding it the bytes stdin on standard input if they are given.
+    Returns: the exit code and the text written to stdout and stderr
+    """
+
+    process = subprocess.run([sys.executable, OLAP_FILE] + [str(argument) for argument in arguments], input=stdin, capture_output=True)
+
+    return (process.returncode, process.stdout.decode("utf-8"), process.stderr.decode("utf-8"))
+
+def olap_sources(stats_file, *arguments):
+
+    """
+    Runs OLAP.py with arguments and --stats written to stats_file.
+    Returns: the exit code, stdout, stderr and the list of the sources every scan was read from, e.g. ['cache']
+    """
+
+    (exit_code, output, errors) = olap(*arguments, "--stats", stats_file)
+
+    with open(stats_file, 'r') as input_file:
+
+        sources = [scan['source'] for scan in json.load(input_file)['scans']]
+
+    return (exit_code, output, errors, sources)
+
+def write_table(file_name, rows, seed=0, line_breaks=False):
+
+    """
+    Writes a csv file of rows records with the fields g and k (a few values), h (300 values), x (floats with
+    some empty and non-numeric values), y (integers) and note (text with commas and quotes, and with line breaks
+    if line_breaks is True).
+
+    Returns: the records, without the header line
+    """
+
+    generator = random.Random(seed)
+    notes = ["plain", "has, comma", "has \"quote\""] + (["two\nlines", "ends with a line break\n"] if line_breaks else [])
+    records = []
+
+    for i in range(rows):
+
+        x = generator.choice(["n/a", ""]) if generator.random() < 0.006 else "{:.3f}".format(generator.gauss(10, 5))
+        records.append([generator.choice("abcde"), generator.choice(["north", "south", "east", "west"]), "h{}".format(generator.randrange(300)),
+                        x, str(generator.randint(-20, 100)), generator.choice(notes)])
+
+    write_records(file_name, ["g", "k", "h", "x", "y", "note"], records)
+
+    return records
+
+def write_skewed_table(file_name, rows, seed=0):
+
+    """
+    Writes a csv file of rows records for the sketches with the fields g (25 values, so a group-by has a row of the
+    remaining groups), u (integers from 50000 values), z (values of a long tailed distribution, a few of them
+    common) and v (floats with a long tailed distribution).
+
+    Returns: the records, without the header line
+    """
+
+    generator = random.Random(seed)
+    records = []
+
+    for i in range(rows):
+
+        records.append(["g{:02d}".format(generator.randrange(25)), str(generator.randrange(50000)), "z{}".format(int(generator.paretovariate(1.1))),
+                        "{:.4f}".format(generator.lognormvariate(0, 1))])
+
+    write_records(file_name, ["g", "u", "z", "v"], records)
+
+    return records
+
+def write_records(file_name, header_line, records):
+
+    with open(file_name, 'w', newline='') as output_file:
+
+        csv_writer = csv.writer(output_file)
+        csv_writer.writerow(header_line)
+        csv_writer.writerows(records)
+
+def read_result(output):
+
+    """
+    Returns the header and rows of a csv result, and the values of its _ci95 columns in a dictionary per row
+    keyed by the column before them
+    """
+
+    [header, *rows] = list(csv.reader(io.StringIO(output)))
+    columns = [i for i in range(len(header)) if not header[i].endswith("_ci95")]
+    intervals = [{header[i - 1]: row[i] for i in range(len(header)) if header[i].endswith("_ci95")} for row in rows]
+
+    return ([header[i] for i in columns], [[row[i] for i in columns] for row in rows], intervals)
@@ -0,0 +1,44 @@
+import pytest
+
+from OLAP import Dataset
+
+from helpers import QUERIES, olap, olap_sources, write_table
+
+@pytest.fixture
+def cached_table(table):
+
+    assert olap("--input", table, "--cache", "--count")[0] == 0
+
+    return table
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_cache_matches_csv(cached_table, tmp_path, query):
+
+    (exit_code, output, errors, sources) = olap_sources(str(tmp_path / "stats.json"), "--input", cached_table, *query)
+
+    assert sources == ['cache']
+    assert (exit_code, output, errors) == olap("--input", cached_table, "--no-cache", *query)
+
+def test_cache_is_ignored_once_the_file_changes(cached_table, tmp_path):
+
+    write_table(cached_table, 5000, seed=1)
+    query = ["--groupby", "g", "--count", "--mean", "x"]
+    (exit_code, output, errors, sources) = olap_sources(str(tmp_path / "stats.json"), "--input", cached_table, *query)
+
+    assert sources == ['csv']
+    assert (exit_code, output, errors) == olap("--input", cached_table, "--no-cache", *query)
+
+@pytest.mark.parametrize("query", [
+    {'aggs': ["count", ("sum", "x"), ("mean", "y"), ("min", "x"), ("max", "y")]},
+    {'aggs': ["count", ("mean", "x")], 'groupby': "g"},
+    {'aggs': ["count", ("sum", "y")], 'groupby': ["g", "h"]},
+    {'aggs': [("top", 3, "h")]},
+    {'aggs': ["count", ("max", "x")], 'groupby': "k", 'top': (2, "h")},
+    {'aggs': [("sum", "x")], 'groupby': "h", 'order_by': ("sum_x", "desc"), 'limit': 5},
+])
+def test_loaded_columns_match_csv(table, query):
+
+    columns_result = Dataset.open(table).query(**query)
+    csv_result = Dataset.open(table, load=False, use_cache=False).query(**query)
+
+    assert (columns_result.header, columns_result.rows, columns_result.warnings) == (csv_result.header, csv_result.rows, csv_result.warnings)
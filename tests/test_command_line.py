@@ -0,0 +1,51 @@
+import pytest
+
+from OLAP import Dataset, OLAPError
+
+from helpers import olap
+
+@pytest.fixture
+def years(tmp_path):
+
+    # a field named only with digits, which the command line used to drop from its arguments
+    file_name = str(tmp_path / "years.csv")
+
+    with open(file_name, 'w') as output_file:
+
+        output_file.write("region,2020,2021\nnorth,1,10\nsouth,2,20\nnorth,3,30\n")
+
+    return file_name
+
+def test_fields_named_with_digits(years):
+
+    assert olap("--input", years, "--sum", "2020", "--count", "--max", "2021") == (0, "sum_2020,count,max_2021\n6.0,3,30.0\n", "")
+    assert olap("--input", years, "--groupby", "region", "--quantile", "0", "2021", "--top", "1", "2020") == \
+           (0, "region,quantile_0_2021,top_2020\nnorth,10.0,\"1: 1\"\nsouth,20.0,\"2: 1\"\n", "")
+
+def test_aggregates_keep_the_order_of_the_command_line(years):
+
+    (exit_code, output, errors) = olap("--input", years, "--mean", "2021", "--count", "--min", "2020", "--count-distinct", "region", "--median", "2021")
+
+    assert output.splitlines()[0] == "mean_2021,count,min_2020,count_distinct_region,median_2021"
+    assert output == Dataset.open(years).query(aggs=[("mean", "2021"), "count", ("min", "2020"), ("count_distinct", "region"), ("median", "2021")]).to_csv()
+
+@pytest.mark.parametrize("arguments", [["--max"], ["--min", "2020", "2021"], ["--count", "--median"]])
+def test_aggregate_needs_one_field(years, arguments):
+
+    (exit_code, output, errors) = olap("--input", years, *arguments)
+
+    assert (exit_code, output) == (6, "")
+    assert "with one argument everytime it is called" in errors
+
+def test_query_checks_are_made_by_the_api(years):
+
+    # the command line only checks the arguments that the API doesn't have
+    for (arguments, api_call) in ((["--workers", "0", "--count"], lambda: Dataset.open(years, workers=0)),
+                                  (["--keep-sample", "--count"], lambda: Dataset.open(years).query(aggs=["count"], keep_sample=True)),
+                                  (["--top", "0", "region"], lambda: Dataset.open(years).query(top=(0, "region")))):
+
+        with pytest.raises(OLAPError) as error:
+
+            api_call()
+
+        assert olap("--input", years, *arguments) == (6, "", error.value.message + "\n")
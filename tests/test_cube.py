@@ -0,0 +1,41 @@
+import pytest
+
+from helpers import olap, olap_sources
+
+# Queries that only group by and take top k of the dims g and k and only aggregate the measures x and y
+
+CUBE_QUERIES = [
+    ["--count"],
+    ["--count", "--sum", "x", "--mean", "y", "--min", "x", "--max", "y"],
+    ["--groupby", "g", "--count", "--mean", "x", "--max", "y"],
+    ["--groupby", "g", "k", "--sum", "y", "--min", "x"],
+    ["--groupby", "k", "g", "--count", "--mean", "y"],
+    ["--top", "2", "k"],
+    ["--groupby", "g", "--top", "3", "k", "--sum", "x"],
+    ["--groupby", "k", "--mean", "x", "--order-by", "mean_x", "desc", "--limit", "2"],
+]
+
+@pytest.fixture
+def cubed_table(table):
+
+    assert olap("--input", table, "--build-cube", "g", "k", "--measures", "x", "y")[0] == 0
+
+    return table
+
+@pytest.mark.parametrize("query", CUBE_QUERIES)
+def test_cube_matches_csv(cubed_table, tmp_path, query):
+
+    (exit_code, output, errors, sources) = olap_sources(str(tmp_path / "stats.json"), "--input", cubed_table, *query)
+
+    assert sources == ['cube']
+    assert (exit_code, output, errors) == olap("--input", cubed_table, "--no-cache", *query)
+
+def test_queries_the_cube_cant_answer_read_the_csv_file(cubed_table, tmp_path):
+
+    # h is not a dim and the median is not kept in the cube
+    for query in (["--groupby", "h", "--count"], ["--median", "y"], ["--count", "--where", "g = a"]):
+
+        (exit_code, output, errors, sources) = olap_sources(str(tmp_path / "stats.json"), "--input", cubed_table, *query)
+
+        assert sources == ['csv']
+        assert (exit_code, output, errors) == olap("--input", cubed_table, "--no-cache", *query)
@@ -0,0 +1,45 @@
+import collections
+
+from OLAP import Dataset
+
+from helpers import olap, write_records, write_table
+
+def test_every_combination_is_a_group(tmp_path):
+
+    file_name = str(tmp_path / "table.csv")
+    records = write_table(file_name, 6000)
+    groups = collections.defaultdict(list)
+
+    for record in records:
+
+        groups[(record[0], record[1])].append(int(record[4]))
+
+    # g and k have 5 and 4 values, so all 20 combinations are output in the order of their values
+    expected = "g,k,count,sum_y,max_y\n" + "".join(["{},{},{},{},{}\n".format(g, k, len(groups[(g, k)]), float(sum(groups[(g, k)])), float(max(groups[(g, k)]))) for (g, k) in sorted(groups)])
+
+    assert len(groups) == 20
+    assert olap("--input", file_name, "--groupby", "g", "k", "--count", "--sum", "y", "--max", "y") == (0, expected, "")
+    assert Dataset.open(file_name).query(aggs=["count", ("sum", "y"), ("max", "y")], groupby=["g", "k"]).to_csv() == expected
+
+def test_combinations_are_capped_at_20_groups(table):
+
+    (exit_code, output, errors) = olap("--input", table, "--groupby", "g", "h", "--count", "--mean", "y")
+    (all_exit_code, all_output, all_errors) = olap("--input", table, "--groupby", "g", "h", "--count", "--mean", "y", "--no-cap")
+    rows = output.splitlines()
+    all_rows = all_output.splitlines()
+
+    assert (exit_code, all_exit_code, all_errors) == (0, 0, "")
+    assert errors.splitlines() == ["Error: {}:g h has been capped at 20 distinct values".format(table), "Error: {}:group-by argument g h has high cardinality".format(table)]
+
+    # the first 20 groups come before the row of the remaining groups, whose group-by values are empty
+    assert rows[:21] == all_rows[:21] and len(all_rows) > 22
+    assert rows[21].startswith("_OTHER,,")
+    assert int(rows[21].split(",")[2]) == sum([int(row.split(",")[2]) for row in all_rows[21:]])
+
+def test_values_of_a_combination_are_kept_apart(tmp_path):
+
+    # the values of the fields are kept apart, so "a,b" + "c" is not the same group as "a" + "b,c"
+    file_name = str(tmp_path / "commas.csv")
+    write_records(file_name, ["first", "second", "v"], [["a,b", "c", "1"], ["a", "b,c", "2"], ["a", "b,c", "3"], ["A", "b,c", "4"]])
+
+    assert Dataset.open(file_name).query(aggs=["count", ("sum", "v")], groupby=["first", "second"]).rows == [["A", "b,c", 1, 4.0], ["a", "b,c", 2, 5.0], ["a,b", "c", 1, 1.0]]
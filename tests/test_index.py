@@ -0,0 +1,41 @@
+import pytest
+
+from helpers import olap, olap_sources, write_records, write_table
+
+# Filters that the bitmap indexes of g and k or the zone maps of the numeric fields can answer, and ones they
+# can only partly answer
+
+INDEX_FILTERS = [
+    "g = a",
+    "g != b",
+    "k IN (north, west) AND g = c",
+    "NOT k = east OR g = d",
+    "y >= 90",
+    "y < -15 OR y > 99",
+    "y >= 40 AND y < 41 AND k = south",
+    "h = h7",
+    "x > 20 AND g IN (a, e)",
+    "g = nope",
+]
+
+@pytest.fixture(scope="module")
+def indexed_table(tmp_path_factory):
+
+    # sorting by y gives the zone maps of the blocks of 16384 records ranges of y that filters can skip
+    file_name = str(tmp_path_factory.mktemp("index") / "sorted.csv")
+    records = write_table(file_name, 40000)
+    records.sort(key=lambda record: int(record[4]))
+    write_records(file_name, ["g", "k", "h", "x", "y", "note"], records)
+
+    assert olap("--input", file_name, "--cache", "--index", "g", "k", "--count")[0] == 0
+
+    return file_name
+
+@pytest.mark.parametrize("where", INDEX_FILTERS)
+def test_indexed_cache_matches_csv(indexed_table, tmp_path, where):
+
+    query = ["--groupby", "k", "--count", "--mean", "x", "--max", "y", "--where", where]
+    (exit_code, output, errors, sources) = olap_sources(str(tmp_path / "stats.json"), "--input", indexed_table, *query)
+
+    assert sources == ['cache']
+    assert (exit_code, output, errors) == olap("--input", indexed_table, "--no-cache", *query)
@@ -0,0 +1,75 @@
+import bz2
+import gzip
+import lzma
+
+import pytest
+
+from helpers import olap
+
+QUERY = ["--groupby", "g", "--count", "--mean", "x", "--top", "2", "h"]
+
+COMPRESSIONS = [("gz", gzip.compress), ("bz2", bz2.compress), ("xz", lzma.compress)]
+
+@pytest.mark.parametrize(("suffix", "compress"), COMPRESSIONS)
+def test_compressed_file_matches_plain_file(table, suffix, compress):
+
+    with open(table, 'rb') as input_file:
+
+        data = input_file.read()
+
+    with open(table + "." + suffix, 'wb') as output_file:
+
+        output_file.write(compress(data))
+
+    (exit_code, output, errors) = olap("--input", table, "--no-cache", *QUERY)
+
+    assert exit_code == 0
+    assert olap("--input", table + "." + suffix, *QUERY) == (exit_code, output, errors.replace(table, table + "." + suffix))
+
+@pytest.mark.parametrize(("suffix", "compress"), COMPRESSIONS + [("csv", lambda data: data)])
+def test_standard_input_matches_plain_file(table, suffix, compress):
+
+    with open(table, 'rb') as input_file:
+
+        data = input_file.read()
+
+    (exit_code, output, errors) = olap("--input", table, "--no-cache", *QUERY)
+
+    assert olap("--input", "-", *QUERY, stdin=compress(data)) == (exit_code, output, errors.replace(table, "-"))
+
+def test_truncated_file_is_reported_as_corrupt(table):
+
+    with open(table, 'rb') as input_file:
+
+        data = gzip.compress(input_file.read())
+
+    with open(table + ".gz", 'wb') as output_file:
+
+        output_file.write(data[:len(data) // 2])
+
+    for arguments in (["--input", table + ".gz"], ["--input", table + ".gz", "--cache"], ["--input", "-"]):
+
+        (exit_code, output, errors) = olap(*arguments, "--count", stdin=data[:len(data) // 2])
+
+        assert exit_code == 6
+        assert "corrupt or truncated" in errors and "not found" not in errors
+
+def test_invalid_utf8_is_reported(tmp_path):
+
+    file_name = str(tmp_path / "latin1.csv")
+
+    with open(file_name, 'wb') as output_file:
+
+        output_file.write("name,value\ncafé,1\n".encode("latin-1"))
+
+    (exit_code, output, errors) = olap("--input", file_name, "--count")
+
+    assert exit_code == 6
+    assert "not utf-8 text" in errors
+
+def test_missing_file_is_reported(tmp_path):
+
+    (exit_code, output, errors) = olap("--input", tmp_path / "missing.csv", "--count")
+
+    assert exit_code == 6
+    assert "not found" in errors
@@ -0,0 +1,69 @@
+import pytest
+
+from OLAP import Dataset, OLAPError
+
+from helpers import olap, write_records
+
+# region a and c have 3 records, b and e have 2 and the same sum as a, and f has no numeric amount
+RECORDS = [["a", "1"], ["b", "4"], ["c", "1"], ["a", "2"], ["d", "2"], ["e", "10"], ["c", "1"], ["b", "6"], ["a", "7"], ["e", "0"], ["c", "3"], ["f", "n/a"]]
+
+@pytest.fixture
+def sales(tmp_path):
+
+    file_name = str(tmp_path / "sales.csv")
+    write_records(file_name, ["region", "amount"], RECORDS)
+
+    return file_name
+
+def ordered_regions(file_name, *order_by):
+
+    (exit_code, output, errors) = olap("--input", file_name, "--groupby", "region", "--count", "--sum", "amount", "--mean", "amount", "--order-by", *order_by)
+
+    assert exit_code == 0
+
+    return [line.split(",")[0] for line in output.splitlines()[1:]]
+
+@pytest.mark.parametrize(("order_by", "regions"), [
+    (["count"], ["d", "f", "b", "e", "a", "c"]),
+    (["count", "asc"], ["d", "f", "b", "e", "a", "c"]),
+    (["count", "desc"], ["a", "c", "b", "e", "d", "f"]),
+    (["sum_amount", "desc"], ["a", "b", "e", "c", "d", "f"]),
+    (["mean_amount"], ["c", "d", "a", "b", "e", "f"]),
+    (["mean_amount", "desc"], ["b", "e", "a", "d", "c", "f"]),
+])
+def test_groups_are_ordered_by_the_aggregate(sales, order_by, regions):
+
+    # groups that tie are in the order of their values in both directions, and the NaN of f comes last
+    assert ordered_regions(sales, *order_by) == regions
+
+def test_limit_keeps_the_first_groups(sales):
+
+    (exit_code, output, errors) = olap("--input", sales, "--groupby", "region", "--count", "--order-by", "count", "desc", "--limit", "2")
+
+    assert (exit_code, output) == (0, "region,count\na,3\nc,3\n_OTHER,6\n")
+    assert "region has been capped at 2 distinct values" in errors
+
+def test_limit_above_the_number_of_groups_keeps_every_group(sales):
+
+    (exit_code, output, errors) = olap("--input", sales, "--groupby", "region", "--count", "--order-by", "count", "desc", "--limit", "100")
+
+    assert (exit_code, output, errors) == (0, "region,count\na,3\nc,3\nb,2\ne,2\nd,1\nf,1\n", "")
+
+@pytest.mark.parametrize("order_by", [["max_amount"], ["amount"], ["count", "sideways"], ["sum_amount", "desc", "asc"]])
+def test_order_by_needs_an_aggregate_of_the_output(sales, order_by):
+
+    (exit_code, output, errors) = olap("--input", sales, "--groupby", "region", "--count", "--sum", "amount", "--order-by", *order_by)
+
+    assert (exit_code, output) == (6, "")
+    assert "order-by takes the name of an aggregate column of the output" in errors
+
+    with pytest.raises(OLAPError) as error:
+
+        Dataset.open(sales).query(aggs=["count", ("sum", "amount")], groupby="region", order_by=tuple(order_by) if len(order_by) > 1 else order_by[0])
+
+    assert error.value.exit_code == 6
+
+def test_order_by_and_limit_need_group_by(sales):
+
+    assert olap("--input", sales, "--count", "--order-by", "count") == (6, "", "Error: {}: order-by and limit need group-by\n".format(sales))
+    assert olap("--input", sales, "--count", "--limit", "2")[0] == 6
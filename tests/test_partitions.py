@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from helpers import olap, write_records, write_table
+
+HEADER_LINE = ["g", "k", "h", "x", "y", "note"]
+DAYS = ["2026-10-01", "2026-10-02", "2026-10-03"]
+
+@pytest.fixture
+def partitioned(tmp_path):
+
+    """
+    Writes the records of a table into one directory dt=<day> per day and into one file with a dt field.
+    Returns: the directory of the partitions, the file and the records of every day
+    """
+
+    records = write_table(str(tmp_path / "records.csv"), 6000)
+    days = {}
+
+    for i in range(len(DAYS)):
+
+        days[DAYS[i]] = records[i * 2000:(i + 1) * 2000]
+        os.makedirs(str(tmp_path / "data" / ("dt=" + DAYS[i])))
+        write_records(str(tmp_path / "data" / ("dt=" + DAYS[i]) / "part.csv"), HEADER_LINE, days[DAYS[i]])
+
+    write_records(str(tmp_path / "whole.csv"), HEADER_LINE + ["dt"], [record + [day] for day in DAYS for record in days[day]])
+
+    return (str(tmp_path / "data"), str(tmp_path / "whole.csv"), days)
+
+@pytest.mark.parametrize("query", [
+    ["--count", "--sum", "y", "--mean", "x"],
+    ["--groupby", "dt", "--count", "--max", "y"],
+    ["--groupby", "dt", "g", "--sum", "x"],
+    ["--top", "2", "dt"],
+    ["--groupby", "k", "--count", "--where", "dt IN ('2026-10-01', '2026-10-03') AND y > 20"],
+    ["--count", "--where", "NOT dt = '2026-10-02'"],
+])
+def test_partitions_match_one_file(partitioned, query):
+
+    (directory, file_name, days) = partitioned
+    expected = olap("--input", file_name, "--no-cache", *query)
+
+    assert expected[0] == 0
+
+    for workers in (1, 3):
+
+        assert olap("--input", directory, "--workers", workers, *query)[:2] == expected[:2]
+        assert olap("--input", os.path.join(directory, "*", "*.csv"), "--workers", workers, *query)[:2] == expected[:2]
+
+def test_non_numeric_values_name_their_file_and_line(partitioned):
+
+    (directory, file_name, days) = partitioned
+    expected = []
+
+    for day in DAYS:
+
+        for i in range(len(days[day])):
+
+            try:
+
+                float(days[day][i][3])
+
+            except ValueError:
+
+                # the first record of a file is on line 2, after the header line
+                expected.append("Error:{}:{} can't compute mean or sum on non-numeric value '{}'".format(os.path.join(directory, "dt=" + day, "part.csv"), i + 2, days[day][i][3]))
+
+    assert expected
+    assert olap("--input", directory, "--mean", "x")[2].splitlines() == expected
@@ -0,0 +1,73 @@
+import re
+
+import pytest
+
+from helpers import olap, read_result
+
+QUERY = ["--groupby", "g", "--count", "--mean", "y", "--sum", "y", "--top", "2", "k"]
+
+def read_reports(errors):
+
+    """
+    Returns the number of rows read and the lines of every progress report written to stderr
+    """
+
+    reports = []
+
+    for line in errors.splitlines():
+
+        match = re.match(r"# progress: (\d+) rows read", line)
+
+        if(match):
+
+            reports.append((int(match.group(1)), []))
+
+        else:
+
+            reports[-1][1].append(line)
+
+    return reports
+
+@pytest.mark.parametrize(("every", "rows_read"), [(1000, [1000, 2000, 3000, 4000, 5000, 6000]), (2500, [2500, 5000, 6000])])
+def test_reports_come_every_n_rows(table, every, rows_read):
+
+    (exit_code, output, errors) = olap("--input", table, "--no-cache", "--progress-every", every, *QUERY)
+    reports = read_reports(errors)
+
+    assert [report[0] for report in reports] == rows_read
+    assert (exit_code, output) == olap("--input", table, "--no-cache", *QUERY)[:2]
+
+def test_intervals_shrink_to_zero(table):
+
+    (exit_code, output, errors) = olap("--input", table, "--no-cache", "--progress-every", 1000, *QUERY)
+    reports = [read_result("\n".join(lines)) for (rows, lines) in read_reports(errors)]
+
+    # the estimates of the first report are uncertain, and the ones of the last report are the result
+    for row in reports[0][2]:
+
+        assert float(row['count']) > 0 and float(row['mean_y']) > 0 and float(row['sum_y']) > 0
+
+    assert reports[-1][:2] == read_result(output)[:2]
+
+    for row in reports[-1][2]:
+
+        assert (row['count'], row['mean_y'], row['sum_y']) == ("0.0", "0.0", "0.0")
+        assert [pair.split(": ")[1] for pair in row['top_k'].split(",")] == ["0.0", "0.0"]
+
+def test_standard_input_reports_rows_read(table):
+
+    with open(table, 'rb') as input_file:
+
+        data = input_file.read()
+
+    (exit_code, output, errors) = olap("--input", "-", "--progress-every", 2500, *QUERY, stdin=data)
+    reports = read_reports(errors)
+
+    # the size of standard input is not known, so only the means have an interval
+    assert [report[0] for report in reports] == [2500, 5000, 6000]
+    assert read_result("\n".join(reports[-1][1]))[:2] == read_result(output)[:2]
+
+    for row in read_result("\n".join(reports[0][1]))[2]:
+
+        assert (row['count'], row['sum_y'], row['top_k']) == ("", "", "")
+        assert float(row['mean_y']) > 0
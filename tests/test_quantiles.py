@@ -0,0 +1,92 @@
+import bisect
+import math
+
+import pytest
+
+from helpers import olap, read_result, write_skewed_table
+
+QUANTILES = (0.5, 0.99, 0.01)
+
+QUANTILE_ARGUMENTS = ["--median", "v", "--quantile", "0.99", "v", "--quantile", "0.01", "v"]
+
+@pytest.fixture(scope="module")
+def skewed(tmp_path_factory):
+
+    file_name = str(tmp_path_factory.mktemp("skewed") / "skewed.csv")
+
+    return (file_name, write_skewed_table(file_name, 40000))
+
+def group_values(records, group):
+
+    """
+    Returns the sorted values of v of a row of a result grouped by g, or of every record if group is None.
+    _OTHER holds the records of the groups after the first 20.
+    """
+
+    if(group == "_OTHER"):
+
+        groups = ["g{:02d}".format(i) for i in range(20, 25)]
+
+    else:
+
+        groups = [group]
+
+    return sorted([float(record[3]) for record in records if group == None or record[0] in groups])
+
+def rank_error(values, estimate, quantile):
+
+    """
+    Returns how far quantile is from the share of the values below estimate, or 0 if it falls among the values
+    equal to estimate
+    """
+
+    lowest = bisect.bisect_left(values, estimate) / len(values)
+    highest = bisect.bisect_right(values, estimate) / len(values)
+
+    return max(lowest - quantile, quantile - highest, 0)
+
+# a t-digest of compression C keeps about C centroids, smaller ones near the lowest and highest values, so its rank
+# error is about sqrt(q * (1 - q)) / C; the estimates are checked against 4 times that. g has 25 values, so the last
+# row merges the digests of the remaining groups, and the workers merge the digests of their parts of the file
+
+@pytest.mark.parametrize("compression", [20, 50, 100])
+@pytest.mark.parametrize("arguments", [["--groupby", "g"], ["--workers", "3", "--no-cache"], ["--groupby", "g", "--workers", "3", "--no-cache"]])
+def test_estimates_are_within_the_rank_error_of_the_sketch(skewed, compression, arguments):
+
+    (file_name, records) = skewed
+    (exit_code, output, errors) = olap("--input", file_name, *QUANTILE_ARGUMENTS, "--quantile-sketch", compression, *arguments)
+    (header, rows, intervals) = read_result(output)
+
+    assert exit_code == 0
+    assert len(rows) == (21 if "--groupby" in arguments else 1)
+
+    for row in rows:
+
+        values = group_values(records, row[0] if "--groupby" in arguments else None)
+
+        for i in range(len(QUANTILES)):
+
+            assert rank_error(values, float(row[i - 3]), QUANTILES[i]) <= 4 * math.sqrt(QUANTILES[i] * (1 - QUANTILES[i])) / compression
+
+@pytest.mark.parametrize(("compression", "arguments", "group"), [
+    (200, ["--where", "g = g03"], "g03"),
+    (200, ["--groupby", "g"], None),
+    (4000, [], None),
+    (4000, ["--workers", "3", "--no-cache"], None),
+])
+def test_estimates_are_exact_with_few_values(skewed, compression, arguments, group):
+
+    # a digest keeps every value until it holds more than 10 * compression of them
+    (file_name, records) = skewed
+    (exit_code, output, errors) = olap("--input", file_name, *QUANTILE_ARGUMENTS, *arguments)
+    (header, rows, intervals) = read_result(olap("--input", file_name, *QUANTILE_ARGUMENTS, "--quantile-sketch", compression, *arguments)[1])
+
+    assert exit_code == 0
+    assert len(rows) == len(read_result(output)[1])
+
+    for (row, exact_row) in zip(rows, read_result(output)[1]):
+
+        if(row[0] != "_OTHER"):
+
+            assert len(group_values(records, row[0] if "--groupby" in arguments else group)) <= 10 * compression
+            assert row == exact_row
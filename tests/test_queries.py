@@ -0,0 +1,83 @@
+import json
+
+from OLAP import Dataset, make_plan
+
+from helpers import olap
+
+BATCH = [
+    ({'aggregates': ["count", ["mean", "x"], ["max", "y"]], 'groupby': "g"}, ["--groupby", "g", "--count", "--mean", "x", "--max", "y"]),
+    ({'aggs': [["sum", "y"]], 'groupby': ["k", "g"], 'where': "y > 50"}, ["--groupby", "k", "g", "--sum", "y", "--where", "y > 50"]),
+    ({'top': [3, "h"], 'where': "k = north"}, ["--top", "3", "h", "--where", "k = north"]),
+    ({'aggregates': ["count"], 'groupby': "h", 'order_by': ["count", "desc"], 'limit': 4}, ["--groupby", "h", "--count", "--order-by", "count", "desc", "--limit", "4"]),
+]
+
+def write_queries(file_name, queries):
+
+    with open(file_name, 'w') as output_file:
+
+        for query in queries:
+
+            output_file.write(json.dumps(query) + "\n")
+
+def test_queries_file_matches_single_queries(table, tmp_path):
+
+    queries = []
+
+    for i in range(len(BATCH)):
+
+        queries.append(dict(BATCH[i][0], output=str(tmp_path / "result{}.csv".format(i))))
+
+    write_queries(str(tmp_path / "queries.jsonl"), queries)
+
+    assert olap("--input", table, "--queries", tmp_path / "queries.jsonl")[0] == 0
+
+    for i in range(len(BATCH)):
+
+        with open(queries[i]['output'], 'r') as result_file:
+
+            assert result_file.read() == olap("--input", table, *BATCH[i][1])[1]
+
+def test_query_many_matches_single_queries(table):
+
+    dataset = Dataset.open(table, load=False, use_cache=False)
+    queries = [{'aggs': ["count", ("mean", "x")], 'groupby': "g"}, {'aggs': [("sum", "y")], 'where': "g = a"}, {'aggs': [("min", "x")], 'groupby': "k", 'where': "y <= 0"}]
+    results = dataset.query_many(queries)
+
+    for i in range(len(queries)):
+
+        result = dataset.query(**queries[i])
+
+        assert (results[i].header, results[i].rows, results[i].warnings) == (result.header, result.rows, result.warnings)
+
+def test_failing_query_does_not_stop_the_batch(table, tmp_path):
+
+    write_queries(str(tmp_path / "queries.jsonl"), [{'name': "first", 'aggregates': ["count"]}, {'name': "broken", 'aggregates': [["mean", "nope"]]},
+                                                    {'name': "last", 'aggregates': [["sum", "y"]], 'where': "g = b"}])
+    (exit_code, output, errors) = olap("--input", table, "--queries", tmp_path / "queries.jsonl")
+
+    assert exit_code == 8
+    assert "nope" in errors
+    assert output == "# first\n" + olap("--input", table, "--count")[1] + "# broken\n# last\n" + olap("--input", table, "--sum", "y", "--where", "g = b")[1]
+
+def test_unknown_query_key_is_rejected(table, tmp_path):
+
+    write_queries(str(tmp_path / "queries.jsonl"), [{'aggregates': ["count"], 'group_by': "g"}])
+    (exit_code, output, errors) = olap("--input", table, "--queries", tmp_path / "queries.jsonl")
+
+    assert (exit_code, output) == (6, "")
+    assert "unknown key group_by" in errors
+
+def test_aggregates_of_one_field_share_one_running_state(table):
+
+    # max, min, mean and sum of x are read from one running sum, so its non-numeric values are kept once but still
+    # reported for every aggregate
+    dataset = Dataset.open(table, load=False, use_cache=False)
+    (command_order, args) = dataset.make_query([("max", "x"), ("min", "x"), ("sum", "x"), ("mean", "x"), ("max", "y")], "g", None, None, None, False, None, None, None, None, None, None, False)
+
+    assert make_plan(command_order, args)['groups'] == {'g': [("sum", "x"), ("sum", "y")]}
+
+    (exit_code, output, errors) = olap("--input", table, "--no-cache", "--groupby", "g", "--max", "x", "--min", "x", "--sum", "x", "--mean", "x")
+    separate = [olap("--input", table, "--no-cache", "--groupby", "g", "--" + name, "x") for name in ("max", "min", "sum", "mean")]
+
+    assert [line.split(",")[1:] for line in output.splitlines()] == [list(row) for row in zip(*[[line.split(",")[1] for line in result[1].splitlines()] for result in separate])]
+    assert sorted(errors.splitlines()) == sorted([line for result in separate for line in result[2].splitlines()])
@@ -0,0 +1,97 @@
+import json
+import statistics
+
+import pytest
+
+from helpers import QUERIES, olap, read_result, write_table
+
+SAMPLE_QUERY = ["--groupby", "g", "--count", "--mean", "y", "--sum", "y", "--top", "2", "k"]
+
+@pytest.mark.parametrize("sample", [["--sample", "0.2"], ["--sample-rows", "500"]])
+def test_same_arguments_give_the_same_sample(table, sample):
+
+    (exit_code, output, errors) = olap("--input", table, *sample, *SAMPLE_QUERY)
+
+    assert exit_code == 0
+    assert "Estimated from a sample of" in errors
+    assert olap("--input", table, *sample, *SAMPLE_QUERY) == (exit_code, output, errors)
+    assert olap("--input", table, *sample[:-1], "0.3" if sample[0] == "--sample" else "600", *SAMPLE_QUERY)[1] != output
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_whole_sample_gives_the_exact_result(table, query):
+
+    (exit_code, output, errors) = olap("--input", table, "--no-cache", *query)
+    (sample_exit_code, sample_output, sample_errors) = olap("--input", table, "--sample", "1", *query)
+    (header, rows, intervals) = read_result(sample_output)
+
+    assert sample_exit_code == exit_code == 0
+    assert (header, rows) == read_result(output)[:2]
+
+    # every half width is 0, or missing for the row of the remaining groups, and the ones of top are listed like its counts
+    for row in intervals:
+
+        for (column, cell) in row.items():
+
+            if(column.startswith("top_") and cell):
+
+                assert [pair.split(": ")[1] for pair in cell.split(",")] == ["0.0"] * len(cell.split(","))
+
+            else:
+
+                assert cell in ("0.0", "")
+
+def test_counts_have_intervals(table):
+
+    (exit_code, output, errors) = olap("--input", table, "--sample", "0.2", *SAMPLE_QUERY)
+    (header, rows, intervals) = read_result(output)
+
+    assert header == ["g", "count", "mean_y", "sum_y", "top_k"]
+
+    for row in intervals:
+
+        assert float(row['count']) > 0 and float(row['mean_y']) > 0 and float(row['sum_y']) > 0
+        assert all([float(pair.split(": ")[1]) > 0 for pair in row['top_k'].split(",")])
+
+@pytest.mark.parametrize("sample", [["--sample", "0.2"], ["--sample-rows", "2000"]])
+def test_true_values_fall_inside_the_intervals(tmp_path, sample):
+
+    # the records written by write_table() are in random order, so the intervals hold about 95% of the true values
+    inside = []
+
+    for seed in range(4):
+
+        file_name = str(tmp_path / "shuffled{}.csv".format(seed))
+        records = write_table(file_name, 10000, seed=seed)
+        (header, rows, intervals) = read_result(olap("--input", file_name, *sample, "--groupby", "g", "--count", "--mean", "y", "--sum", "y")[1])
+
+        for i in range(len(rows)):
+
+            values = [int(record[4]) for record in records if record[0] == rows[i][0]]
+            true_values = {'count': len(values), 'mean_y': statistics.mean(values), 'sum_y': sum(values)}
+
+            for column in true_values:
+
+                inside.append(abs(float(rows[i][header.index(column)]) - true_values[column]) <= float(intervals[i][column]))
+
+        (header, rows, intervals) = read_result(olap("--input", file_name, *sample, "--mean", "y")[1])
+
+        assert abs(float(rows[0][0]) - statistics.mean([int(record[4]) for record in records])) <= float(intervals[0]['mean_y'])
+
+    assert sum(inside) >= 0.85 * len(inside)
+
+def test_kept_sample_is_reused(table, tmp_path):
+
+    (exit_code, output, errors) = olap("--input", table, "--sample", "0.2", "--keep-sample", *SAMPLE_QUERY)
+
+    assert olap("--input", table, "--sample", "0.2", "--keep-sample", *SAMPLE_QUERY, "--stats", tmp_path / "stats.json") == (exit_code, output, errors)
+
+    with open(str(tmp_path / "stats.json"), 'r') as input_file:
+
+        assert json.load(input_file)['scans'][0]['source'] == 'kept sample'
+
+    # a different fraction draws a new sample
+    olap("--input", table, "--sample", "0.3", "--keep-sample", "--count", "--stats", tmp_path / "stats.json")
+
+    with open(str(tmp_path / "stats.json"), 'r') as input_file:
+
+        assert json.load(input_file)['scans'][0]['source'] == 'sample'
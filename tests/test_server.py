@@ -0,0 +1,111 @@
+import json
+import re
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from helpers import OLAP_FILE, olap, write_table
+
+@pytest.fixture
+def server(table):
+
+    """
+    Starts the query server on a free port with the table as the dataset t and a short reload interval.
+    Returns: a function sending one request to it, which returns the status and the JSON response
+    """
+
+    process = subprocess.Popen([sys.executable, OLAP_FILE, "serve", "t=" + table, "--port", "0", "--reload-interval", "0.1", "--no-cache"], stderr=subprocess.PIPE)
+
+    # the server prints the port it listens on once it accepts connections
+    for line in process.stderr:
+
+        match = re.match(r"Serving .* on http://[^:]+:(\d+)", line.decode("utf-8"))
+
+        if(match):
+
+            break
+
+    def request(path, query=None):
+
+        data = None if query == None else json.dumps(query).encode("utf-8")
+
+        try:
+
+            with urllib.request.urlopen("http://127.0.0.1:{}{}".format(match.group(1), path), data=data, timeout=30) as response:
+
+                return (response.status, json.load(response))
+
+        except urllib.error.HTTPError as error:
+
+            return (error.code, json.load(error))
+
+    yield request
+
+    process.terminate()
+    process.wait()
+
+def test_query_matches_the_command_line(server, table):
+
+    (status, response) = server("/query", {'dataset': "t", 'groupby': ["g", "k"], 'aggs': ["count", ["mean", "y"], ["max", "x"]], 'order_by': ["count", "desc"], 'limit': 5})
+    (exit_code, output, errors) = olap("--input", table, "--no-cache", "--groupby", "g", "k", "--count", "--mean", "y", "--max", "x", "--order-by", "count", "desc", "--limit", "5")
+
+    assert (status, exit_code) == (200, 0)
+    assert "\n".join([",".join(response['header'])] + [",".join([str(value) for value in row]) for row in response['rows']]) + "\n" == output
+    assert "\n".join(response['warnings']) + "\n" == errors
+
+    # the first dataset is queried when the query doesn't name one
+    (status, response) = server("/query", {'top': [3, "h"]})
+
+    assert (status, response['header'], response['rows']) == (200, ["top_h"], [[olap("--input", table, "--top", "3", "h")[1].splitlines()[1]]])
+
+@pytest.mark.parametrize(("query", "exit_code"), [
+    ({'dataset': "t", 'aggs': ["count"], 'output': "out.csv"}, 6),
+    ({'aggs': [["mean"]]}, 6),
+    ({'aggs': "count", 'groupby': 3}, 6),
+    ({'groupby': "g", 'aggs': ["count"], 'limit': "ten"}, 6),
+    ({'where': "y >>= 3", 'aggs': ["count"]}, 6),
+    ({'aggs': [["mean", "missing field"]]}, 8),
+])
+def test_bad_queries_return_400(server, query, exit_code):
+
+    # the exit code is the one the command line exits with for the same query
+    (status, response) = server("/query", query)
+
+    assert status == 400
+    assert response['exit_code'] == exit_code and response['error'].startswith("Error")
+
+def test_unknown_paths_and_datasets_return_404(server):
+
+    assert server("/nowhere")[0] == 404
+    assert server("/query/t", {'aggs': ["count"]})[0] == 404
+    assert server("/query", {'dataset': "missing", 'aggs': ["count"]})[0] == 404
+
+def test_stats_and_datasets(server):
+
+    server("/query", {'aggs': ["count"]})
+    server("/query", {'aggs': [["mean"]]})
+
+    assert server("/datasets") == (200, {'datasets': ["t"]})
+
+    (status, response) = server("/stats")
+    stats = response['datasets']['t']
+
+    assert status == 200 and response['rss_bytes'] > 0
+    assert (stats['rows'], stats['reloads'], stats['queries'], stats['failed_queries']) == (6000, 0, 2, 1)
+
+def test_dataset_reloads_when_the_file_changes(server, table):
+
+    assert server("/query", {'aggs': ["count"]})[1]['rows'] == [[6000]]
+
+    write_table(table, 500, seed=1)
+    deadline = time.time() + 30
+
+    while(server("/stats")[1]['datasets']['t']['reloads'] == 0 and time.time() < deadline):
+
+        time.sleep(0.1)
+
+    assert server("/query", {'aggs': ["count"]})[1]['rows'] == [[500]]
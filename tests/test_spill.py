@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from OLAP import Dataset
+
+from helpers import olap
+
+# Queries with more groups than the SPILL_CHECK_GROUPS new groups after which the memory of the groups is checked,
+# so a small limit spills them several times. The sketches are used with and without the limit, since the limit
+# needs them.
+
+SPILL_QUERIES = [
+    ["--groupby", "h", "g", "k", "--no-cap", "--count", "--sum", "y", "--mean", "x", "--min", "x", "--max", "y"],
+    ["--groupby", "x", "--no-cap", "--count", "--sum", "y", "--max", "y"],
+    ["--groupby", "h", "g", "--no-cap", "--median", "y", "--quantile", "0.9", "x", "--quantile-sketch", "50", "--count-distinct", "k", "--distinct-precision", "8"],
+    ["--groupby", "h", "g", "k", "--no-cap", "--count", "--where", "y > 10"],
+]
+
+@pytest.mark.parametrize("query", SPILL_QUERIES)
+def test_spilled_groups_match_groups_in_memory(table, tmp_path, query):
+
+    (exit_code, output, errors) = olap("--input", table, "--no-cache", "--memory-limit", "64K", "--stats", tmp_path / "stats.json", *query)
+
+    with open(str(tmp_path / "stats.json"), 'r') as input_file:
+
+        spilled_runs = json.load(input_file)['scans'][0]['spilled_runs']
+
+    assert min(spilled_runs.values()) > 1
+    assert (exit_code, output, errors) == olap("--input", table, "--no-cache", *query)
+
+def test_spilled_rows_of_the_api_match_groups_in_memory(table):
+
+    dataset = Dataset.open(table, load=False, use_cache=False)
+    query = {'aggs': ["count", ("mean", "x"), ("max", "y")], 'groupby': ["h", "g", "k"], 'no_cap': True}
+    spilled = dataset.query(memory_limit=65536, **query)
+    in_memory = dataset.query(**query)
+
+    assert (spilled.header, list(spilled.rows), spilled.warnings) == (in_memory.header, in_memory.rows, in_memory.warnings)
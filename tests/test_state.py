@@ -0,0 +1,87 @@
+import csv
+
+import pytest
+
+from helpers import QUERIES, olap, olap_sources, write_records, write_table
+
+HEADER_LINE = ["g", "k", "h", "x", "y", "note"]
+
+def append_records(file_name, records):
+
+    with open(file_name, 'a', newline='') as output_file:
+
+        csv.writer(output_file).writerows(records)
+
+def assert_state_matches_csv(file_name, state_file, stats_file, query, source='state'):
+
+    (exit_code, output, errors, sources) = olap_sources(stats_file, "--input", file_name, "--state", state_file, *query)
+
+    assert sources == [source]
+    assert (exit_code, output, errors) == olap("--input", file_name, "--no-cache", *query)
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_appended_records_match_csv(tmp_path, query):
+
+    file_name = str(tmp_path / "table.csv")
+    records = write_table(file_name, 6000)
+    write_records(file_name, HEADER_LINE, records[:3000])
+    (state_file, stats_file) = (str(tmp_path / "state.json"), str(tmp_path / "stats.json"))
+
+    assert_state_matches_csv(file_name, state_file, stats_file, query)
+
+    for (start, end) in ((3000, 3001), (3001, 4500), (4500, 6000)):
+
+        append_records(file_name, records[start:end])
+        assert_state_matches_csv(file_name, state_file, stats_file, query)
+
+def test_rewritten_records_are_read_again(tmp_path):
+
+    # the file is much larger than the 18 blocks of 64 KB an earlier sampled hash read, and the changed record
+    # lies between two of them. Its length stays the same, so the bytes after it don't move.
+    file_name = str(tmp_path / "table.csv")
+    records = write_table(file_name, 60000)
+    (state_file, stats_file) = (str(tmp_path / "state.json"), str(tmp_path / "stats.json"))
+    query = ["--groupby", "g", "--count", "--sum", "y"]
+
+    assert_state_matches_csv(file_name, state_file, stats_file, query)
+
+    records[2500][4] = records[2500][4][:-1] + str((int(records[2500][4][-1]) + 1) % 10)
+    write_records(file_name, HEADER_LINE, records)
+    assert_state_matches_csv(file_name, state_file, stats_file, query)
+
+    append_records(file_name, records[:10])
+    assert_state_matches_csv(file_name, state_file, stats_file, query)
+
+def test_truncated_file_is_read_again(tmp_path):
+
+    file_name = str(tmp_path / "table.csv")
+    records = write_table(file_name, 6000)
+    (state_file, stats_file) = (str(tmp_path / "state.json"), str(tmp_path / "stats.json"))
+    query = ["--groupby", "k", "--count", "--mean", "x"]
+
+    assert_state_matches_csv(file_name, state_file, stats_file, query)
+
+    write_records(file_name, HEADER_LINE, records[:2000])
+    assert_state_matches_csv(file_name, state_file, stats_file, query)
+
+def test_last_record_without_a_line_break_is_not_saved(tmp_path):
+
+    file_name = str(tmp_path / "table.csv")
+    records = write_table(file_name, 3000)
+    (state_file, stats_file) = (str(tmp_path / "state.json"), str(tmp_path / "stats.json"))
+    query = ["--groupby", "g", "--count", "--sum", "y"]
+
+    assert_state_matches_csv(file_name, state_file, stats_file, query)
+
+    # the last record is still being written: first its start, then the rest of it and its line break
+    with open(file_name, 'a', newline='') as output_file:
+
+        output_file.write("a,north,h1,1.5,4")
+
+    assert_state_matches_csv(file_name, state_file, stats_file, query)
+
+    with open(file_name, 'a', newline='') as output_file:
+
+        output_file.write("2\r\n")
+
+    assert_state_matches_csv(file_name, state_file, stats_file, query)
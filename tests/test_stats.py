@@ -0,0 +1,60 @@
+import json
+import os
+
+from helpers import olap
+
+def read_stats(file_name):
+
+    with open(file_name, 'r') as input_file:
+
+        return json.load(input_file)
+
+def test_stats_file_holds_every_phase_and_scan(table, tmp_path):
+
+    (exit_code, output, errors) = olap("--input", table, "--no-cache", "--groupby", "g", "k", "--mean", "x", "--sum", "y", "--stats", tmp_path / "stats.json")
+    stats = read_stats(str(tmp_path / "stats.json"))
+
+    assert exit_code == 0
+    assert [phase['phase'] for phase in stats['phases']] == ["open", "check", "scan", "aggregate", "print"]
+
+    for phase in stats['phases']:
+
+        assert phase['wall_time'] >= 0 and phase['cpu_time'] >= 0
+
+    assert stats['total']['wall_time'] == sum([phase['wall_time'] for phase in stats['phases']])
+    assert stats['peak_memory'] > 0
+
+    # x holds the empty and non-numeric values written by write_table(), which are also reported on stderr
+    [scan] = stats['scans']
+    non_numeric_lines = [line for line in errors.splitlines() if "can't compute mean or sum" in line]
+
+    assert (scan['source'], scan['rows'], scan['bytes']) == ('csv', 6000, os.path.getsize(table))
+    assert scan['groups'] == {'g, k': 20}
+    assert scan['non_numeric'] == {'x': len(non_numeric_lines), 'y': 0}
+    assert scan['rows_per_sec'] > 0 and scan['bytes_per_sec'] > 0
+
+def test_cpu_time_is_not_counted_in_clock_ticks(tmp_path):
+
+    # os.times() counts in ticks of 10 ms, which made the short phases of a small query take 0 or 0.01 s
+    file_name = str(tmp_path / "small.csv")
+
+    with open(file_name, 'w') as output_file:
+
+        output_file.write("g,v\na,1\nb,2\n")
+
+    olap("--input", file_name, "--groupby", "g", "--sum", "v", "--stats", tmp_path / "stats.json")
+    cpu_times = [phase['cpu_time'] for phase in read_stats(str(tmp_path / "stats.json"))['phases']]
+
+    assert any([abs(cpu_time - round(cpu_time, 2)) > 1e-6 for cpu_time in cpu_times])
+
+def test_stats_of_workers_and_cache(table, tmp_path):
+
+    olap("--input", table, "--workers", 3, "--no-cache", "--count", "--stats", tmp_path / "workers.json")
+    olap("--input", table, "--cache", "--count")
+    olap("--input", table, "--top", "3", "h", "--stats", tmp_path / "cache.json")
+
+    workers_scan = read_stats(str(tmp_path / "workers.json"))['scans'][0]
+    cache_scan = read_stats(str(tmp_path / "cache.json"))['scans'][0]
+
+    assert (workers_scan['source'], workers_scan['rows'], workers_scan['bytes']) == ('workers', 6000, os.path.getsize(table))
+    assert (cache_scan['source'], cache_scan['rows'], cache_scan['bytes']) == ('cache', 6000, None)
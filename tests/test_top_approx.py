@@ -0,0 +1,65 @@
+import collections
+import re
+
+import pytest
+
+from helpers import olap, write_skewed_table
+
+@pytest.fixture(scope="module")
+def skewed(tmp_path_factory):
+
+    file_name = str(tmp_path_factory.mktemp("skewed") / "skewed.csv")
+
+    return (file_name, write_skewed_table(file_name, 40000))
+
+def read_bounds(output):
+
+    """
+    Returns the (value, count, lower bound) of every value of a --top-approx result
+    """
+
+    bounds = []
+
+    for pair in output.splitlines()[1].strip('"').split(","):
+
+        match = re.match(r"(.*): (\d+)(?: \(at least (\d+)\))?$", pair)
+        bounds.append((match.group(1), int(match.group(2)), int(match.group(3) or match.group(2))))
+
+    return bounds
+
+# the sketch keeps at most 2 * CAPACITY of the values of z and u, so the counts of most of the values it prints are
+# only bounded; the filter and the workers merge the sketches of several parts of the file
+
+@pytest.mark.parametrize("capacity", [5, 10, 50])
+@pytest.mark.parametrize(("arguments", "group"), [([], None), (["--where", "g = g03"], "g03"), (["--workers", "3", "--no-cache"], None)])
+def test_bounds_hold_the_exact_counts(skewed, capacity, arguments, group):
+
+    (file_name, records) = skewed
+
+    for (field, index) in (("z", 2), ("u", 1)):
+
+        counts = collections.Counter([record[index] for record in records if group in (None, record[0])])
+        (exit_code, output, errors) = olap("--input", file_name, "--top", "12", field, "--top-approx", capacity, *arguments)
+        bounds = read_bounds(output)
+
+        assert exit_code == 0
+
+        for (value, count, lower) in bounds:
+
+            assert lower <= counts[value] <= count
+
+        # a value in more than one of every capacity records can never be dropped from the sketch
+        total = sum(counts.values())
+        heavy_hitters = [value for value in counts if counts[value] > total / capacity]
+
+        assert set(heavy_hitters) <= set([value for (value, count, lower) in bounds])
+
+def test_few_values_are_counted_exactly(skewed):
+
+    (file_name, records) = skewed
+
+    for arguments in ([], ["--where", "g = g03"], ["--workers", "3", "--no-cache"]):
+
+        exact = olap("--input", file_name, "--top", "5", "g", *arguments)[1]
+
+        assert olap("--input", file_name, "--top", "5", "g", "--top-approx", "20", *arguments)[1] == exact.replace("top_g", "top_g_approx")
@@ -0,0 +1,109 @@
+import csv
+
+import pytest
+
+from OLAP import Dataset, OLAPError, WhereParser
+
+from helpers import olap
+
+def number(text):
+
+    try:
+
+        return float(text)
+
+    except ValueError:
+
+        return None
+
+def compare(text, check):
+
+    # records whose value is not numeric match no numeric comparison
+    return number(text) != None and check(number(text))
+
+# Every filter with the same filter written as a Python function of the record
+
+FILTERS = [
+    ("g = a", lambda r: r['g'] == "a"),
+    ("g != a", lambda r: r['g'] != "a"),
+    ("G = a", lambda r: r['g'] == "a"),
+    ("g = A", lambda r: False),
+    ("g IN (a, b, c)", lambda r: r['g'] in ("a", "b", "c")),
+    ("NOT g IN (a, b)", lambda r: r['g'] not in ("a", "b")),
+    ("h in (h1, 'h2', \"h3\") and y != 5", lambda r: r['h'] in ("h1", "h2", "h3") and r['y'] != "5"),
+    ("y >= 10 AND y < 50", lambda r: compare(r['y'], lambda y: 10 <= y < 50)),
+    ("x > 12.5 OR g = 'e'", lambda r: compare(r['x'], lambda x: x > 12.5) or r['g'] == "e"),
+    ("x < 0 OR x >= 0", lambda r: number(r['x']) != None),
+    ("NOT (x <= 10)", lambda r: not compare(r['x'], lambda x: x <= 10)),
+    ("g = a OR g = b AND k = north", lambda r: r['g'] == "a" or (r['g'] == "b" and r['k'] == "north")),
+    ("(g = a OR g = b) AND k = north", lambda r: r['g'] in ("a", "b") and r['k'] == "north"),
+    ("NOT NOT g = c", lambda r: r['g'] == "c"),
+    ("NOT g = a AND NOT k = east", lambda r: r['g'] != "a" and r['k'] != "east"),
+    ("note = 'has, comma'", lambda r: r['note'] == "has, comma"),
+    ("note = 'has \"quote\"'", lambda r: r['note'] == "has \"quote\""),
+    ("note = \"has \"\"quote\"\"\"", lambda r: r['note'] == "has \"quote\""),
+    ("y > -5 AND y <= 1e1", lambda r: compare(r['y'], lambda y: -5 < y <= 10)),
+]
+
+def read_records(file_name):
+
+    with open(file_name, 'r', newline='') as input_file:
+
+        return list(csv.DictReader(input_file))
+
+@pytest.mark.parametrize(("where", "matches"), FILTERS)
+def test_filter_matches_its_records(table, where, matches):
+
+    records = [record for record in read_records(table) if matches(record)]
+    result = Dataset.open(table, load=False, use_cache=False).query(aggs=["count", ("sum", "y")], where=where)
+
+    # the sum of no records is not a number
+    total = float(sum([int(record['y']) for record in records])) if records else "NaN"
+
+    assert result.rows == [[len(records), total]]
+
+@pytest.mark.parametrize(("where", "matches"), FILTERS)
+def test_loaded_columns_match_csv(table, where, matches):
+
+    query = {'aggs': ["count", ("mean", "x")], 'groupby': "g", 'where': where}
+    columns_result = Dataset.open(table).query(**query)
+    csv_result = Dataset.open(table, load=False, use_cache=False).query(**query)
+
+    assert (columns_result.rows, columns_result.warnings) == (csv_result.rows, csv_result.warnings)
+
+def test_fields_with_spaces_and_quotes(students):
+
+    where = "'race/ethnicity' = 'group B' AND \"math score\" >= 90 OR 'parental level of education' = 'bachelor''s degree'"
+    records = [record for record in read_records(students) if (record['race/ethnicity'] == "group B" and float(record['math score']) >= 90)
+               or record['parental level of education'] == "bachelor's degree"]
+
+    assert olap("--input", students, "--count", "--where", where)[1] == "count\n{}\n".format(len(records))
+
+def test_and_binds_tighter_than_or(table):
+
+    header_line = Dataset.open(table, load=False).header_line
+
+    assert WhereParser("g = a OR g = b AND NOT k IN (north, 'south')", header_line, None).parse() == \
+           ('or', [('=', 'g', 'a'), ('and', [('=', 'g', 'b'), ('not', ('in', 'k', ['north', 'south']))])])
+    assert WhereParser("(g = a OR g = b) AND y < 3", header_line, None).parse() == ('and', [('or', [('=', 'g', 'a'), ('=', 'g', 'b')]), ('<', 'y', 3.0)])
+
+@pytest.mark.parametrize(("where", "exit_code"), [
+    ("g =", 6),
+    ("g = a AND", 6),
+    ("(g = a", 6),
+    ("g = a)", 6),
+    ("g IN ()", 6),
+    ("g IN (a b)", 6),
+    ("g a", 6),
+    ("y > ten", 6),
+    ("'g = a", 6),
+    ("nope = a", 8),
+])
+def test_invalid_filter_is_an_error(table, where, exit_code):
+
+    with pytest.raises(OLAPError) as error:
+
+        Dataset.open(table, load=False).query(aggs=["count"], where=where)
+
+    assert error.value.exit_code == exit_code
+    assert olap("--input", table, "--count", "--where", where)[0] == exit_code
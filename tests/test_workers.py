@@ -0,0 +1,38 @@
+import pytest
+
+from helpers import QUERIES, olap, olap_sources, write_table
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_workers_match_one_process(table, query):
+
+    expected = olap("--input", table, "--no-cache", *query)
+
+    assert expected[0] == 0
+
+    for workers in (2, 7, 16):
+
+        assert olap("--input", table, "--no-cache", "--workers", workers, *query) == expected
+
+def test_workers_read_the_file_in_processes(table, tmp_path):
+
+    (exit_code, output, errors, sources) = olap_sources(str(tmp_path / "stats.json"), "--input", table, "--no-cache", "--workers", 4, "--count")
+
+    assert (exit_code, sources) == (0, ['workers'])
+
+def test_quoted_line_breaks_fall_back_to_one_process(tmp_path):
+
+    # chunks split at raw line breaks would start inside the quoted notes, so the file is read in one process
+    file_name = str(tmp_path / "notes.csv")
+    write_table(file_name, 3000, line_breaks=True)
+    query = ["--groupby", "g", "--count", "--sum", "y", "--top", "3", "note"]
+    expected = olap("--input", file_name, "--no-cache", *query)
+
+    assert expected[0] == 0
+
+    for workers in (2, 7, 13, 16):
+
+        assert olap("--input", file_name, "--no-cache", "--workers", workers, *query) == expected
+
+    (exit_code, output, errors, sources) = olap_sources(str(tmp_path / "stats.json"), "--input", file_name, "--no-cache", "--workers", 7, *query)
+
+    assert sources == ['csv']